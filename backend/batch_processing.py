@@ -0,0 +1,111 @@
+"""
+Batch Processing — a project's drawings in one request.
+
+A project is dozens of drawings (floors, blocks, services). /batch takes
+them as several files, one or more ZIP archives, or both:
+
+1. ZIP archives are expanded member by member through the regular
+   upload ingest (hashed, size-limited on the bytes actually inflated),
+   keeping only .dwg/.dxf members.
+2. Every DWG that needs converting is submitted to the ODA batcher at
+   once, so they are converted in as few ODA runs as possible.
+3. Drawings are parsed on the CPU pool in parallel; the per-drawing
+   results are reported as each one finishes.
+4. The parsed quantities of all drawings are summed into one project
+   raw_data, priced by generate_boq like any single drawing.
+"""
+
+import os
+import zipfile
+
+from upload_ingest import UPLOAD_DIR, UPLOAD_MAX_BYTES, ingest_file
+
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_MB", "4096")) * 1024 * 1024
+
+DRAWING_EXTENSIONS = (".dwg", ".dxf")
+
+# Per-drawing details that don't add up across drawings
+_PER_DRAWING_KEYS = {"rooms", "outside_rooms", "lines"}
+
+
+class BatchTooLargeError(Exception):
+    """Raised when a batch has more drawings or bytes than allowed."""
+
+
+def is_zip(head: bytes) -> bool:
+    return head.startswith(b"PK\x03\x04")
+
+
+def expand_zip(path: str, budget: int) -> list:
+    """
+    Ingest the drawings inside a ZIP archive.
+
+    Args:
+        path: the archive on disk
+        budget: bytes the expanded drawings may take in total
+
+    Returns:
+        list of (member name, IngestedUpload)
+
+    Raises:
+        BatchTooLargeError: more than BATCH_MAX_FILES drawings or `budget` bytes
+        zipfile.BadZipFile: not a readable archive
+    """
+    drawings = []
+    try:
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                name = member.filename
+                base = os.path.basename(name)
+                if member.is_dir() or base.startswith(".") or "__MACOSX/" in name:
+                    continue
+                if not base.lower().endswith(DRAWING_EXTENSIONS):
+                    continue
+                if len(drawings) >= BATCH_MAX_FILES:
+                    raise BatchTooLargeError(f"A batch may contain at most {BATCH_MAX_FILES} drawings.")
+
+                with archive.open(member) as src:
+                    upload = ingest_file(src, UPLOAD_DIR, min(UPLOAD_MAX_BYTES, budget))
+                budget -= upload.size
+                drawings.append((name, upload))
+    except BaseException:
+        for _, upload in drawings:
+            upload.discard()
+        raise
+    return drawings
+
+
+# ── Aggregation ──────────────────────────────
+
+def _add(total: dict, part: dict) -> None:
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _add(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+
+
+def _round(values: dict) -> dict:
+    return {
+        key: _round(value) if isinstance(value, dict) else round(value, 2) if isinstance(value, float) else value
+        for key, value in values.items()
+    }
+
+
+def aggregate_quantities(raws: list) -> dict:
+    """
+    Project-level raw_data: every drawing's quantities, breakdown and wall
+    figures summed. Room results stay per drawing.
+    """
+    total = {}
+    weighted_thickness = 0.0
+    for raw in raws:
+        _add(total, {key: value for key, value in raw.items() if key not in _PER_DRAWING_KEYS})
+        weighted_thickness += raw.get("wall_thickness", 0) * raw.get("wall_centerline_length", 0)
+
+    total = _round(total)
+    # A length-weighted mean, like detect_walls reports per drawing
+    length = total.get("wall_centerline_length", 0)
+    total["wall_thickness"] = round(weighted_thickness / length, 3) if length else 0.0
+    return total
@@ -0,0 +1,186 @@
+"""
+Parser benchmark — times quantity extraction on a synthetic drawing.
+
+Usage:
+    python bench_parser.py [entity_count] [repeats]
+
+Compares the single-pass dispatcher (cad_parser.parse_modelspace) against
+the previous implementation, which ran one msp.query() scan per entity type.
+The legacy parser neither deduplicates lines nor detects walls, so that
+comparison runs with both passes off; what they, and the
+per-layer/linetype/color breakdown, add to a parse is reported separately.
+The drawing is then written to disk and parsed from the file by the
+streaming reader and by the parallel parser (PARALLEL_PARSE_WORKERS).
+"""
+
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import ezdxf
+
+import cad_parser
+import wall_detection
+from block_classifier import DEFAULT_PATTERNS
+from cad_parser import parse_dxf, parse_modelspace
+from parallel_parse import PARALLEL_PARSE_WORKERS
+
+BLOCK_NAMES = ["DOOR-900", "WIN-1200", "COL-300", "CHAIR-01", "LIGHT-FIX", "SOCKET"]
+
+# Entities cycle through these, with a few explicit linetypes and colors
+LAYERS = ["0", "A-WALL", "A-DOOR", "E-LIGHTING", "E-POWER", "DIMS", "TITLE", "DEFPOINTS"]
+
+
+def _match_block_type(block_name: str, patterns: list) -> bool:
+    name_lower = block_name.lower()
+    return any(p in name_lower for p in patterns)
+
+
+def build_document(entity_count: int):
+    """Create an in-memory drawing with a realistic mix of entity types."""
+    rng = random.Random(42)
+    doc = ezdxf.new("R2018")
+    msp = doc.modelspace()
+    for name in BLOCK_NAMES:
+        doc.blocks.new(name).add_line((0, 0), (1, 0))
+
+    for i in range(entity_count):
+        x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+        kind = i % 10
+        attribs = {"layer": LAYERS[i % len(LAYERS)]}
+        if i % 7 == 0:
+            attribs["color"] = i % 5 + 1
+        if i % 11 == 0:
+            attribs["linetype"] = "DASHED"
+        if kind < 5:
+            msp.add_line((x, y), (x + rng.uniform(-5, 5), y + rng.uniform(-5, 5)), dxfattribs=attribs)
+        elif kind == 5:
+            msp.add_circle((x, y), rng.uniform(0.1, 2), dxfattribs=attribs)
+        elif kind == 6:
+            msp.add_arc((x, y), rng.uniform(0.1, 2), rng.uniform(0, 360), rng.uniform(0, 360),
+                        dxfattribs=attribs)
+        elif kind in (7, 8):
+            points = [(x + rng.uniform(0, 10), y + rng.uniform(0, 10)) for _ in range(6)]
+            msp.add_lwpolyline(points, close=(kind == 7), dxfattribs=attribs)
+        else:
+            msp.add_blockref(rng.choice(BLOCK_NAMES), (x, y), dxfattribs=attribs)
+    return doc
+
+
+def legacy_parse_modelspace(msp) -> dict:
+    """The pre-dispatcher implementation: one full modelspace scan per type."""
+    result = {
+        "total_line_length": 0.0, "circle_count": 0, "circle_total_circumference": 0.0,
+        "arc_count": 0, "arc_total_length": 0.0, "polyline_count": 0,
+        "polyline_total_length": 0.0, "closed_polyline_area": 0.0, "door_count": 0,
+        "window_count": 0, "column_count": 0, "furniture_count": 0,
+        "other_block_count": 0, "lines": [],
+    }
+    for e in msp.query("LINE"):
+        x1, y1 = e.dxf.start.x, e.dxf.start.y
+        x2, y2 = e.dxf.end.x, e.dxf.end.y
+        result["total_line_length"] += math.dist((x1, y1), (x2, y2))
+        result["lines"].append({"x1": x1, "y1": y1, "x2": x2, "y2": y2})
+    for e in msp.query("CIRCLE"):
+        result["circle_count"] += 1
+        result["circle_total_circumference"] += 2 * math.pi * e.dxf.radius
+    for e in msp.query("ARC"):
+        angle = math.radians(e.dxf.end_angle) - math.radians(e.dxf.start_angle)
+        if angle < 0:
+            angle += 2 * math.pi
+        result["arc_count"] += 1
+        result["arc_total_length"] += e.dxf.radius * angle
+    for e in msp.query("LWPOLYLINE"):
+        points = list(e.get_points(format="xy"))
+        if len(points) < 2:
+            continue
+        perimeter = sum(math.dist(points[i], points[i + 1]) for i in range(len(points) - 1))
+        if e.closed:
+            perimeter += math.dist(points[-1], points[0])
+        result["polyline_count"] += 1
+        result["polyline_total_length"] += perimeter
+        if e.closed and len(points) >= 3:
+            n = len(points)
+            area = sum(points[i][0] * points[(i + 1) % n][1] - points[(i + 1) % n][0] * points[i][1]
+                       for i in range(n))
+            result["closed_polyline_area"] += abs(area) / 2.0
+    for e in msp.query("INSERT"):
+        name = e.dxf.name
+        if _match_block_type(name, DEFAULT_PATTERNS["door"]):
+            result["door_count"] += 1
+        elif _match_block_type(name, DEFAULT_PATTERNS["window"]):
+            result["window_count"] += 1
+        elif _match_block_type(name, DEFAULT_PATTERNS["column"]):
+            result["column_count"] += 1
+        elif _match_block_type(name, DEFAULT_PATTERNS["furniture"]):
+            result["furniture_count"] += 1
+        else:
+            result["other_block_count"] += 1
+    for key in ("total_line_length", "circle_total_circumference", "arc_total_length",
+                "polyline_total_length", "closed_polyline_area"):
+        result[key] = round(result[key], 2)
+    return result
+
+
+@contextmanager
+def without_dedup_and_walls():
+    """Turn off the passes the legacy parser doesn't have (as DEDUP_TOLERANCE=0 WALL_LAYERS= would)."""
+    tolerance, layers = cad_parser.DEDUP_TOLERANCE, wall_detection.WALL_LAYERS
+    cad_parser.DEDUP_TOLERANCE, wall_detection.WALL_LAYERS = 0, []
+    try:
+        yield
+    finally:
+        cad_parser.DEDUP_TOLERANCE, wall_detection.WALL_LAYERS = tolerance, layers
+
+
+def best_of(func, arg, repeats: int):
+    best, value = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        value = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+
+def main():
+    entity_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print(f"Building synthetic drawing with {entity_count:,} entities...")
+    doc = build_document(entity_count)
+    msp = doc.modelspace()
+
+    legacy_time, legacy = best_of(legacy_parse_modelspace, msp, repeats)
+    with without_dedup_and_walls():
+        current_time, current = best_of(parse_modelspace, msp, repeats)
+        totals_only_time, _ = best_of(lambda m: parse_modelspace(m, breakdown=False), msp, repeats)
+    full_time, _ = best_of(parse_modelspace, msp, repeats)
+
+    legacy.pop("lines", None)
+    current = {k: current[k] for k in legacy}
+    print(f"legacy (one query per type): {legacy_time * 1000:9.1f} ms")
+    print(f"single-pass dispatcher:      {current_time * 1000:9.1f} ms  (no dedup, no walls)")
+    print(f"speedup:                     {legacy_time / current_time:9.2f}x")
+    print(f"without breakdown:           {totals_only_time * 1000:9.1f} ms")
+    print(f"breakdown overhead:          {(current_time / totals_only_time - 1) * 100:9.1f} %")
+    print(f"with dedup and walls:        {full_time * 1000:9.1f} ms")
+    print(f"dedup + walls overhead:      {(full_time / current_time - 1) * 100:9.1f} %")
+    print("results match:", legacy == current)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.dxf")
+        doc.saveas(path)
+        streaming_time, streaming = best_of(lambda p: parse_dxf(p, streaming=True, parallel=False), path, repeats)
+        parallel_time, parallel = best_of(lambda p: parse_dxf(p, parallel=True), path, repeats)
+    print(f"streaming reader (file):     {streaming_time * 1000:9.1f} ms")
+    print(f"parallel, {PARALLEL_PARSE_WORKERS:2d} workers:        {parallel_time * 1000:9.1f} ms")
+    print(f"parallel speedup:            {streaming_time / parallel_time:9.2f}x")
+    print("parallel results match:", streaming == parallel)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Block Classifier — maps block names to BOQ categories (door, window, ...).
+
+All category patterns are compiled into one regular expression and every
+distinct block name is classified only once; drawings repeat a few hundred
+names across thousands of INSERTs, so nearly every lookup is a dict hit.
+
+Project-specific pattern sets can be supplied as a JSON file (see
+BLOCK_PATTERNS_FILE) mapping category -> list of substrings, in priority
+order. A name matching several categories gets the first one listed.
+
+Per-category counts (boq_block_classifications_total) and regex
+evaluations (boq_block_regex_evaluations_total) are recorded in metrics,
+so classifications made in parse workers show up in /metrics.
+"""
+
+import json
+import os
+import re
+import threading
+
+import metrics
+
+BLOCK_PATTERNS_FILE = os.getenv("BLOCK_PATTERNS_FILE", "")
+
+# Category for names that match no pattern
+OTHER = "other"
+
+# Common block name patterns for identification, highest priority first
+DEFAULT_PATTERNS = {
+    "door": ["door", "dr", "d-", "entrance", "gate"],
+    "window": ["window", "win", "w-", "wd"],
+    "column": ["column", "col", "pillar", "pier"],
+    "furniture": ["furniture", "furn", "chair", "table", "desk", "bed", "sofa", "cabinet"],
+}
+
+# Distinct names remembered before the memo is reset (guards odd drawings
+# with generated, ever-changing block names)
+MAX_CACHED_NAMES = 65536
+
+
+def count_key(category: str) -> str:
+    """Result-dictionary key holding the INSERT count of a category."""
+    return "other_block_count" if category == OTHER else f"{category}_count"
+
+
+def load_patterns(path: str) -> dict:
+    """Load a {category: [patterns]} JSON file, preserving category order."""
+    with open(path, "r", encoding="utf-8") as f:
+        patterns = json.load(f)
+    if not isinstance(patterns, dict) or not all(isinstance(v, list) for v in patterns.values()):
+        raise ValueError(f"{path}: expected an object of category -> list of patterns")
+    return patterns
+
+
+class BlockClassifier:
+    """Single-regex, memoized block-name classifier."""
+
+    def __init__(self, patterns: dict):
+        self.categories = list(patterns)
+
+        # One zero-width lookahead per position: at each offset the first
+        # alternative that matches wins, i.e. the highest-priority category
+        # starting there. Lookaheads also catch overlapping matches.
+        groups = []
+        for i, category in enumerate(self.categories):
+            alternatives = sorted({p.lower() for p in patterns[category] if p}, key=len, reverse=True)
+            if alternatives:
+                groups.append(f"(?P<c{i}>{'|'.join(re.escape(p) for p in alternatives)})")
+        self._regex = re.compile(f"(?=(?:{'|'.join(groups)}))") if groups else None
+
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _match(self, name: str) -> str:
+        if self._regex is None:
+            return OTHER
+        best = None
+        for m in self._regex.finditer(name.lower()):
+            index = int(m.lastgroup[1:])
+            if best is None or index < best:
+                best = index
+                if best == 0:
+                    break
+        return self.categories[best] if best is not None else OTHER
+
+    def classify(self, name: str, copies: int = 1) -> str:
+        """Return the category of a block name, counting `copies` inserts of it."""
+        category = self._cache.get(name)
+        if category is None:
+            category = self._match(name)
+            with self._lock:
+                if len(self._cache) >= MAX_CACHED_NAMES:
+                    self._cache.clear()
+                self._cache[name] = category
+            metrics.inc("boq_block_regex_evaluations_total")
+        metrics.inc("boq_block_classifications_total", copies, category=category)
+        return category
+
+
+classifier = BlockClassifier(load_patterns(BLOCK_PATTERNS_FILE) if BLOCK_PATTERNS_FILE else DEFAULT_PATTERNS)
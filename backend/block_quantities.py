@@ -0,0 +1,167 @@
+"""
+Block Quantities — takeoff of the geometry inside block definitions.
+
+An INSERT places a copy of a block definition, which may itself contain
+lines, arcs, polylines and further INSERTs. Each definition is evaluated
+once and memoized by name; every reference then contributes those totals
+scaled by its insert scale and multiplied by its MINSERT grid size.
+"""
+
+import math
+
+from ezdxf.entities import factory
+from ezdxf.entities.subentity import entity_linker
+from ezdxf.filemanagement import dxf_file_info
+from ezdxf.lldxf.extendedtags import ExtendedTags
+from ezdxf.lldxf.tagger import ascii_tags_loader, tag_compiler
+
+# Totals that scale with the insert's linear scale factor
+LENGTH_KEYS = (
+    "total_line_length",
+    "circle_total_circumference",
+    "arc_total_length",
+    "polyline_total_length",
+    "spline_total_length",
+    "ellipse_total_length",
+)
+
+# Totals that scale with the insert's area scale factor
+AREA_KEYS = ("closed_polyline_area", "hatch_area")
+
+
+def insert_scales(e) -> tuple:
+    """
+    Return (copies, linear_scale, area_scale) for an INSERT or MINSERT.
+
+    Non-uniform scaling distorts lengths depending on direction; the
+    geometric mean of |xscale| and |yscale| is used as the linear factor,
+    which is exact for the usual uniform (or mirrored) case.
+    """
+    dxf = e.dxf
+    copies = max(dxf.row_count, 1) * max(dxf.column_count, 1)
+    area_scale = abs(dxf.xscale * dxf.yscale)
+    return copies, math.sqrt(area_scale), area_scale
+
+
+def scale_totals(totals: dict, copies: int, linear_scale: float, area_scale: float) -> dict:
+    """Scale a block's totals for `copies` references at the given scale."""
+    scaled = {}
+    for key, value in totals.items():
+        if key in LENGTH_KEYS:
+            scaled[key] = value * linear_scale * copies
+        elif key in AREA_KEYS:
+            scaled[key] = value * area_scale * copies
+        else:
+            scaled[key] = value * copies
+    return scaled
+
+
+class BlockQuantityEngine:
+    """
+    Memoized per-block quantity totals.
+
+    Args:
+        block_source: mapping-like object with .get(name) returning an
+            iterable of the block's entities (ezdxf's doc.blocks, or the dict
+            returned by load_block_definitions), or None if undefined
+        evaluate: callable(entities, engine) -> unscaled totals dict; it is
+            handed this engine so nested INSERTs resolve through the same memo
+    """
+
+    def __init__(self, block_source, evaluate):
+        self.block_source = block_source
+        self.evaluate = evaluate
+        self._memo = {}
+        self._in_progress = set()
+
+    def __len__(self) -> int:
+        """Number of block definitions evaluated so far."""
+        return len(self._memo)
+
+    def totals(self, name: str):
+        """Return the unscaled totals of one copy of a block, or None if undefined."""
+        if name in self._memo:
+            return self._memo[name]
+        if name in self._in_progress:
+            # Self-referencing block — a malformed drawing, contribute nothing
+            return None
+
+        block = self.block_source.get(name)
+        if block is None:
+            self._memo[name] = None
+            return None
+
+        self._in_progress.add(name)
+        try:
+            totals = self.evaluate(block, self)
+        finally:
+            self._in_progress.discard(name)
+        self._memo[name] = totals
+        return totals
+
+    def resolved(self) -> dict:
+        """Every definition evaluated so far: name -> totals (None if undefined)."""
+        return dict(self._memo)
+
+    def preload(self, resolved: dict) -> None:
+        """Adopt totals evaluated by another engine, e.g. in another process."""
+        self._memo.update(resolved)
+
+
+def load_block_definitions(path: str, types) -> dict:
+    """
+    Read only the BLOCKS section of an ASCII DXF.
+
+    Used by the streaming parser, which never loads a full document. The
+    file is scanned tag by tag and stops at the end of the BLOCKS section;
+    only entities of the given types inside block definitions are kept.
+
+    Returns:
+        dict of block name -> list of entities
+    """
+    encoding = dxf_file_info(path).encoding
+    wanted = set(types)
+    if "POLYLINE" in wanted:
+        # Vertices are separate entities, linked to their POLYLINE on load
+        wanted |= {"VERTEX", "SEQEND"}
+
+    blocks = {}
+    in_blocks = False
+    prev_code, prev_value = -1, ""
+    current = None
+    tags = []
+    linked_entity = entity_linker()
+
+    def flush():
+        if current is not None and tags and tags[0].value in wanted:
+            entity = factory.load(ExtendedTags(tags))
+            if not linked_entity(entity):
+                current.append(entity)
+
+    with open(path, "rt", encoding=encoding, errors="surrogateescape") as fp:
+        for tag in tag_compiler(ascii_tags_loader(fp)):
+            code, value = tag.code, tag.value
+            if not in_blocks:
+                if code == 2 and prev_code == 0 and prev_value == "SECTION":
+                    in_blocks = value == "BLOCKS"
+                prev_code, prev_value = code, value
+                continue
+
+            if code != 0:
+                tags.append(tag)
+                continue
+
+            # A group code 0 ends the previous entity
+            if tags and tags[0].value == "BLOCK":
+                name = next((t.value for t in tags if t.code == 2), None)
+                current = blocks.setdefault(name, []) if name else None
+            else:
+                flush()
+            tags = [tag]
+
+            if value == "ENDBLK":
+                current = None
+            elif value == "ENDSEC":
+                break
+
+    return blocks
@@ -4,35 +4,91 @@ BOQ Engine — generates a Bill of Quantities with auto-estimated rates.
 Takes the raw parsed CAD data and produces a multi-item BOQ
 with quantities, rates from rate_database, and calculated totals.
 Only items with quantity > 0 are included.
+
+When the parse result carries a per-layer breakdown and a layer map is
+configured (see layer_routing), each layer's quantities are routed to
+components individually instead of pricing the drawing-wide totals.
 """
 
-from rate_database import RATE_TABLE
+from layer_routing import LayerMap, layer_map as default_layer_map
+from rate_database import get_all_rates
+
+# Map rate_database keys to the raw data key they are priced from, in BOQ order;
+# a component listed more than once is priced from the sum of its keys
+BOQ_ITEMS = [
+    ("wall_conduits",       "total_line_length"),
+    ("polyline_perimeter",  "polyline_total_length"),
+    ("floor_area",          "closed_polyline_area"),
+    ("floor_finishes",      "hatch_area"),
+    ("circular_elements",   "circle_count"),
+    ("arc_elements",        "arc_total_length"),
+    ("arc_elements",        "spline_total_length"),
+    ("arc_elements",        "ellipse_total_length"),
+    ("doors",               "door_count"),
+    ("windows",             "window_count"),
+    ("columns",             "column_count"),
+    ("furniture",           "furniture_count"),
+    ("wall_masonry",        "wall_volume"),
+]
+
+# Quantities measured across the whole drawing, with no per-layer split;
+# layer routing leaves them as they are
+UNLAYERED_KEYS = ("wall_volume",)
+
+_DEFAULT_ROUTES = {raw_key: component for component, raw_key in BOQ_ITEMS}
+
+
+def component_quantities(raw: dict, layer_map: LayerMap = None) -> dict:
+    """
+    Quantity per rate component key, in BOQ order.
+
+    Without a layer map (or a breakdown to apply it to) this is the
+    drawing-wide totals; otherwise each layer's quantities are summed into
+    the components its rule routes them to.
+    """
+    layers = raw.get("breakdown", {}).get("layer")
+    routed = bool(layer_map) and layers is not None
 
+    quantities = {}
+    for component, raw_key in BOQ_ITEMS:
+        value = raw.get(raw_key, 0) if not routed or raw_key in UNLAYERED_KEYS else 0
+        quantities[component] = quantities.get(component, 0) + value
+    if not routed:
+        return quantities
 
-def generate_boq(raw: dict) -> list:
+    for layer, totals in layers.items():
+        for raw_key, value in totals.items():
+            component = layer_map.route(layer, raw_key, _DEFAULT_ROUTES.get(raw_key))
+            if component is not None:
+                quantities[component] = quantities.get(component, 0) + value
+    return quantities
+
+
+def generate_boq(
+    raw: dict, rate_overrides: dict = None, rate_set: str = None, layer_map: LayerMap = None
+) -> list:
     """
     Generate a BOQ from parsed CAD data with auto-estimated rates.
 
     Args:
         raw: Dictionary from cad_parser.parse_dxf() containing extracted quantities.
+        rate_overrides: Optional component_key -> rate mapping that replaces
+            the rate set's value for those components.
+        rate_set: "<region>/<version>" rate set to price with; the default
+            set when omitted. Raises KeyError if it doesn't exist.
+        layer_map: Layer routing rules; the server-wide LAYER_MAP_FILE map
+            when omitted.
 
     Returns:
         List of BOQ items, each with: item_no, component, description,
         quantity, unit, rate, total
     """
 
-    # Map raw data keys to rate_database keys
-    items_map = [
-        ("wall_conduits",       raw.get("total_line_length", 0)),
-        ("polyline_perimeter",  raw.get("polyline_total_length", 0)),
-        ("floor_area",          raw.get("closed_polyline_area", 0)),
-        ("circular_elements",   raw.get("circle_count", 0)),
-        ("arc_elements",        raw.get("arc_total_length", 0)),
-        ("doors",               raw.get("door_count", 0)),
-        ("windows",             raw.get("window_count", 0)),
-        ("columns",             raw.get("column_count", 0)),
-        ("furniture",           raw.get("furniture_count", 0)),
-    ]
+    if layer_map is None:
+        layer_map = default_layer_map
+    items_map = component_quantities(raw, layer_map).items()
+
+    rate_table = get_all_rates(rate_set)
 
     boq = []
     item_no = 1
@@ -42,11 +98,13 @@ def generate_boq(raw: dict) -> list:
         if not quantity or quantity <= 0:
             continue
 
-        rate_info = RATE_TABLE.get(key)
+        rate_info = rate_table.get(key)
         if not rate_info:
             continue
 
         rate = rate_info["rate"]
+        if rate_overrides and key in rate_overrides:
+            rate = rate_overrides[key]
         quantity_rounded = round(quantity, 2)
         total = round(quantity_rounded * rate, 2)
 
@@ -63,3 +121,40 @@ def generate_boq(raw: dict) -> list:
         item_no += 1
 
     return boq
+
+
+def generate_room_boq(raw: dict, rate_overrides: dict = None, rate_set: str = None) -> list:
+    """
+    Generate one BOQ per room from a parse_dxf(..., rooms=True) result.
+
+    Each room's BOQ is priced from the quantities of the entities inside
+    it (layer routing does not apply — rooms carry no per-layer split).
+    Entities outside every room come last, as a group with room None.
+
+    Returns:
+        List of groups, each with: room, handle, layer, area, boq, total
+    """
+    groups = [
+        {
+            "room": i,
+            "handle": room["handle"],
+            "layer": room["layer"],
+            "area": room["area"],
+            "quantities": room["quantities"],
+        }
+        for i, room in enumerate(raw.get("rooms", []), start=1)
+    ]
+    if raw.get("outside_rooms"):
+        groups.append({
+            "room": None, "handle": None, "layer": None, "area": None,
+            "quantities": raw["outside_rooms"],
+        })
+
+    result = []
+    for group in groups:
+        boq = generate_boq(group.pop("quantities"), rate_overrides, rate_set)
+        if boq:
+            group["boq"] = boq
+            group["total"] = round(sum(item["total"] for item in boq), 2)
+            result.append(group)
+    return result
@@ -0,0 +1,72 @@
+"""
+CAD format sniffing — identifies uploads by their magic bytes.
+
+File extensions are unreliable (renamed exports, ".DXF" vs ".dxf", missing
+suffixes), so the pipeline decides between "parse directly" and "convert
+with ODA first" from the leading bytes of the file instead.
+"""
+
+# Formats returned by sniff_format()
+DXF_ASCII = "dxf"
+DXF_BINARY = "dxf-binary"
+DWG = "dwg"
+UNKNOWN = "unknown"
+
+# How many leading bytes sniff_format() needs to decide
+SNIFF_BYTES = 64
+
+BINARY_DXF_SENTINEL = b"AutoCAD Binary DXF\r\n\x1a\x00"
+
+# DWG files start with a six byte version string
+DWG_VERSIONS = {
+    b"AC1.50": "R2.05",
+    b"AC2.10": "R2.10",
+    b"AC1001": "R2.22",
+    b"AC1002": "R2.50",
+    b"AC1003": "R2.60",
+    b"AC1004": "R9",
+    b"AC1006": "R10",
+    b"AC1009": "R11/R12",
+    b"AC1012": "R13",
+    b"AC1014": "R14",
+    b"AC1015": "R2000",
+    b"AC1018": "R2004",
+    b"AC1021": "R2007",
+    b"AC1024": "R2010",
+    b"AC1027": "R2013",
+    b"AC1032": "R2018",
+}
+
+
+def _is_ascii_dxf(head: bytes) -> bool:
+    """An ASCII DXF opens with a group code line followed by a value line."""
+    text = head.lstrip(b"\xef\xbb\xbf").lstrip()
+    lines = text.splitlines()
+    if len(lines) < 2:
+        return False
+
+    code, value = lines[0].strip(), lines[1].strip()
+    if code == b"999":
+        # Leading comment (written by many exporters)
+        return True
+    return code == b"0" and value in (b"SECTION", b"EOF")
+
+
+def sniff_format(head: bytes) -> str:
+    """
+    Identify a CAD file from its first SNIFF_BYTES bytes.
+
+    Returns one of DXF_ASCII, DXF_BINARY, DWG or UNKNOWN.
+    """
+    if head.startswith(BINARY_DXF_SENTINEL):
+        return DXF_BINARY
+    if head[:6] in DWG_VERSIONS:
+        return DWG
+    if _is_ascii_dxf(head):
+        return DXF_ASCII
+    return UNKNOWN
+
+
+def dwg_version(head: bytes) -> str:
+    """Return the AutoCAD release name for a DWG header, or an empty string."""
+    return DWG_VERSIONS.get(head[:6], "")
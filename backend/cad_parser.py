@@ -1,20 +1,927 @@
 import ezdxf
-import math
+import fnmatch
+import os
+import time
+from array import array
 
-# Common block name patterns for identification
-DOOR_PATTERNS = ["door", "dr", "d-", "entrance", "gate"]
-WINDOW_PATTERNS = ["window", "win", "w-", "wd"]
-COLUMN_PATTERNS = ["column", "col", "pillar", "pier"]
-FURNITURE_PATTERNS = ["furniture", "furn", "chair", "table", "desk", "bed", "sofa", "cabinet"]
+import numpy as np
+from ezdxf.addons import iterdxf
 
+import geometry_kernels as kernels
+import metrics
+from block_classifier import classifier, count_key, OTHER
+from block_quantities import BlockQuantityEngine, insert_scales, scale_totals, load_block_definitions
+from cad_format import sniff_format, DXF_ASCII, SNIFF_BYTES
+from curve_flattening import ellipse_length, hatch_area, spline_length
+from segment_dedup import DEDUP_TOLERANCE, dedup_segments, round_dedup
+from spatial_index import PolygonGrid, ragged_ranges
+from wall_detection import detect_walls, round_walls, wall_layer_mask
 
-def _match_block_type(block_name: str, patterns: list) -> bool:
-    """Check if a block name matches any of the given patterns (case-insensitive)."""
-    name_lower = block_name.lower()
-    return any(p in name_lower for p in patterns)
+# Bump whenever parse_dxf output changes so cached results are invalidated
+PARSER_VERSION = "10"
 
+# DXF files at least this large are parsed with the streaming reader
+STREAMING_THRESHOLD_BYTES = int(os.getenv("STREAMING_PARSE_THRESHOLD_MB", "64")) * 1024 * 1024
 
-def parse_dxf(path: str) -> dict:
+# Closed polylines that count as rooms: comma-separated layer patterns
+# (all layers when empty) and a minimum area in drawing units²
+ROOM_LAYERS = [p.strip().upper() for p in os.getenv("ROOM_LAYERS", "").split(",") if p.strip()]
+ROOM_MIN_AREA = float(os.getenv("ROOM_MIN_AREA", "0"))
+
+# dxftype -> handler(entity, state); populated by @register_handler
+ENTITY_HANDLERS = {}
+
+
+def register_handler(dxftype: str):
+    """Register a function that accumulates one entity type into a ParseState."""
+    def decorator(func):
+        ENTITY_HANDLERS[dxftype] = func
+        return func
+    return decorator
+
+
+def _handle_id(dxf) -> int:
+    """DXF handles are hex strings; store them as integers (0 if missing)."""
+    handle = dxf.handle
+    return int(handle, 16) if handle else 0
+
+
+# Properties the quantity breakdown is grouped by, in style-key order
+GROUP_BY = ("layer", "linetype", "color")
+
+
+def _style_key(dxf) -> tuple:
+    """
+    (layer, linetype, color) of an entity, as set on the entity itself.
+
+    BYLAYER / BYBLOCK values are reported as such, not resolved. Reads the
+    namespace's instance dict directly: for attributes that were never set,
+    ezdxf's default-value lookup costs more than the rest of a LINE handler.
+    """
+    attribs = vars(dxf)
+    return (attribs.get("layer", "0"), attribs.get("linetype", "BYLAYER"), attribs.get("color", 256))
+
+
+class LineGeometry:
+    """
+    Columnar storage for LINE segments.
+
+    Each segment costs 4 float64 coordinates + a 64-bit entity handle + a
+    32-bit layer index (44 bytes), instead of a dict per line.
+    """
+
+    DTYPE = np.dtype([
+        ("x1", "f8"), ("y1", "f8"), ("x2", "f8"), ("y2", "f8"),
+        ("handle", "u8"), ("layer", "u4"),
+    ])
+
+    def __init__(self, coords: array, handles: array, layer_ids: array, layers: list):
+        self.coords = coords        # x1, y1, x2, y2 per segment
+        self.handles = handles      # DXF handle (hex) as an integer
+        self.layer_ids = layer_ids  # index into layers
+        self.layers = layers        # layer names
+
+    def __len__(self) -> int:
+        return len(self.handles)
+
+    def to_numpy(self) -> np.ndarray:
+        """Return the segments as a NumPy structured array (LineGeometry.DTYPE)."""
+        out = np.empty(len(self), dtype=self.DTYPE)
+        coords = kernels.as_array(self.coords, 4)
+        for i, name in enumerate(("x1", "y1", "x2", "y2")):
+            out[name] = coords[:, i]
+        out["handle"] = np.frombuffer(self.handles, dtype=np.uint64) if len(self) else []
+        out["layer"] = np.frombuffer(self.layer_ids, dtype=np.uint32) if len(self) else []
+        return out
+
+    def to_json(self) -> dict:
+        """Column-oriented, JSON-serializable form for API responses."""
+        coords = kernels.as_array(self.coords, 4)
+        return {
+            "layers": list(self.layers),
+            "handle": [format(h, "X") for h in self.handles],
+            "layer": self.layer_ids.tolist(),
+            "x1": coords[:, 0].tolist(),
+            "y1": coords[:, 1].tolist(),
+            "x2": coords[:, 2].tolist(),
+            "y2": coords[:, 3].tolist(),
+        }
+
+
+class MeasuredEntities:
+    """
+    Columnar storage for entities measured one at a time as they are read.
+
+    SPLINEs, ELLIPSEs and HATCHes are flattened in their handler (see
+    curve_flattening), so only the resulting length or area is kept, with
+    the handle, style id and representative point of each entity.
+    """
+
+    def __init__(self):
+        self.values = array("d")   # length or area per entity
+        self.handles = array("Q")
+        self.styles = array("I")
+        self.points = array("d")   # x, y per entity
+
+    def __len__(self) -> int:
+        return len(self.handles)
+
+    def append(self, value: float, handle: int, style_id: int, x: float, y: float) -> None:
+        self.values.append(value)
+        self.handles.append(handle)
+        self.styles.append(style_id)
+        self.points.extend((x, y))
+
+
+# Measured entity kind -> (count key, measure key)
+MEASURED_KEYS = {
+    "spline": ("spline_count", "spline_total_length"),
+    "ellipse": ("ellipse_count", "ellipse_total_length"),
+    "hatch": ("hatch_count", "hatch_area"),
+}
+
+
+# Block category -> result key, e.g. "door" -> "door_count"
+_CATEGORY_KEYS = {c: count_key(c) for c in classifier.categories + [OTHER]}
+_COUNT_KEYS = list(_CATEGORY_KEYS.values())
+
+
+class ParseState:
+    """
+    Accumulator for a single parse.
+
+    Handlers only append raw coordinates to flat float64 buffers and bump
+    counters; lengths and areas are computed afterwards in finalize() with
+    vectorized kernels over whole buffers.
+
+    Every entity also records a style id — its interned (layer, linetype,
+    color) — so the per-layer, per-linetype and per-color breakdown is a
+    handful of grouped reductions rather than a dict update per entity.
+    With breakdown=False only the layer is tracked.
+
+    Positions (circle and arc centres, insertion points) are kept as well,
+    so entities can be assigned to the rooms they lie in; see rooms().
+    """
+
+    def __init__(self, blocks: BlockQuantityEngine = None, breakdown: bool = True):
+        self.blocks = blocks             # resolves block definitions for INSERTs
+        self.breakdown_enabled = breakdown
+        self.block_refs = {}             # (name, linear scale, area scale) -> copies
+        self.counts = dict.fromkeys(_COUNT_KEYS, 0)
+        self.line_coords = array("d")    # x1, y1, x2, y2 per LINE
+        self.line_handles = array("Q")   # DXF handle per LINE
+        self.line_styles = array("I")    # style id per LINE
+        self.circle_radii = array("d")   # radius per CIRCLE
+        self.circle_handles = array("Q")
+        self.circle_styles = array("I")
+        self.circle_centers = array("d")  # x, y per CIRCLE
+        self.arc_params = array("d")     # radius, start angle, end angle per ARC
+        self.arc_handles = array("Q")
+        self.arc_styles = array("I")
+        self.arc_centers = array("d")    # x, y per ARC
+        self.poly_xy = array("d")        # x, y of every polyline vertex
+        self.poly_offsets = array("q", [0])  # vertex index where each polyline starts
+        self.poly_closed = array("b")    # closed flag per polyline
+        self.poly_handles = array("Q")
+        self.poly_styles = array("I")
+        self.inserts = []                # (handle, count key, copies, block ref key, style id)
+        self.insert_points = array("d")  # x, y per INSERT
+        self.measured = {kind: MeasuredEntities() for kind in MEASURED_KEYS}
+
+        self.styles = []                 # (layer, linetype, color), indexed by style id
+        self._style_ids = {}
+        self.dedup_stats = None          # set by dedup_lines()
+
+    def _intern(self, key: tuple) -> int:
+        style_id = self._style_ids.get(key)
+        if style_id is None:
+            style_id = self._style_ids[key] = len(self.styles)
+            self.styles.append(key)
+        return style_id
+
+    def style_id(self, dxf) -> int:
+        """Intern an entity's style key and return its compact integer id."""
+        return self._intern(_style_key(dxf) if self.breakdown_enabled else (dxf.layer, None, None))
+
+    def merge(self, other: "ParseState") -> None:
+        """
+        Append everything another state collected after this state's entities.
+
+        Style ids are re-interned in other's first-seen order, so merging the
+        states of consecutive slices of a drawing, in order, gives exactly the
+        buffers (and style ids) of a single pass over the whole drawing.
+        Block totals are not merged: this state's block engine must resolve
+        every block other references.
+        """
+        mapping = np.array([self._intern(key) for key in other.styles], dtype=np.uint32)
+
+        def remapped(style_ids):
+            if not len(style_ids):
+                return style_ids
+            return array("I", mapping[np.frombuffer(style_ids, dtype=np.uint32)].tobytes())
+
+        for name in ("line", "circle", "arc", "poly"):
+            getattr(self, f"{name}_handles").extend(getattr(other, f"{name}_handles"))
+            getattr(self, f"{name}_styles").extend(remapped(getattr(other, f"{name}_styles")))
+        self.line_coords.extend(other.line_coords)
+        self.circle_radii.extend(other.circle_radii)
+        self.circle_centers.extend(other.circle_centers)
+        self.arc_params.extend(other.arc_params)
+        self.arc_centers.extend(other.arc_centers)
+
+        base = self.poly_offsets[-1]
+        self.poly_xy.extend(other.poly_xy)
+        self.poly_offsets.extend(array("q", (np.frombuffer(other.poly_offsets, dtype=np.int64)[1:] + base).tobytes()))
+        self.poly_closed.extend(other.poly_closed)
+
+        for handle, key, copies, ref_key, style_id in other.inserts:
+            self.inserts.append((handle, key, copies, ref_key, int(mapping[style_id])))
+        self.insert_points.extend(other.insert_points)
+        for ref_key, copies in other.block_refs.items():
+            self.block_refs[ref_key] = self.block_refs.get(ref_key, 0) + copies
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+
+        for kind, entities in other.measured.items():
+            mine = self.measured[kind]
+            mine.values.extend(entities.values)
+            mine.handles.extend(entities.handles)
+            mine.styles.extend(remapped(entities.styles))
+            mine.points.extend(entities.points)
+
+    def _group_codes(self, field: int) -> tuple:
+        """Map style ids onto the distinct values of one style field: (codes, labels)."""
+        labels = {}
+        codes = np.fromiter(
+            (labels.setdefault(style[field], len(labels)) for style in self.styles),
+            dtype=np.intp, count=len(self.styles),
+        )
+        return codes, list(labels)
+
+    def dedup_lines(self, tolerance: float = DEDUP_TOLERANCE) -> None:
+        """
+        Replace the LINE buffers with their deduplicated, merged form.
+
+        Each surviving segment keeps the handle and style of the first LINE
+        of its run. What was removed is kept in dedup_stats.
+        """
+        segments, source, self.dedup_stats = dedup_segments(kernels.as_array(self.line_coords, 4), tolerance)
+        if self.dedup_stats["output_segments"] == self.dedup_stats["input_segments"]:
+            return
+        self.line_coords = array("d")
+        self.line_coords.frombytes(np.ascontiguousarray(segments).tobytes())
+        self.line_handles = array("Q", np.frombuffer(self.line_handles, dtype=np.uint64)[source].tobytes())
+        self.line_styles = array("I", np.frombuffer(self.line_styles, dtype=np.uint32)[source].tobytes())
+
+    def line_geometry(self) -> LineGeometry:
+        codes, layers = self._group_codes(0)
+        styles = np.frombuffer(self.line_styles, dtype=np.uint32)
+        layer_ids = array("I")
+        layer_ids.frombytes(codes[styles].astype(np.uint32).tobytes())
+        return LineGeometry(self.line_coords, self.line_handles, layer_ids, layers)
+
+    def _measure(self) -> dict:
+        """Per-entity lengths and areas for every buffered entity."""
+        poly_xy = kernels.as_array(self.poly_xy, 2)
+        poly_offsets = np.frombuffer(self.poly_offsets, dtype=np.int64)
+        poly_closed = np.frombuffer(self.poly_closed, dtype=np.int8).astype(bool)
+
+        # Areas only make sense for closed polylines with at least 3 vertices
+        polygon_mask = poly_closed & (np.diff(poly_offsets) >= 3)
+        areas = kernels.shoelace_areas(poly_xy, poly_offsets)
+
+        return {
+            "lines": kernels.segment_lengths(kernels.as_array(self.line_coords, 4)),
+            "circles": kernels.circle_circumferences(kernels.as_array(self.circle_radii)),
+            "arcs": kernels.arc_lengths(kernels.as_array(self.arc_params, 3)),
+            "perimeters": kernels.polyline_perimeters(poly_xy, poly_offsets, poly_closed),
+            "areas": np.where(polygon_mask, areas, 0.0),
+            **{kind: kernels.as_array(entities.values) for kind, entities in self.measured.items()},
+        }
+
+    def _block_totals(self, ref_key, copies: int) -> dict:
+        name, linear_scale, area_scale = ref_key
+        block_totals = self.blocks.totals(name) if self.blocks is not None else None
+        if not block_totals:
+            return {}
+        return scale_totals(block_totals, copies, linear_scale, area_scale)
+
+    def totals(self) -> dict:
+        """Unrounded quantity totals, including the geometry inside inserted blocks."""
+        measured = self._measure()
+
+        result = {
+            "total_line_length": float(measured["lines"].sum()),
+            "circle_count": len(self.circle_radii),
+            "circle_total_circumference": float(measured["circles"].sum()),
+            "arc_count": len(self.arc_handles),
+            "arc_total_length": float(measured["arcs"].sum()),
+            "polyline_count": len(self.poly_closed),
+            "polyline_total_length": float(measured["perimeters"].sum()),
+            "closed_polyline_area": float(measured["areas"].sum()),
+            **self.counts,
+        }
+        for kind, (count_key, measure_key) in MEASURED_KEYS.items():
+            result[count_key] = len(self.measured[kind])
+            result[measure_key] = float(measured[kind].sum())
+
+        # Identical references were grouped, so each block is scaled once per group
+        for ref_key, copies in self.block_refs.items():
+            for key, value in self._block_totals(ref_key, copies).items():
+                result[key] += value
+
+        return result
+
+    def entity_contributions(self) -> dict:
+        """
+        What each entity adds to the totals, keyed by integer DXF handle.
+
+        Values are flat (key, amount, key, amount, ...) tuples — most
+        entities touch one to three keys, and tuples keep large snapshots
+        compact.
+        """
+        measured = self._measure()
+        contributions = {}
+
+        for handle, length in zip(self.line_handles, measured["lines"].tolist()):
+            contributions[handle] = ("total_line_length", length)
+        for handle, length in zip(self.circle_handles, measured["circles"].tolist()):
+            contributions[handle] = ("circle_count", 1, "circle_total_circumference", length)
+        for handle, length in zip(self.arc_handles, measured["arcs"].tolist()):
+            contributions[handle] = ("arc_count", 1, "arc_total_length", length)
+        for handle, perimeter, area in zip(
+            self.poly_handles, measured["perimeters"].tolist(), measured["areas"].tolist()
+        ):
+            contributions[handle] = (
+                "polyline_count", 1,
+                "polyline_total_length", perimeter,
+                "closed_polyline_area", area,
+            )
+        for kind, (count_key, measure_key) in MEASURED_KEYS.items():
+            for handle, value in zip(self.measured[kind].handles, measured[kind].tolist()):
+                contributions[handle] = (count_key, 1, measure_key, value)
+        for handle, key, copies, ref_key, _style in self.inserts:
+            flat = [key, copies]
+            for block_key, value in self._block_totals(ref_key, copies).items():
+                if value:
+                    flat.extend((block_key, value))
+            contributions[handle] = tuple(flat)
+
+        return contributions
+
+    def entity_styles(self) -> dict:
+        """The (layer, linetype, color) of each entity, keyed by integer DXF handle."""
+        styles = self.styles
+        result = {}
+        for handles, style_ids in (
+            (self.line_handles, self.line_styles),
+            (self.circle_handles, self.circle_styles),
+            (self.arc_handles, self.arc_styles),
+            (self.poly_handles, self.poly_styles),
+            *((entities.handles, entities.styles) for entities in self.measured.values()),
+        ):
+            for handle, style_id in zip(handles, style_ids):
+                result[handle] = styles[style_id]
+        for handle, _key, _copies, _ref_key, style_id in self.inserts:
+            result[handle] = styles[style_id]
+        return result
+
+    def _grouped_columns(self, groups: dict, n: int, measured: dict = None) -> dict:
+        """
+        Every quantity summed per group: quantity key -> float array of length n.
+
+        groups maps "line", "circle", "arc", "poly", "insert" and the
+        MEASURED_KEYS kinds to the group id of each entity of that kind.
+        """
+        if measured is None:
+            measured = self._measure()
+
+        def grouped(kind, weights=None):
+            return np.bincount(groups[kind], weights, minlength=n).astype(float)
+
+        columns = {
+            "total_line_length": grouped("line", measured["lines"]),
+            "circle_count": grouped("circle"),
+            "circle_total_circumference": grouped("circle", measured["circles"]),
+            "arc_count": grouped("arc"),
+            "arc_total_length": grouped("arc", measured["arcs"]),
+            "polyline_count": grouped("poly"),
+            "polyline_total_length": grouped("poly", measured["perimeters"]),
+            "closed_polyline_area": grouped("poly", measured["areas"]),
+        }
+        for kind, (count_key, measure_key) in MEASURED_KEYS.items():
+            columns[count_key] = grouped(kind)
+            columns[measure_key] = grouped(kind, measured[kind])
+        for key in _COUNT_KEYS:
+            columns[key] = np.zeros(n)
+
+        # Group identical references first; block geometry is attributed to
+        # the INSERT's own group
+        references = {}
+        for (_handle, key, copies, ref_key, _style), group_id in zip(self.inserts, groups["insert"].tolist()):
+            group = (group_id, key, ref_key)
+            references[group] = references.get(group, 0) + copies
+        for (group_id, key, ref_key), copies in references.items():
+            columns[key][group_id] += copies
+            for block_key, value in self._block_totals(ref_key, copies).items():
+                columns[block_key][group_id] += value
+
+        return columns
+
+    def _style_columns(self) -> dict:
+        """Every quantity summed per style id."""
+        def ids(style_ids):
+            return np.frombuffer(style_ids, dtype=np.uint32)
+
+        groups = {
+            "line": ids(self.line_styles),
+            "circle": ids(self.circle_styles),
+            "arc": ids(self.arc_styles),
+            "poly": ids(self.poly_styles),
+            "insert": np.array([insert[4] for insert in self.inserts], dtype=np.int64),
+            **{kind: ids(entities.styles) for kind, entities in self.measured.items()},
+        }
+        return self._grouped_columns(groups, len(self.styles))
+
+    def breakdown(self) -> dict:
+        """
+        Unrounded totals per layer, per linetype and per color.
+
+        Returns {"layer": {name: {key: value}}, "linetype": {...}, "color": {...}};
+        only non-zero quantities are listed.
+        """
+        columns = self._style_columns()
+        result = {}
+        for field, name in enumerate(GROUP_BY):
+            codes, labels = self._group_codes(field)
+            groups = [{} for _ in labels]
+            for key, column in columns.items():
+                sums = np.bincount(codes, column, minlength=len(labels))
+                for i in np.flatnonzero(sums).tolist():
+                    groups[i][key] = float(sums[i])
+            result[name] = {str(label): totals for label, totals in zip(labels, groups) if totals}
+        return result
+
+    def _room_mask(self, measured: dict) -> np.ndarray:
+        """Which polylines are rooms: closed, non-degenerate, big enough, on a room layer."""
+        mask = measured["areas"] > max(ROOM_MIN_AREA, 0.0)
+        if ROOM_LAYERS and mask.any():
+            layer_codes, layers = self._group_codes(0)
+            room_layers = np.array(
+                [any(fnmatch.fnmatchcase(layer.upper(), p) for p in ROOM_LAYERS) for layer in layers],
+                dtype=bool,
+            )
+            poly_layers = layer_codes[np.frombuffer(self.poly_styles, dtype=np.uint32)]
+            mask &= room_layers[poly_layers]
+        return mask
+
+    def _positions(self) -> dict:
+        """One representative point per entity, as (n, 2) arrays by kind."""
+        lines = kernels.as_array(self.line_coords, 4)
+        arcs = kernels.as_array(self.arc_params, 3)
+        arc_centers = kernels.as_array(self.arc_centers, 2)
+        poly_xy = kernels.as_array(self.poly_xy, 2)
+        poly_offsets = np.frombuffer(self.poly_offsets, dtype=np.int64)
+
+        # Arcs are placed at the middle of their sweep, not at the centre,
+        # which for door swings and bends can lie outside the room
+        start = np.radians(arcs[:, 1])
+        sweep = np.radians(arcs[:, 2]) - start
+        middle = start + np.where(sweep < 0, sweep + 2 * np.pi, sweep) / 2
+        arc_points = arc_centers + arcs[:, :1] * np.column_stack((np.cos(middle), np.sin(middle)))
+
+        if len(poly_offsets) > 1:
+            vertex_counts = np.diff(poly_offsets)[:, None]
+            poly_points = np.add.reduceat(poly_xy, poly_offsets[:-1], axis=0) / vertex_counts
+        else:
+            poly_points = np.empty((0, 2))
+
+        return {
+            "line": (lines[:, :2] + lines[:, 2:]) / 2,
+            "circle": kernels.as_array(self.circle_centers, 2),
+            "arc": arc_points,
+            "poly": poly_points,
+            "insert": kernels.as_array(self.insert_points, 2),
+            **{kind: kernels.as_array(entities.points, 2) for kind, entities in self.measured.items()},
+        }
+
+    def rooms(self) -> tuple:
+        """
+        Unrounded quantities per room.
+
+        Every closed polyline with a positive area (see ROOM_LAYERS and
+        ROOM_MIN_AREA) is a room. Entities are assigned to the smallest room
+        containing their representative point — line midpoint, arc
+        midpoint, circle centre, polyline or flattened-curve vertex
+        centroid, insertion point —
+        through a grid index over the rooms. A room polyline belongs to
+        itself.
+
+        Returns:
+            (rooms, unassigned) — rooms is a list of dicts with handle, layer,
+            area, perimeter and quantities; unassigned holds the quantities
+            of entities outside every room
+        """
+        measured = self._measure()
+        room_mask = self._room_mask(measured)
+        room_polys = np.flatnonzero(room_mask)
+
+        poly_xy = kernels.as_array(self.poly_xy, 2)
+        poly_offsets = np.frombuffer(self.poly_offsets, dtype=np.int64)
+        vertex_counts = np.diff(poly_offsets)[room_polys]
+        vertex_ids = ragged_ranges(poly_offsets[room_polys], vertex_counts)
+        room_offsets = np.concatenate(([0], np.cumsum(vertex_counts)))
+        grid = PolygonGrid(poly_xy[vertex_ids], room_offsets)
+
+        # Group id = room index, with len(rooms) standing for "outside every room"
+        outside = len(room_polys)
+        groups = {}
+        for kind, points in self._positions().items():
+            located = grid.locate(points)
+            groups[kind] = np.where(located < 0, outside, located)
+        groups["poly"][room_polys] = np.arange(outside)
+
+        columns = self._grouped_columns(groups, outside + 1, measured)
+        quantities = [{} for _ in range(outside + 1)]
+        for key, column in columns.items():
+            for i in np.flatnonzero(column).tolist():
+                quantities[i][key] = float(column[i])
+
+        rooms = []
+        handles = np.frombuffer(self.poly_handles, dtype=np.uint64)
+        poly_layers = np.frombuffer(self.poly_styles, dtype=np.uint32)
+        for i, j in enumerate(room_polys.tolist()):
+            rooms.append({
+                "handle": format(int(handles[j]), "X"),
+                "layer": self.styles[poly_layers[j]][0],
+                "area": float(measured["areas"][j]),
+                "perimeter": float(measured["perimeters"][j]),
+                "quantities": quantities[i],
+            })
+        return rooms, quantities[outside]
+
+    def segments(self) -> tuple:
+        """
+        Every straight segment: LINEs plus polyline edges (closing edges included).
+
+        Returns:
+            (segments, handles, style_ids) — an (n, 4) x1, y1, x2, y2 array and
+            the owning entity's handle and style id per segment
+        """
+        poly_xy = kernels.as_array(self.poly_xy, 2)
+        poly_offsets = np.frombuffer(self.poly_offsets, dtype=np.int64)
+        poly_closed = np.frombuffer(self.poly_closed, dtype=np.int8).astype(bool)
+        vertex_counts = np.diff(poly_offsets)
+
+        # Edge k of a polyline runs from vertex k to k + 1; closed ones add last -> first
+        edge_counts = vertex_counts - 1 + poly_closed
+        edge_start = ragged_ranges(poly_offsets[:-1], edge_counts)
+        edge_end = edge_start + 1
+        closing = np.cumsum(edge_counts)[poly_closed] - 1
+        edge_end[closing] = poly_offsets[:-1][poly_closed]
+        edges = np.hstack((poly_xy[edge_start], poly_xy[edge_end])) if len(edge_start) else np.empty((0, 4))
+
+        segments = np.vstack((kernels.as_array(self.line_coords, 4), edges))
+        handles = np.concatenate((
+            np.frombuffer(self.line_handles, dtype=np.uint64),
+            np.repeat(np.frombuffer(self.poly_handles, dtype=np.uint64), edge_counts),
+        ))
+        style_ids = np.concatenate((
+            np.frombuffer(self.line_styles, dtype=np.uint32),
+            np.repeat(np.frombuffer(self.poly_styles, dtype=np.uint32), edge_counts),
+        )).astype(np.intp)
+        return segments, handles, style_ids
+
+    def entity_segments(self) -> dict:
+        """Each entity's segments as a flat (x1, y1, x2, y2, ...) tuple, keyed by integer DXF handle."""
+        segments, handles, _ = self.segments()
+        result = {}
+        if len(handles) == 0:
+            return result
+        starts = np.flatnonzero(np.r_[True, handles[1:] != handles[:-1]])
+        stops = np.r_[starts[1:], len(handles)]
+        flat = segments.tolist()
+        for handle, start, stop in zip(handles[starts].tolist(), starts.tolist(), stops.tolist()):
+            result[handle] = tuple(c for segment in flat[start:stop] for c in segment)
+        return result
+
+    def walls(self) -> dict:
+        """Walls found among the LINE and polyline segments on wall layers (see wall_detection)."""
+        codes, layers = self._group_codes(0)
+        wall_styles = wall_layer_mask(layers)[codes] if len(codes) else np.empty(0, dtype=bool)
+        # No segment on a wall layer: skip building segments and the sweep
+        if not (
+            wall_styles[np.frombuffer(self.line_styles, dtype=np.uint32)].any()
+            or wall_styles[np.frombuffer(self.poly_styles, dtype=np.uint32)].any()
+        ):
+            return detect_walls(np.empty((0, 4)))
+        segments, _, style_ids = self.segments()
+        return detect_walls(segments[wall_styles[style_ids]])
+
+    def finalize(self, include_lines: bool = False, include_rooms: bool = False) -> dict:
+        """Reduce the collected buffers into the parse_dxf result dictionary."""
+        result = round_totals(self.totals())
+        result.update(round_walls(self.walls()))
+        if self.dedup_stats is not None:
+            result["dedup"] = round_dedup(self.dedup_stats)
+        if self.breakdown_enabled:
+            result["breakdown"] = round_breakdown(self.breakdown())
+        if include_rooms:
+            rooms, unassigned = self.rooms()
+            result["rooms"] = [
+                {
+                    **room,
+                    "area": round(room["area"], 2),
+                    "perimeter": round(room["perimeter"], 2),
+                    "quantities": round_quantities(room["quantities"]),
+                }
+                for room in rooms
+            ]
+            result["outside_rooms"] = round_quantities(unassigned)
+
+        # Raw segments are opt-in — generate_boq never needs them
+        if include_lines:
+            result["lines"] = self.line_geometry()
+
+        return result
+
+
+# ── LINE entities ────────────────────────────
+@register_handler("LINE")
+def _handle_line(e, state: ParseState) -> None:
+    dxf = e.dxf
+    start, end = dxf.start, dxf.end
+    state.line_coords.extend((start.x, start.y, end.x, end.y))
+    state.line_handles.append(_handle_id(dxf))
+    state.line_styles.append(state.style_id(dxf))
+
+
+# ── CIRCLE entities ──────────────────────────
+@register_handler("CIRCLE")
+def _handle_circle(e, state: ParseState) -> None:
+    state.circle_radii.append(e.dxf.radius)
+    center = e.dxf.center
+    state.circle_centers.extend((center.x, center.y))
+    state.circle_handles.append(_handle_id(e.dxf))
+    state.circle_styles.append(state.style_id(e.dxf))
+
+
+# ── ARC entities ─────────────────────────────
+@register_handler("ARC")
+def _handle_arc(e, state: ParseState) -> None:
+    state.arc_params.extend((e.dxf.radius, e.dxf.start_angle, e.dxf.end_angle))
+    center = e.dxf.center
+    state.arc_centers.extend((center.x, center.y))
+    state.arc_handles.append(_handle_id(e.dxf))
+    state.arc_styles.append(state.style_id(e.dxf))
+
+
+# ── LWPOLYLINE / POLYLINE entities ───────────
+def _add_polyline(e, state: ParseState, xy, closed: bool) -> None:
+    """Buffer a polyline from its flat x, y, x, y, ... vertex coordinates."""
+    count = len(xy) // 2
+    if count < 2:
+        return
+    state.poly_xy.extend(xy)
+    state.poly_offsets.append(state.poly_offsets[-1] + count)
+    state.poly_closed.append(1 if closed else 0)
+    state.poly_handles.append(_handle_id(e.dxf))
+    state.poly_styles.append(state.style_id(e.dxf))
+
+
+@register_handler("LWPOLYLINE")
+def _handle_lwpolyline(e, state: ParseState) -> None:
+    try:
+        # Vertices are packed as x, y, start width, end width, bulge: copy
+        # out x and y with two strided slices instead of a tuple per vertex
+        packed = e.lwpoints.values
+        size = e.lwpoints.VERTEX_SIZE
+        xy = array("d", bytes(16 * (len(packed) // size)))
+        xy[0::2] = packed[0::size]
+        xy[1::2] = packed[1::size]
+        closed = e.closed
+    except Exception:
+        # Skip malformed polylines
+        return
+    _add_polyline(e, state, xy, closed)
+
+
+# VERTEX flag of spline frame control points, which are not on the curve
+_SPLINE_FRAME_VERTEX = 16
+
+
+@register_handler("POLYLINE")
+def _handle_polyline(e, state: ParseState) -> None:
+    """Old-style 2D and 3D polylines; measured in plan, like LWPOLYLINEs."""
+    try:
+        if e.is_polygon_mesh or e.is_poly_face_mesh:
+            return
+        xy = [
+            c
+            for v in e.vertices
+            if not v.dxf.flags & _SPLINE_FRAME_VERTEX
+            for c in (v.dxf.location.x, v.dxf.location.y)
+        ]
+        closed = e.is_closed
+    except Exception:
+        # Skip malformed polylines
+        return
+    _add_polyline(e, state, xy, closed)
+
+
+# ── SPLINE / ELLIPSE / HATCH entities ────────
+def _add_measured(kind: str, measure, e, state: ParseState) -> None:
+    try:
+        value, x, y = measure(e)
+    except Exception:
+        # Skip curves ezdxf cannot evaluate (no control points, bad knots, ...)
+        return
+    state.measured[kind].append(value, _handle_id(e.dxf), state.style_id(e.dxf), x, y)
+
+
+@register_handler("SPLINE")
+def _handle_spline(e, state: ParseState) -> None:
+    _add_measured("spline", spline_length, e, state)
+
+
+@register_handler("ELLIPSE")
+def _handle_ellipse(e, state: ParseState) -> None:
+    _add_measured("ellipse", ellipse_length, e, state)
+
+
+@register_handler("HATCH")
+def _handle_hatch(e, state: ParseState) -> None:
+    _add_measured("hatch", hatch_area, e, state)
+
+
+# ── INSERT (block references) ────────────────
+@register_handler("INSERT")
+def _handle_insert(e, state: ParseState) -> None:
+    block_name = e.dxf.name
+    copies, linear_scale, area_scale = insert_scales(e)
+
+    key = _CATEGORY_KEYS[classifier.classify(block_name, copies)]
+    state.counts[key] += copies
+
+    # Block geometry is resolved in totals(), once per distinct (block, scale)
+    ref_key = (block_name, linear_scale, area_scale)
+    state.inserts.append((_handle_id(e.dxf), key, copies, ref_key, state.style_id(e.dxf)))
+    point = e.dxf.insert
+    state.insert_points.extend((point.x, point.y))
+    if state.blocks is not None:
+        state.block_refs[ref_key] = state.block_refs.get(ref_key, 0) + copies
+
+
+# Result keys holding float quantities (rounded to 2 decimals for output)
+FLOAT_KEYS = (
+    "total_line_length",
+    "circle_total_circumference",
+    "arc_total_length",
+    "polyline_total_length",
+    "closed_polyline_area",
+    "spline_total_length",
+    "ellipse_total_length",
+    "hatch_area",
+)
+
+
+def round_totals(totals: dict) -> dict:
+    """Round all float values the way parse_dxf reports them."""
+    result = dict(totals)
+    for key in FLOAT_KEYS:
+        result[key] = round(result[key], 2)
+    return result
+
+
+def round_quantities(totals: dict) -> dict:
+    """Round a sparse {key: value} dict like round_totals, dropping values that round to zero."""
+    rounded = {}
+    for key, value in totals.items():
+        value = round(value, 2) if key in FLOAT_KEYS else int(round(value))
+        if value:
+            rounded[key] = value
+    return rounded
+
+
+def round_breakdown(breakdown: dict) -> dict:
+    """Round a ParseState.breakdown() with round_quantities, dropping empty groups."""
+    result = {}
+    for field, groups in breakdown.items():
+        rounded_groups = {}
+        for label, totals in groups.items():
+            rounded = round_quantities(totals)
+            if rounded:
+                rounded_groups[label] = rounded
+        result[field] = rounded_groups
+    return result
+
+
+def new_block_engine(block_source) -> BlockQuantityEngine:
+    """Block engine whose definitions are evaluated with this parser's handlers."""
+    return BlockQuantityEngine(block_source, _evaluate_block)
+
+
+def _evaluate_block(entities, engine: BlockQuantityEngine) -> dict:
+    """Totals for one unscaled copy of a block definition."""
+    state = ParseState(engine, breakdown=False)
+    _dispatch(entities, state)
+    return state.totals()
+
+
+# Every n-th entity of each type is timed; the others are only counted
+HANDLER_TIMING_SAMPLE = 16
+
+
+def _dispatch(entities, state: ParseState) -> dict:
+    """
+    Route each entity to its handler.
+
+    Returns:
+        {dxftype: (entities, seconds in its handler)} — the seconds
+        extrapolated from the timed sample. Only the top-level parse
+        records them, so block definitions evaluated along the way don't
+        count as parses (or their entities twice).
+    """
+    handlers = ENTITY_HANDLERS
+    clock = time.perf_counter
+    counts = {}
+    # dxftype -> [timed entities, seconds in its handler]
+    sampled = {}
+    for e in entities:
+        kind = e.dxftype()
+        handler = handlers.get(kind)
+        if handler is None:
+            continue
+        n = counts.get(kind, 0)
+        counts[kind] = n + 1
+        if n % HANDLER_TIMING_SAMPLE:
+            handler(e, state)
+            continue
+        start = clock()
+        handler(e, state)
+        timing = sampled.setdefault(kind, [0, 0.0])
+        timing[0] += 1
+        timing[1] += clock() - start
+
+    return {kind: (count, sampled[kind][1] * count / sampled[kind][0]) for kind, count in counts.items()}
+
+
+def parse_modelspace(
+    msp, include_lines: bool = False, block_source=None, breakdown: bool = True, rooms: bool = False
+) -> dict:
+    """
+    Extract quantities from an entity space in a single traversal.
+
+    Every entity is visited once and routed to the handler registered for
+    its type, so supporting another entity type costs no extra scan.
+
+    With a block_source (doc.blocks or load_block_definitions()), the
+    geometry inside referenced blocks — including nested blocks — is added
+    to the totals; without one, INSERTs are only counted.
+
+    breakdown=False skips the per-layer/linetype/color breakdown; rooms=True
+    adds the per-room quantities.
+    """
+    blocks = new_block_engine(block_source) if block_source is not None else None
+    state = ParseState(blocks, breakdown)
+    with metrics.span("entities"):
+        metrics.record_handlers(_dispatch(msp, state))
+    if DEDUP_TOLERANCE > 0:
+        with metrics.span("dedup"):
+            state.dedup_lines()
+    with metrics.span("finalize"):
+        return state.finalize(include_lines, rooms)
+
+
+def _can_stream(path: str) -> bool:
+    """The streaming reader only understands ASCII DXF."""
+    with open(path, "rb") as f:
+        return sniff_format(f.read(SNIFF_BYTES)) == DXF_ASCII
+
+
+def open_drawing(path: str, streaming: bool = None) -> tuple:
+    """
+    Return (modelspace entities, block source) for a DXF file.
+
+    Uses the streaming reader for large ASCII files (see parse_dxf) and a
+    fully loaded ezdxf document otherwise.
+    """
+    if streaming is None:
+        streaming = os.path.getsize(path) >= STREAMING_THRESHOLD_BYTES
+
+    if streaming and _can_stream(path):
+        # Only entity types with a handler are materialized
+        blocks = load_block_definitions(path, ENTITY_HANDLERS.keys())
+        entities = iterdxf.modelspace(path, types=ENTITY_HANDLERS.keys())
+        return entities, blocks
+
+    doc = ezdxf.readfile(path)
+    return doc.modelspace(), doc.blocks
+
+
+def parse_dxf(
+    path: str, streaming: bool = None, include_lines: bool = False, rooms: bool = False, parallel: bool = None
+) -> dict:
     """
     Parse a DXF file and extract geometric data for BOQ generation.
 
@@ -24,115 +931,67 @@ def parse_dxf(path: str) -> dict:
     - circle_total_circumference: total circumference of all circles
     - arc_count: number of ARC entities
     - arc_total_length: total arc length
-    - polyline_count: number of LWPOLYLINE entities
+    - polyline_count: number of LWPOLYLINE and 2D/3D POLYLINE entities
+      (meshes excluded)
     - polyline_total_length: total polyline perimeter
     - closed_polyline_area: total area of closed polylines (for slab/floor)
+    - spline_count, spline_total_length: SPLINE entities and their length
+    - ellipse_count, ellipse_total_length: ELLIPSE entities (full or
+      elliptical arcs) and their length
+    - hatch_count, hatch_area: HATCH entities and their filled area (holes
+      and islands resolved by the even-odd rule)
     - door_count: blocks matching door patterns
     - window_count: blocks matching window patterns
     - column_count: blocks matching column patterns
     - furniture_count: blocks matching furniture patterns
+    - <category>_count: for extra categories from BLOCK_PATTERNS_FILE
     - other_block_count: unclassified block inserts
-    - lines: raw line data (for backward compatibility)
-    """
-    doc = ezdxf.readfile(path)
-    msp = doc.modelspace()
-
-    result = {
-        "total_line_length": 0.0,
-        "circle_count": 0,
-        "circle_total_circumference": 0.0,
-        "arc_count": 0,
-        "arc_total_length": 0.0,
-        "polyline_count": 0,
-        "polyline_total_length": 0.0,
-        "closed_polyline_area": 0.0,
-        "door_count": 0,
-        "window_count": 0,
-        "column_count": 0,
-        "furniture_count": 0,
-        "other_block_count": 0,
-        "lines": [],
-    }
-
-    # ── LINE entities ────────────────────────────
-    for e in msp.query("LINE"):
-        x1, y1 = e.dxf.start.x, e.dxf.start.y
-        x2, y2 = e.dxf.end.x, e.dxf.end.y
-        length = math.dist((x1, y1), (x2, y2))
-        result["total_line_length"] += length
-        result["lines"].append({"x1": x1, "y1": y1, "x2": x2, "y2": y2})
-
-    # ── CIRCLE entities ──────────────────────────
-    for e in msp.query("CIRCLE"):
-        radius = e.dxf.radius
-        result["circle_count"] += 1
-        result["circle_total_circumference"] += 2 * math.pi * radius
-
-    # ── ARC entities ─────────────────────────────
-    for e in msp.query("ARC"):
-        radius = e.dxf.radius
-        start_angle = math.radians(e.dxf.start_angle)
-        end_angle = math.radians(e.dxf.end_angle)
-        # Handle angle wrapping
-        angle = end_angle - start_angle
-        if angle < 0:
-            angle += 2 * math.pi
-        arc_length = radius * angle
-        result["arc_count"] += 1
-        result["arc_total_length"] += arc_length
-
-    # ── LWPOLYLINE entities ──────────────────────
-    for e in msp.query("LWPOLYLINE"):
-        try:
-            # Get vertices
-            points = list(e.get_points(format="xy"))
-            if len(points) < 2:
-                continue
-
-            perimeter = 0.0
-            for i in range(len(points) - 1):
-                perimeter += math.dist(points[i], points[i + 1])
-
-            # If closed, add closing segment
-            if e.closed:
-                perimeter += math.dist(points[-1], points[0])
-
-            result["polyline_count"] += 1
-            result["polyline_total_length"] += perimeter
-
-            # Calculate area for closed polylines (Shoelace formula)
-            if e.closed and len(points) >= 3:
-                area = 0.0
-                n = len(points)
-                for i in range(n):
-                    j = (i + 1) % n
-                    area += points[i][0] * points[j][1]
-                    area -= points[j][0] * points[i][1]
-                area = abs(area) / 2.0
-                result["closed_polyline_area"] += area
-        except Exception:
-            # Skip malformed polylines
-            continue
+    - dedup: LINE segments removed as duplicates or merged into collinear
+      runs, and the length that removed (see segment_dedup); the line
+      totals, walls and geometry below are measured after dedup
+    - wall_count, wall_centerline_length, wall_thickness, wall_volume,
+      walls_by_thickness: walls found by pairing parallel faces on
+      WALL_LAYERS (see wall_detection); not including geometry inside
+      blocks, and all zero when no layer matches
+    - breakdown: the same quantities per "layer", "linetype" and "color"
+      ({group: {name: {key: value}}}, non-zero values only); block geometry
+      counts towards the INSERT's layer, linetype and color
+    - rooms: one entry per room (closed polyline) with its handle, layer,
+      area, perimeter and the quantities of the entities inside it
+      (only if rooms=True)
+    - outside_rooms: quantities of entities that lie in no room (only if
+      rooms=True)
+    - lines: LineGeometry with every LINE segment (only if include_lines=True)
 
-    # ── INSERT (block references) ────────────────
-    for e in msp.query("INSERT"):
-        block_name = e.dxf.name
-        if _match_block_type(block_name, DOOR_PATTERNS):
-            result["door_count"] += 1
-        elif _match_block_type(block_name, WINDOW_PATTERNS):
-            result["window_count"] += 1
-        elif _match_block_type(block_name, COLUMN_PATTERNS):
-            result["column_count"] += 1
-        elif _match_block_type(block_name, FURNITURE_PATTERNS):
-            result["furniture_count"] += 1
-        else:
-            result["other_block_count"] += 1
+    Spline and ellipse lengths and hatch areas come from adaptive
+    flattening to within FLATTEN_TOLERANCE (see curve_flattening); polyline
+    bulges are not flattened — segments run vertex to vertex.
 
-    # Round all float values
-    result["total_line_length"] = round(result["total_line_length"], 2)
-    result["circle_total_circumference"] = round(result["circle_total_circumference"], 2)
-    result["arc_total_length"] = round(result["arc_total_length"], 2)
-    result["polyline_total_length"] = round(result["polyline_total_length"], 2)
-    result["closed_polyline_area"] = round(result["closed_polyline_area"], 2)
+    Geometry and nested block references inside inserted blocks count
+    towards the totals, scaled by each INSERT and multiplied by MINSERT
+    rows x columns; block counts are multiplied the same way.
 
-    return result
+    Large files (STREAMING_THRESHOLD_BYTES and up, or streaming=True) are read
+    entity by entity from the ENTITIES section instead of loading the whole
+    document, so memory stays bounded by the collected coordinates and the
+    block definitions rather than by the size of the whole drawing.
+
+    Very large ASCII files (PARALLEL_THRESHOLD_BYTES and up, or
+    parallel=True) have their ENTITIES section split across worker
+    processes instead; the result is identical (see parallel_parse).
+    """
+    # Imported here: parallel_parse builds on this module
+    import parallel_parse
+
+    if parallel is None:
+        parallel = parallel_parse.should_parallelize(path)
+    metrics.inc("boq_dxf_bytes_parsed_total", os.path.getsize(path))
+    if parallel and _can_stream(path):
+        result = parallel_parse.parse_dxf_parallel(path, include_lines, rooms)
+        if result is not None:
+            return result
+
+    # Streaming reads happen lazily, inside the entity loop
+    with metrics.span("read"):
+        entities, blocks = open_drawing(path, streaming)
+    return parse_modelspace(entities, include_lines, blocks, rooms=rooms)
@@ -0,0 +1,218 @@
+"""
+CPU Pool — runs CPU-bound pipeline stages in worker processes.
+
+Parsing is pure Python and holds the GIL, so running it on the event loop
+(or in a thread) serializes every request. This pool hands those calls to
+pre-warmed worker processes, applies backpressure when too much work is
+already waiting, and bounds how long a caller waits for a result.
+
+A task that outlives the timeout is stopped, not just abandoned: the
+executor's worker processes are terminated and a fresh executor takes
+over, so a stuck drawing can't hold a worker and its slot. If a worker
+dies (killed for memory, a crash in a native library) the executor is
+broken for every task on it. It is replaced, and each of those tasks is
+retried once in a single-worker executor of its own, so only the task
+that killed the worker fails again — with WorkerCrashedError — and it
+can't take the others down with it a second time.
+
+Whatever a task records in metrics inside the worker is sent back with
+its result and merged into this process's registry.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+PARSE_MAX_QUEUE = int(os.getenv("PARSE_MAX_QUEUE", str(2 * PARSE_WORKERS)))
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", "300"))
+
+
+class PoolBusyError(Exception):
+    """Raised when the pool already has its maximum number of tasks in flight."""
+
+
+class TaskTimeoutError(Exception):
+    """Raised when a task does not finish within the configured timeout."""
+
+
+class WorkerCrashedError(Exception):
+    """Raised when the worker process running a task died, on both attempts."""
+
+
+def _warm_worker(range_workers: int) -> None:
+    """
+    Process initializer: pay the heavy imports once per worker, not per task,
+    and give the worker its share of the cores for parallel parsing.
+    """
+    import ezdxf  # noqa: F401
+    import numpy  # noqa: F401
+    import cad_parser  # noqa: F401
+    import boq_engine  # noqa: F401
+    import parallel_parse
+
+    parallel_parse.limit_workers(range_workers)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class CPUPool:
+    """
+    Bounded ProcessPoolExecutor wrapper.
+
+    At most workers + max_queue tasks are accepted at once; further calls
+    raise PoolBusyError. With workers=0 tasks run in the calling thread,
+    which keeps local development and debugging simple.
+    """
+
+    def __init__(self, workers: int, max_queue: int, timeout: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._executor = None
+        self._in_flight = 0
+        self._slots = threading.Condition()
+
+    # ── Lifecycle ────────────────────────────────
+
+    def _new_executor(self, workers: int = None) -> ProcessPoolExecutor:
+        # spawn: the server process runs threads, which don't mix with fork
+        return ProcessPoolExecutor(
+            max_workers=workers or self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+            initargs=((os.cpu_count() or 1) // max(self.workers, 1),),
+        )
+
+    def start(self) -> None:
+        """Create the worker processes and make sure they are all warm."""
+        if self.workers <= 0 or self._executor is not None:
+            return
+        self._executor = self._new_executor()
+        warmups = [self._executor.submit(_ping) for _ in range(self.workers)]
+        for future in warmups:
+            future.result()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def _stop(executor: ProcessPoolExecutor, kill: bool = False) -> None:
+        """
+        Shut an executor down. With kill, first terminate its workers: a
+        stuck one can't be stopped any other way, and the other tasks on it
+        fail with BrokenProcessPool and are retried.
+        """
+        if kill:
+            # ProcessPoolExecutor has no public handle on its processes
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+        # Not cancel_futures: queued tasks must fail as broken, to be retried
+        executor.shutdown(wait=False)
+
+    def _replace(self, executor: ProcessPoolExecutor, kill: bool = False) -> None:
+        """Stop an executor, putting a fresh one in its place if it is the pool's."""
+        with self._slots:
+            if self._executor is executor:
+                self._executor = self._new_executor()
+        self._stop(executor, kill)
+
+    # ── Submission ───────────────────────────────
+
+    def _release(self, _future=None) -> None:
+        with self._slots:
+            self._in_flight -= 1
+            self._slots.notify()
+
+    def _submit(self, executor, func, *args, wait: bool = False, **kwargs):
+        capacity = self.workers + self.max_queue
+        with self._slots:
+            if wait:
+                self._slots.wait_for(lambda: self._in_flight < capacity)
+            elif self._in_flight >= capacity:
+                raise PoolBusyError("Server is busy processing other drawings. Please retry shortly.")
+            self._in_flight += 1
+
+        try:
+            future = executor.submit(functools.partial(metrics.run_captured, func, *args, **kwargs))
+        except Exception:
+            self._release()
+            raise
+        # Released once the task is done, failed, or its worker was terminated
+        future.add_done_callback(self._release)
+        return future
+
+    def _crashed(self, executor, attempt: int) -> ProcessPoolExecutor:
+        """Replace a broken executor; return the one-off executor to retry in, or give up."""
+        self._replace(executor)
+        if attempt > 0:
+            raise WorkerCrashedError("Processing failed: the worker process stopped unexpectedly.")
+        return self._new_executor(workers=1)
+
+    def _timed_out(self, executor):
+        self._replace(executor, kill=True)
+        return TaskTimeoutError(f"Processing took longer than {self.timeout:.0f}s.")
+
+    async def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in a worker process without blocking the event loop."""
+        if self._executor is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+        executor = self._executor
+        for attempt in range(2):
+            try:
+                future = self._submit(executor, func, *args, **kwargs)
+                result, captured = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            except BrokenProcessPool:
+                executor = self._crashed(executor, attempt)
+                continue
+            except asyncio.TimeoutError:
+                raise self._timed_out(executor)
+            finally:
+                # The one-off retry executor goes however its task ended
+                if attempt:
+                    self._stop(executor)
+            metrics.merge(captured)
+            return result
+
+    def run_sync(self, func, *args, **kwargs):
+        """
+        Blocking variant of run() for callers that already live in a worker thread.
+
+        Instead of failing with PoolBusyError it waits for a free slot, since
+        background jobs have no client waiting on an immediate answer.
+        """
+        if self._executor is None:
+            return func(*args, **kwargs)
+
+        executor = self._executor
+        for attempt in range(2):
+            try:
+                future = self._submit(executor, func, *args, wait=True, **kwargs)
+                result, captured = future.result(self.timeout)
+            except BrokenProcessPool:
+                executor = self._crashed(executor, attempt)
+                continue
+            except FutureTimeoutError:
+                raise self._timed_out(executor)
+            finally:
+                # The one-off retry executor goes however its task ended
+                if attempt:
+                    self._stop(executor)
+            metrics.merge(captured)
+            return result
+
+
+cpu_pool = CPUPool(PARSE_WORKERS, PARSE_MAX_QUEUE, PARSE_TIMEOUT_SECONDS)
@@ -0,0 +1,291 @@
+"""
+Curve Flattening — lengths of SPLINEs and ELLIPSEs, areas of HATCHes.
+
+None of these has a closed-form measure the BOQ can use, so each is
+flattened adaptively into a polyline whose chords stay within
+FLATTEN_TOLERANCE of the true curve, and measured from that.
+
+Flattening costs far more than the rest of the parse per entity, and
+drawings repeat shapes: hatched tiles, copied fixtures, the same ellipse
+at every basin. Results are memoized on the shape itself, relative to the
+entity's own origin, so a translated copy is a cache hit. Every measure
+comes with a representative point (vertex centroid) relative to that
+origin, for room assignment.
+
+The shape is always rebuilt from its key before flattening, never taken
+from the entity at hand, so a result does not depend on which copy
+happened to be flattened first — parses that see the copies in another
+order (parallel chunks, a warm cache) get bit-identical measures.
+"""
+
+import os
+import threading
+
+import numpy as np
+from ezdxf import path as ezpath
+from ezdxf.entities import Hatch
+from ezdxf.math import BSpline, ConstructionEllipse, fit_points_to_cad_cv
+
+# Maximum distance between a flattened chord and the true curve, in drawing units
+FLATTEN_TOLERANCE = float(os.getenv("FLATTEN_TOLERANCE", "0.001"))
+
+# Distinct shapes remembered before the memo is reset
+MAX_CACHED_SHAPES = int(os.getenv("FLATTEN_CACHE_SIZE", "65536"))
+
+
+class FlatteningCache:
+    """Memo of shape key -> (measure, dx, dy), with hit counts."""
+
+    def __init__(self, max_shapes: int = MAX_CACHED_SHAPES):
+        self.max_shapes = max_shapes
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute) -> tuple:
+        """The cached result for key, computing (and storing) it on a miss."""
+        result = self._cache.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        result = compute()
+        with self._lock:
+            if len(self._cache) >= self.max_shapes:
+                self._cache.clear()
+            self._cache[key] = result
+            self.misses += 1
+        return result
+
+    def stats(self) -> dict:
+        return {"distinct_shapes": len(self._cache), "hits": self.hits, "flattened": self.misses}
+
+
+cache = FlatteningCache()
+
+
+def _polyline_measure(points: np.ndarray) -> tuple:
+    """(length, centroid x, centroid y) of flattened (n, 2+) points."""
+    if len(points) < 2:
+        return 0.0, 0.0, 0.0
+    length = float(np.hypot(*np.diff(points[:, :2], axis=0).T).sum())
+    cx, cy = points[:, :2].mean(axis=0).tolist()
+    return length, cx, cy
+
+
+def _points(vertices) -> np.ndarray:
+    return np.array([tuple(v) for v in vertices], dtype=np.float64).reshape(-1, 3)
+
+
+def _relative(points: np.ndarray, origin: np.ndarray) -> bytes:
+    return (points - origin).tobytes()
+
+
+# ── SPLINE ───────────────────────────────────
+
+def _flatten_spline(key: tuple) -> tuple:
+    _, degree, knots, weights, control, fit, tangents = key
+    control = np.frombuffer(control).reshape(-1, 3)
+    if len(control):
+        knots = np.frombuffer(knots)
+        weights = np.frombuffer(weights)
+        tool = BSpline(
+            control, order=degree + 1,
+            knots=knots if len(knots) else None,
+            weights=weights if len(weights) else None,
+        )
+    else:
+        tool = fit_points_to_cad_cv(np.frombuffer(fit).reshape(-1, 3), tangents=tangents)
+    return _polyline_measure(_points(tool.flattening(FLATTEN_TOLERANCE)))
+
+
+def spline_length(e) -> tuple:
+    """
+    (length, x, y) of a SPLINE: flattened length and vertex centroid.
+
+    Raises ValueError for splines with neither control nor fit points.
+    """
+    control = _points(e.control_points)
+    fit = _points(e.fit_points)
+    if not len(control) and not len(fit):
+        raise ValueError("SPLINE without control or fit points")
+    origin = control[0] if len(control) else fit[0]
+
+    dxf = e.dxf
+    tangents = None
+    if dxf.hasattr("start_tangent") and dxf.hasattr("end_tangent"):
+        tangents = (tuple(dxf.start_tangent), tuple(dxf.end_tangent))
+    key = (
+        "SPLINE", dxf.degree,
+        np.asarray(e.knots, dtype=np.float64).tobytes(),
+        np.asarray(e.weights, dtype=np.float64).tobytes(),
+        _relative(control, origin), _relative(fit, origin), tangents,
+    )
+    length, dx, dy = cache.get(key, lambda: _flatten_spline(key))
+    return length, origin[0] + dx, origin[1] + dy
+
+
+# ── ELLIPSE ──────────────────────────────────
+
+def _flatten_ellipse(key: tuple) -> tuple:
+    _, major_axis, ratio, start_param, end_param, extrusion = key
+    tool = ConstructionEllipse((0, 0, 0), major_axis, extrusion, ratio, start_param, end_param)
+    return _polyline_measure(_points(tool.flattening(FLATTEN_TOLERANCE)))
+
+
+def ellipse_length(e) -> tuple:
+    """(length, x, y) of an ELLIPSE or elliptical arc: flattened length and vertex centroid."""
+    dxf = e.dxf
+    center = dxf.center
+    key = (
+        "ELLIPSE", tuple(dxf.major_axis), dxf.ratio, dxf.start_param, dxf.end_param,
+        tuple(dxf.extrusion),
+    )
+    length, dx, dy = cache.get(key, lambda: _flatten_ellipse(key))
+    return length, center.x + dx, center.y + dy
+
+
+# ── HATCH ────────────────────────────────────
+
+def _inside(point: np.ndarray, polygon: np.ndarray) -> bool:
+    """Crossing-number point-in-polygon test."""
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    straddles = (y1 > point[1]) != (y2 > point[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = x1 + (point[1] - y1) * (x2 - x1) / (y2 - y1)
+    return int(np.count_nonzero(straddles & (point[0] < crossing_x))) % 2 == 1
+
+
+def _loops_area(loops: list) -> tuple:
+    """
+    (area, centroid x, centroid y) of boundary loops under the even-odd rule.
+
+    A loop nested inside an odd number of others is a hole (or an island
+    inside a hole is filled again), whatever order the paths come in.
+    """
+    loops = [loop for loop in loops if len(loop) >= 3]
+    if not loops:
+        return 0.0, 0.0, 0.0
+    areas = []
+    for loop in loops:
+        x, y = loop[:, 0], loop[:, 1]
+        areas.append(abs(float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))) / 2)
+
+    area = 0.0
+    for i, loop in enumerate(loops):
+        depth = sum(
+            1 for j, other in enumerate(loops)
+            if j != i and areas[j] > areas[i] and _inside(loop[0], other)
+        )
+        area += -areas[i] if depth % 2 else areas[i]
+
+    outer = loops[int(np.argmax(areas))]
+    cx, cy = outer.mean(axis=0).tolist()
+    return max(area, 0.0), cx, cy
+
+
+def _xy(points, origin: np.ndarray) -> bytes:
+    return (np.array([(p[0], p[1]) for p in points], dtype=np.float64).reshape(-1, 2) - origin).tobytes()
+
+
+def _edge_key(edge, origin: np.ndarray) -> tuple:
+    """One boundary edge, relative to origin; replayed by _add_edge."""
+    ox, oy = origin
+    kind = edge.type.name
+    if kind == "LINE":
+        return (kind, (edge.start[0] - ox, edge.start[1] - oy), (edge.end[0] - ox, edge.end[1] - oy))
+    center = (edge.center[0] - ox, edge.center[1] - oy) if kind in ("ARC", "ELLIPSE") else None
+    if kind == "ARC":
+        return (kind, center, edge.radius, edge.start_angle, edge.end_angle, edge.ccw)
+    if kind == "ELLIPSE":
+        return (kind, center, tuple(edge.major_axis), edge.ratio, edge.start_angle, edge.end_angle, edge.ccw)
+    return (
+        kind, edge.degree, edge.periodic,
+        np.asarray(edge.knot_values, dtype=np.float64).tobytes(),
+        np.asarray(edge.weights, dtype=np.float64).tobytes(),
+        _xy(edge.control_points, origin), _xy(edge.fit_points, origin),
+        tuple(edge.start_tangent) if edge.start_tangent else None,
+        tuple(edge.end_tangent) if edge.end_tangent else None,
+    )
+
+
+def _add_edge(path, key: tuple) -> None:
+    kind = key[0]
+    if kind == "LINE":
+        path.add_line(key[1], key[2])
+    elif kind == "ARC":
+        path.add_arc(*key[1:])
+    elif kind == "ELLIPSE":
+        path.add_ellipse(*key[1:])
+    else:
+        _, degree, periodic, knots, weights, control, fit, start_tangent, end_tangent = key
+        path.add_spline(
+            fit_points=np.frombuffer(fit).reshape(-1, 2).tolist() or None,
+            control_points=np.frombuffer(control).reshape(-1, 2).tolist() or None,
+            knot_values=np.frombuffer(knots).tolist() or None,
+            weights=np.frombuffer(weights).tolist() or None,
+            degree=degree, periodic=periodic,
+            start_tangent=start_tangent, end_tangent=end_tangent,
+        )
+
+
+def _boundary_origin(paths) -> np.ndarray:
+    """First point of the first boundary path, in OCS."""
+    for boundary in paths:
+        vertices = getattr(boundary, "vertices", None)
+        if vertices:
+            return np.array(vertices[0][:2], dtype=np.float64)
+        for edge in getattr(boundary, "edges", ()):
+            point = getattr(edge, "start", None)
+            if point is None:
+                point = getattr(edge, "center", None)
+            if point is None and getattr(edge, "control_points", None):
+                point = edge.control_points[0]
+            if point is None and getattr(edge, "fit_points", None):
+                point = edge.fit_points[0]
+            if point is not None:
+                return np.array((point[0], point[1]), dtype=np.float64)
+    return np.zeros(2)
+
+
+def _boundary_key(paths, origin: np.ndarray) -> tuple:
+    """Boundary path data relative to origin, as a hashable key."""
+    key = []
+    for boundary in paths:
+        vertices = getattr(boundary, "vertices", None)
+        if vertices is not None:
+            xyb = np.array(vertices, dtype=np.float64).reshape(-1, 3)
+            xyb[:, :2] -= origin
+            key.append(("P", boundary.is_closed, xyb.tobytes()))
+        else:
+            key.append(("E", tuple(_edge_key(edge, origin) for edge in boundary.edges)))
+    return ("HATCH", tuple(key))
+
+
+def _flatten_hatch(key: tuple) -> tuple:
+    hatch = Hatch.new()
+    for boundary in key[1]:
+        if boundary[0] == "P":
+            hatch.paths.add_polyline_path(np.frombuffer(boundary[2]).reshape(-1, 3).tolist(), boundary[1])
+        else:
+            path = hatch.paths.add_edge_path()
+            for edge in boundary[1]:
+                _add_edge(path, edge)
+    loops = [_points(p.flattening(FLATTEN_TOLERANCE))[:, :2] for p in ezpath.from_hatch_ocs(hatch)]
+    return _loops_area(loops)
+
+
+def hatch_area(e) -> tuple:
+    """
+    (area, x, y) of a HATCH: the filled area of its boundary paths and the
+    vertex centroid of its outermost loop.
+
+    Boundaries are measured in the hatch's own plane (OCS); the area does
+    not depend on where that plane sits.
+    """
+    paths = e.paths.paths
+    origin = _boundary_origin(paths)
+    key = _boundary_key(paths, origin)
+    area, dx, dy = cache.get(key, lambda: _flatten_hatch(key))
+    return area, origin[0] + dx, origin[1] + dy
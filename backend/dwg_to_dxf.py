@@ -2,6 +2,12 @@ import subprocess
 import os
 import platform
 import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import Future
+
+import metrics
 
 # Dynamic ODA Path Resolution
 def get_oda_converter_path():
@@ -28,39 +34,172 @@ def get_oda_converter_path():
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "converted")
 
+# Per-job ODA workspaces are created (and removed) under this directory
+WORK_DIR = os.getenv("ODA_WORK_DIR", tempfile.gettempdir())
+
+# Requests arriving within this window share one ODA invocation
+BATCH_WINDOW_SECONDS = float(os.getenv("ODA_BATCH_WINDOW_SECONDS", "0.05"))
+MAX_BATCH_SIZE = int(os.getenv("ODA_MAX_BATCH_SIZE", "16"))
+
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def convert_dwg_to_dxf(dwg_path):
+def _stage_input(src, dst):
+    """Place a DWG into a workspace, hard-linking when possible to avoid a copy."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _default_output_path(dwg_path):
+    stem = os.path.splitext(os.path.basename(dwg_path))[0]
+    return os.path.join(OUTPUT_DIR, f"{stem}-{uuid.uuid4().hex[:8]}.dxf")
+
+
+def convert_batch(jobs):
+    """
+    Convert several DWGs with a single ODAFileConverter invocation.
+
+    Each batch gets its own temporary workspace holding only its inputs, so
+    the cost depends on these drawings alone and concurrent batches never
+    see each other's files. The workspace is removed afterwards. If ODA
+    fails on a batch of several drawings, each is converted again on its
+    own, so only the drawing that broke the run reports the error.
+
+    Args:
+        jobs: list of (dwg_path, output_path) tuples; output_path may be None
+
+    Returns:
+        list with, per job, either the DXF path or the exception it failed with
+    """
     oda_path = get_oda_converter_path()
-    
+
     if not oda_path:
         # Fallback error if converter is missing
-        raise FileNotFoundError(
+        error = FileNotFoundError(
             "ODAFileConverter not found. Please install ODA File Converter "
             "and ensure it is in your system PATH, or upload a DXF file directly."
         )
+        return [error] * len(jobs)
+
+    workspace = tempfile.mkdtemp(prefix="oda-", dir=WORK_DIR)
+    in_dir = os.path.join(workspace, "in")
+    out_dir = os.path.join(workspace, "out")
+    os.makedirs(in_dir)
+    os.makedirs(out_dir)
 
-    cmd = [
-        oda_path,
-        os.path.dirname(dwg_path),  # Input Directory
-        OUTPUT_DIR,                 # Output Directory
-        "ACAD2018",                 # Version
-        "DXF",                      # Output Format
-        "0",                        # Recurse
-        "1"                         # Audit
-    ]
-    
-    # Run conversion
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"ODA Converter failed: {e.stderr.decode() if e.stderr else 'Unknown error'}")
+        # Inputs are renamed by position so identical upload names can't collide
+        for i, (dwg_path, _) in enumerate(jobs):
+            _stage_input(dwg_path, os.path.join(in_dir, f"{i}.dwg"))
 
-    filename = os.path.basename(dwg_path).replace(".dwg", ".dxf")
-    dxf_path = os.path.join(OUTPUT_DIR, filename)
-    
-    if not os.path.exists(dxf_path):
-        raise FileNotFoundError(f"Conversion failed: output file {dxf_path} not created.")
+        cmd = [
+            oda_path,
+            in_dir,      # Input Directory
+            out_dir,     # Output Directory
+            "ACAD2018",  # Version
+            "DXF",       # Output Format
+            "0",         # Recurse
+            "1"          # Audit
+        ]
+
+        # Run conversion
+        try:
+            with metrics.span("convert"):
+                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except subprocess.CalledProcessError as e:
+            if len(jobs) > 1:
+                return [convert_batch([job])[0] for job in jobs]
+            return [RuntimeError(f"ODA Converter failed: {e.stderr.decode() if e.stderr else 'Unknown error'}")]
+
+        results = []
+        for i, (dwg_path, output_path) in enumerate(jobs):
+            converted = os.path.join(out_dir, f"{i}.dxf")
+            if not os.path.exists(converted):
+                results.append(FileNotFoundError(
+                    f"Conversion failed: no DXF produced for {os.path.basename(dwg_path)}."
+                ))
+                continue
+            target = output_path or _default_output_path(dwg_path)
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            shutil.move(converted, target)
+            results.append(target)
+        return results
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+class ConversionBatcher:
+    """
+    Collects concurrently submitted conversions and runs them in one ODA call.
+
+    The first submission opens a short batching window; everything queued
+    before it closes (up to max_batch) is converted together.
+    """
+
+    def __init__(self, window_seconds, max_batch):
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._pending = []
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def submit(self, dwg_path, output_path=None) -> Future:
+        future = Future()
+        with self._cond:
+            self._pending.append((dwg_path, output_path, future))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._worker = None
+                    return
+                # Give other requests a moment to join this batch
+                self._cond.wait_for(
+                    lambda: len(self._pending) >= self.max_batch,
+                    timeout=self.window_seconds,
+                )
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+
+            try:
+                results = convert_batch([(dwg, out) for dwg, out, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for (_, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+_batcher = ConversionBatcher(BATCH_WINDOW_SECONDS, MAX_BATCH_SIZE)
+
+
+def submit_conversion(dwg_path, output_path=None) -> Future:
+    """
+    Queue a DWG for conversion and return a Future of the DXF path.
+
+    Conversions submitted together (e.g. every DWG of a batch upload) are
+    converted in as few ODA runs as MAX_BATCH_SIZE allows.
+    """
+    return _batcher.submit(dwg_path, output_path)
+
+
+def convert_dwg_to_dxf(dwg_path, output_path=None):
+    """
+    Convert a single DWG to DXF and return the DXF path.
 
-    return dxf_path
+    The conversion runs in an isolated workspace, batched with any other
+    conversions submitted at the same time. Without output_path the DXF is
+    written to a uniquely named file in OUTPUT_DIR.
+    """
+    return submit_conversion(dwg_path, output_path).result()
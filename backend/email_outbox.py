@@ -0,0 +1,280 @@
+"""
+Email Outbox — BOQ report emails sent in the background, with retries.
+
+Requests only record the email in a SQLite outbox and return; worker
+threads send it. A send that fails for a transient reason (timeout,
+rate limit, Gmail 5xx) is retried with exponential backoff, doubling
+from OUTBOX_BACKOFF_SECONDS up to OUTBOX_MAX_BACKOFF_SECONDS, until
+OUTBOX_MAX_ATTEMPTS is reached. A permanent rejection fails at once.
+
+A client that may retry a request sends an idempotency key with it.
+Enqueuing a key that is already queued, in flight or sent returns the
+existing email instead of sending it again; only a failed one is
+re-queued. Without a key every request sends its own email: the same
+report to the same person is a legitimate re-send, not a duplicate. A
+send interrupted by a crash is retried, so a message may (rarely)
+arrive twice, but never once per retry of the request.
+
+Like the job queue, access tokens are held in memory only: an email
+still waiting when the process restarts is marked failed. Finished rows
+are deleted after OUTBOX_RETENTION_SECONDS.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+import metrics
+
+OUTBOX_DB = os.getenv("OUTBOX_DB", os.path.join(os.path.dirname(__file__), "outbox.sqlite3"))
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "5"))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", "600"))
+OUTBOX_RETENTION_SECONDS = float(os.getenv("OUTBOX_RETENTION_SECONDS", str(7 * 24 * 60 * 60)))
+
+# Email states
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+# Longest a worker sleeps before looking for due retries and expired rows
+_POLL_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id               TEXT PRIMARY KEY,
+    idempotency_key  TEXT NOT NULL UNIQUE,
+    status           TEXT NOT NULL,
+    recipient        TEXT NOT NULL,
+    payload          TEXT NOT NULL,
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at  REAL NOT NULL,
+    message_id       TEXT,
+    error            TEXT,
+    created_at       REAL NOT NULL,
+    updated_at       REAL NOT NULL
+)
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)"
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay before the next try after `attempts` failed ones."""
+    return min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF_SECONDS)
+
+
+class EmailOutbox:
+    """
+    SQLite-backed outbox drained by a pool of worker threads.
+
+    The sender is called as sender(access_token, recipient, boq_data) in a
+    worker thread and returns the provider's message id. It raises one of
+    `permanent_errors` when retrying cannot help; any other exception is
+    retried.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        sender: Callable,
+        workers: int = OUTBOX_WORKERS,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        permanent_errors: tuple = (),
+    ):
+        self.db_path = db_path
+        self.sender = sender
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.permanent_errors = permanent_errors
+
+        self._secrets = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            conn.execute(_INDEX)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ── Lifecycle ────────────────────────────────
+
+    def start(self) -> None:
+        """Settle emails left over from a previous run and start the workers."""
+        if self._threads:
+            return
+
+        # Their access tokens went with the previous process
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?)",
+                (FAILED, "Interrupted by a server restart before it could be sent.",
+                 time.time(), QUEUED, SENDING),
+            )
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"outbox-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # ── Public API ───────────────────────────────
+
+    def enqueue(
+        self, access_token: str, recipient: str, boq_data: list, idempotency_key: Optional[str] = None,
+    ) -> dict:
+        """
+        Queue a BOQ email, or return the existing one with the same idempotency key.
+
+        Without a key the email is always queued.
+
+        Returns:
+            the email's status, as get() reports it
+        """
+        # Keyless emails get a key of their own, so they never match another
+        key = idempotency_key or f"email-{uuid.uuid4().hex}"
+        now = time.time()
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT id, status FROM outbox WHERE idempotency_key = ?", (key,)).fetchone()
+            if row is None:
+                email_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO outbox (id, idempotency_key, status, recipient, payload, "
+                    "next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (email_id, key, QUEUED, recipient, json.dumps(boq_data), now, now, now),
+                )
+            elif row["status"] == FAILED:
+                # Asked again after giving up: start over with the new token
+                email_id = row["id"]
+                conn.execute(
+                    "UPDATE outbox SET status = ?, recipient = ?, payload = ?, attempts = 0, "
+                    "next_attempt_at = ?, error = NULL, updated_at = ? WHERE id = ?",
+                    (QUEUED, recipient, json.dumps(boq_data), now, now, email_id),
+                )
+            else:
+                email_id = None
+            if email_id is not None:
+                self._secrets[email_id] = access_token
+                self._wakeup.notify()
+
+        return self.get(email_id or row["id"])
+
+    def get(self, email_id: str) -> Optional[dict]:
+        """Return an email's delivery status, or None if unknown."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, recipient, attempts, next_attempt_at, message_id, error, "
+                "created_at, updated_at FROM outbox WHERE id = ?",
+                (email_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        status = row["status"]
+        if status == SENT:
+            message = f"BOQ report sent to {row['recipient']}"
+        elif status == FAILED:
+            message = f"Failed to send email: {row['error']}"
+        else:
+            message = f"BOQ report queued for {row['recipient']}"
+        return {
+            # Queued emails count as a success for clients that only check this flag
+            "success": status != FAILED,
+            "email_id": row["id"],
+            "status": status,
+            "message": message,
+            "message_id": row["message_id"],
+            "attempts": row["attempts"],
+            "next_attempt_at": row["next_attempt_at"] if status == QUEUED else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    # ── Worker ───────────────────────────────────
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Mark the next due email as sending and return it; None if nothing is due."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, recipient, payload, attempts FROM outbox "
+                "WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT 1",
+                (QUEUED, time.time()),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE outbox SET status = ?, updated_at = ? WHERE id = ?",
+                    (SENDING, time.time(), row["id"]),
+                )
+        return row
+
+    def _next_due(self) -> Optional[float]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = ?", (QUEUED,)
+            ).fetchone()
+        return row[0]
+
+    def _sweep(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM outbox WHERE status IN (?, ?) AND updated_at < ?",
+                (SENT, FAILED, time.time() - OUTBOX_RETENTION_SECONDS),
+            )
+
+    def _work(self) -> None:
+        last_sweep = 0.0
+        while True:
+            if time.time() - last_sweep > _POLL_SECONDS:
+                self._sweep()
+                last_sweep = time.time()
+
+            with self._lock:
+                row = self._claim()
+                if row is None:
+                    due = self._next_due()
+                    delay = _POLL_SECONDS if due is None else min(max(due - time.time(), 0.0), _POLL_SECONDS)
+                    self._wakeup.wait(delay)
+                    continue
+                access_token = self._secrets.get(row["id"])
+
+            self._send(row, access_token)
+
+    def _send(self, row: sqlite3.Row, access_token: Optional[str]) -> None:
+        email_id = row["id"]
+        attempts = row["attempts"] + 1
+        now = time.time()
+
+        if access_token is None:
+            status, message_id, error = FAILED, None, "The access token is no longer available."
+        else:
+            try:
+                with metrics.span("email"):
+                    message_id = self.sender(access_token, row["recipient"], json.loads(row["payload"]))
+                status, error = SENT, None
+            except self.permanent_errors as e:
+                status, message_id, error = FAILED, None, str(e)
+            except Exception as e:
+                message_id, error = None, str(e)
+                status = FAILED if attempts >= self.max_attempts else QUEUED
+        metrics.inc("boq_emails_total", outcome="retry" if status == QUEUED else status)
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, message_id = ?, "
+                "error = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, now + backoff_seconds(attempts), message_id, error, time.time(), email_id),
+            )
+            if status != QUEUED:
+                self._secrets.pop(email_id, None)
@@ -0,0 +1,87 @@
+"""
+Geometry Kernels — vectorized NumPy reductions for quantity takeoff.
+
+The parser collects raw coordinates into flat float64 buffers while it walks
+the drawing; these kernels then turn whole buffers into lengths and areas in
+a handful of array operations instead of one Python call per vertex.
+
+Polylines are stored "ragged": all vertices concatenated into one (n, 2)
+array, plus an offsets array where polyline j owns vertices
+offsets[j]:offsets[j + 1]. Every polyline has at least two vertices.
+"""
+
+import numpy as np
+
+
+def as_array(buffer, columns: int = 1) -> np.ndarray:
+    """View an array('d') buffer as a float64 ndarray without copying."""
+    arr = np.frombuffer(buffer, dtype=np.float64) if len(buffer) else np.empty(0, dtype=np.float64)
+    return arr.reshape(-1, columns) if columns > 1 else arr
+
+
+def segment_lengths(coords: np.ndarray) -> np.ndarray:
+    """Lengths of segments given as an (n, 4) array of x1, y1, x2, y2."""
+    return np.hypot(coords[:, 2] - coords[:, 0], coords[:, 3] - coords[:, 1])
+
+
+def circle_circumferences(radii: np.ndarray) -> np.ndarray:
+    return 2 * np.pi * radii
+
+
+def arc_lengths(params: np.ndarray) -> np.ndarray:
+    """
+    Arc lengths from an (n, 3) array of radius, start angle, end angle (degrees).
+
+    Counter-clockwise sweeps that cross 0° are wrapped the same way AutoCAD does.
+    """
+    sweep = np.radians(params[:, 2]) - np.radians(params[:, 1])
+    sweep = np.where(sweep < 0, sweep + 2 * np.pi, sweep)
+    return params[:, 0] * sweep
+
+
+def _polyline_starts(offsets: np.ndarray) -> np.ndarray:
+    return offsets[:-1]
+
+
+def _intra_polyline_mask(vertex_count: int, offsets: np.ndarray) -> np.ndarray:
+    """Mask over consecutive-vertex pairs that stay within one polyline."""
+    mask = np.ones(max(vertex_count - 1, 0), dtype=bool)
+    # Pair (i, i + 1) crosses into the next polyline when i + 1 is a start
+    crossings = offsets[1:-1] - 1
+    mask[crossings] = False
+    return mask
+
+
+def polyline_perimeters(xy: np.ndarray, offsets: np.ndarray, closed: np.ndarray) -> np.ndarray:
+    """Per-polyline perimeters, including the closing segment of closed polylines."""
+    if len(offsets) < 2:
+        return np.empty(0, dtype=np.float64)
+
+    starts = _polyline_starts(offsets)
+    ends = offsets[1:] - 1
+
+    seg = np.hypot(np.diff(xy[:, 0]), np.diff(xy[:, 1]))
+    seg[~_intra_polyline_mask(len(xy), offsets)] = 0.0
+    # Each polyline has >= 2 vertices, so every start indexes a real segment
+    perimeters = np.add.reduceat(seg, starts) if len(seg) else np.zeros(len(starts))
+
+    closing = np.hypot(xy[ends, 0] - xy[starts, 0], xy[ends, 1] - xy[starts, 1])
+    return perimeters + np.where(closed, closing, 0.0)
+
+
+def shoelace_areas(xy: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Unsigned areas of the polygons described by each polyline's vertices."""
+    if len(offsets) < 2:
+        return np.empty(0, dtype=np.float64)
+
+    starts = _polyline_starts(offsets)
+    ends = offsets[1:] - 1
+    x, y = xy[:, 0], xy[:, 1]
+
+    cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+    cross[~_intra_polyline_mask(len(xy), offsets)] = 0.0
+    twice_area = np.add.reduceat(cross, starts) if len(cross) else np.zeros(len(starts))
+
+    # Closing edge from the last vertex back to the first
+    twice_area += x[ends] * y[starts] - x[starts] * y[ends]
+    return np.abs(twice_area) / 2.0
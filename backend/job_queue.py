@@ -0,0 +1,204 @@
+"""
+Job Queue — background execution of the convert → parse → BOQ → email pipeline.
+
+Jobs are persisted in SQLite so queued and interrupted work is picked up
+again after a restart. A fixed pool of worker threads drains the queue;
+each stage's status is written back as it changes so clients can poll.
+
+OAuth access tokens are never written to disk: they are held in memory
+for the lifetime of the process only, so a job recovered after a restart
+runs without its email stage.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(os.path.dirname(__file__), "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+
+STAGES = ("convert", "parse", "boq", "email")
+
+# Job / stage states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+PENDING = "pending"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    stages      TEXT NOT NULL,
+    params      TEXT NOT NULL,
+    result      TEXT,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+)
+"""
+
+
+class QueueFullError(Exception):
+    """Raised when JOB_MAX_PENDING jobs are already waiting."""
+
+
+class JobQueue:
+    """
+    SQLite-backed queue with a bounded pool of worker threads.
+
+    The runner is called as runner(params, secrets, progress) in a worker
+    thread, where progress(stage, status) records per-stage state. Its
+    return value is stored as the job result.
+    """
+
+    def __init__(self, db_path: str, runner: Callable, workers: int, max_pending: int):
+        self.db_path = db_path
+        self.runner = runner
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._queue = queue.Queue()
+        self._secrets = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ── Lifecycle ────────────────────────────────
+
+    def start(self) -> None:
+        """Re-queue unfinished jobs from a previous run and start the workers."""
+        if self._threads:
+            return
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING),
+            ).fetchall()
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (QUEUED, time.time(), RUNNING),
+            )
+        for row in rows:
+            self._queue.put(row["id"])
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # ── Public API ───────────────────────────────
+
+    def submit(self, params: dict, secrets: Optional[dict] = None) -> str:
+        """Persist a new job and queue it. Raises QueueFullError under backpressure."""
+        if self._queue.qsize() >= self.max_pending:
+            raise QueueFullError("Too many drawings are waiting to be processed.")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        stages = {stage: PENDING for stage in STAGES}
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, stages, params, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(stages), json.dumps(params), now, now),
+            )
+        if secrets:
+            with self._lock:
+                self._secrets[job_id] = secrets
+
+        self._queue.put(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Return a job's status, per-stage progress and result, or None if unknown."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        stages = json.loads(row["stages"])
+        finished = sum(1 for status in stages.values() if status in (DONE, SKIPPED))
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "progress": round(finished / len(stages), 2),
+            "stages": stages,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    # ── Worker ───────────────────────────────────
+
+    def _set_stage(self, job_id: str, stage: str, status: str) -> None:
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            stages = json.loads(row["stages"])
+            stages[stage] = status
+            conn.execute(
+                "UPDATE jobs SET stages = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(stages), time.time(), job_id),
+            )
+
+    def _finish(self, job_id: str, status: str, result=None, error=None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error,
+                 time.time(), job_id),
+            )
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str) -> None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, time.time(), job_id),
+            )
+        params = json.loads(row["params"])
+        with self._lock:
+            secrets = self._secrets.pop(job_id, {})
+
+        current = {"stage": None}
+
+        def progress(stage: str, status: str) -> None:
+            current["stage"] = stage
+            self._set_stage(job_id, stage, status)
+
+        try:
+            result = self.runner(params, secrets, progress)
+        except Exception as e:
+            if current["stage"]:
+                self._set_stage(job_id, current["stage"], FAILED)
+            self._finish(job_id, FAILED, error=str(e))
+            return
+
+        self._finish(job_id, DONE, result=result)
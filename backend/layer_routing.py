@@ -0,0 +1,83 @@
+"""
+Layer Routing — decides which BOQ component each layer's quantities feed.
+
+By default every layer's line length is priced as wall conduits, its
+closed-polyline area as floor area, and so on (see boq_engine.BOQ_ITEMS).
+A layer map overrides that per layer, e.g.:
+
+    {
+        "E-LIGHTING*": {"total_line_length": "wiring_runs"},
+        "A-CEILING":   {"total_line_length": "ceiling_runs"},
+        "*-DIMS":      null,
+        "DEFPOINTS":   null
+    }
+
+Keys are layer-name patterns (fnmatch wildcards, case-insensitive, first
+match wins). A value maps parse_dxf quantity keys to rate component keys,
+where null leaves that quantity out of the BOQ; a null value drops the
+whole layer. Quantities a rule doesn't mention keep their default routing.
+
+The server-wide map is read from LAYER_MAP_FILE; /reprice can pass its own.
+"""
+
+import fnmatch
+import json
+import os
+
+LAYER_MAP_FILE = os.getenv("LAYER_MAP_FILE", "")
+
+# Rule key standing for "every quantity of this layer"
+ALL_QUANTITIES = "*"
+
+
+def load_layer_map(path: str) -> dict:
+    """Load a {layer pattern: rule} JSON file, preserving pattern order."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class LayerMap:
+    """Ordered layer-pattern rules with a per-layer-name memo."""
+
+    def __init__(self, rules: dict):
+        if not isinstance(rules, dict):
+            raise ValueError("Layer map must be an object of layer pattern -> rule.")
+
+        self._rules = []
+        for pattern, rule in rules.items():
+            if rule is None:
+                rule = {ALL_QUANTITIES: None}
+            if not isinstance(rule, dict) or not all(
+                isinstance(component, str) or component is None for component in rule.values()
+            ):
+                raise ValueError(
+                    f"Layer map rule for {pattern!r} must map quantity keys to component keys or null."
+                )
+            self._rules.append((pattern.upper(), rule))
+        self._cache = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._rules)
+
+    def components(self) -> set:
+        """Every component key the rules route quantities to."""
+        return {c for _, rule in self._rules for c in rule.values() if c is not None}
+
+    def rule(self, layer: str) -> dict:
+        """The overrides for a layer ({} when no pattern matches it)."""
+        rule = self._cache.get(layer)
+        if rule is None:
+            name = layer.upper()
+            rule = next((r for pattern, r in self._rules if fnmatch.fnmatchcase(name, pattern)), {})
+            self._cache[layer] = rule
+        return rule
+
+    def route(self, layer: str, quantity_key: str, default):
+        """Component key a layer's quantity is priced under, or None to leave it out."""
+        rule = self.rule(layer)
+        if quantity_key in rule:
+            return rule[quantity_key]
+        return rule.get(ALL_QUANTITIES, default)
+
+
+layer_map = LayerMap(load_layer_map(LAYER_MAP_FILE) if LAYER_MAP_FILE else {})
@@ -1,7 +1,11 @@
-from fastapi import FastAPI, UploadFile, Form
+from fastapi import FastAPI, UploadFile, Form, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-import shutil, os, sys
-from typing import Optional
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio, json, os, sys, time, zipfile
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
 
 from dotenv import load_dotenv
 
@@ -15,14 +19,34 @@ sys.path.append(root_path)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from dwg_to_dxf import convert_dwg_to_dxf
+    from dwg_to_dxf import convert_dwg_to_dxf, submit_conversion
 except ImportError:
     # Fallback if dwg_to_dxf is in the same directory
-    from .dwg_to_dxf import convert_dwg_to_dxf
+    from .dwg_to_dxf import convert_dwg_to_dxf, submit_conversion
 
+from cad_format import sniff_format, DWG, DXF_ASCII, DXF_BINARY
 from cad_parser import parse_dxf
-from boq_engine import generate_boq
-from email_service import send_boq_email
+from boq_engine import generate_boq, generate_room_boq
+from layer_routing import LayerMap
+from rate_database import get_all_rates, list_rate_sets, rate_store
+from email_service import send_boq_email, PermanentEmailError
+from email_outbox import EmailOutbox, OUTBOX_DB
+from report_renderer import EXTENSIONS, MEDIA_TYPES, stream as stream_report
+from result_cache import result_cache, cache_key, cache_sweeper
+from upload_ingest import (
+    IngestedUpload, UploadTooLargeError, UPLOAD_MAX_BYTES, declared_too_large, ingest_upload, upload_sweeper,
+)
+from batch_processing import (
+    BatchTooLargeError, BATCH_MAX_BYTES, BATCH_MAX_FILES, aggregate_quantities, expand_zip, is_zip,
+)
+from cpu_pool import cpu_pool, PoolBusyError, TaskTimeoutError, WorkerCrashedError
+import metrics
+from metrics import MetricsMiddleware, PROFILE_DIR, PROFILING_ENABLED, profiled
+from revision_diff import diff_revision, quantity_delta, boq_delta
+from job_queue import (
+    JobQueue, QueueFullError, JOBS_DB, JOB_WORKERS, JOB_MAX_PENDING,
+    RUNNING, DONE, SKIPPED,
+)
 
 app = FastAPI()
 
@@ -34,36 +58,555 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+@app.middleware("http")
+async def _limit_upload_size(request: Request, call_next):
+    """Turn away uploads whose declared length is over the limit before reading the body."""
+    max_bytes = BATCH_MAX_BYTES if request.url.path == "/batch" else UPLOAD_MAX_BYTES
+    if declared_too_large(request.headers.get("content-length"), max_bytes):
+        return JSONResponse(status_code=413, content={"detail": str(UploadTooLargeError(max_bytes))})
+    return await call_next(request)
+
+
+# Added last, so it is outermost and sees every response, rejections included
+app.add_middleware(MetricsMiddleware)
+
+
+async def _ingest(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> IngestedUpload:
+    """Stream an upload to disk and hash it, turning an oversized one into a 413."""
+    try:
+        with metrics.span("upload"):
+            return await ingest_upload(file, max_bytes=max_bytes)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def _stage_upload(upload: IngestedUpload) -> Optional[str]:
+    """
+    Put an ingested upload where the pipeline expects it.
+
+    DXF uploads are moved into the DXF cache tier and their path is
+    returned. DWG uploads stay where they were ingested and None is
+    returned, meaning they still need converting.
+    """
+    file_format = sniff_format(upload.head)
+
+    if file_format in (DXF_ASCII, DXF_BINARY):
+        # DXF uploads are parsed as-is — no ODA round trip
+        return result_cache.adopt_dxf(upload.digest, upload.path)
+
+    if file_format == DWG:
+        return None
+
+    upload.discard()
+    raise HTTPException(
+        status_code=400,
+        detail="Unrecognised file format. Please upload a .dwg or .dxf drawing.",
+    )
+
+
+async def _dxf_for_upload(upload: IngestedUpload) -> str:
+    """
+    The DXF for an ingested upload: already cached, moved into the cache, or
+    converted from DWG. The uploaded file is gone afterwards.
+    """
+    try:
+        dxf_path = result_cache.get_dxf(upload.digest)
+        if dxf_path is None:
+            dxf_path = _stage_upload(upload)
+            if dxf_path is None:
+                # Convert DWG -> DXF automatically (subprocess — keep it off the event loop)
+                dxf_path = await run_in_threadpool(
+                    convert_dwg_to_dxf, upload.path, result_cache.dxf_path(upload.digest)
+                )
+        return dxf_path
+    finally:
+        upload.discard()
+
+
+def _rate_table(rate_set: Optional[str]) -> dict:
+    """Resolve a rate set name, turning an unknown one into a 400."""
+    try:
+        return get_all_rates(rate_set)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+
+
+def _run_job(params: dict, secrets: dict, progress) -> dict:
+    """Job worker: convert → parse → BOQ → email, reporting each stage."""
+    digest = params["digest"]
+    result_id = cache_key(digest)
+
+    raw_data = result_cache.get(result_id)
+    cache_hit = raw_data is not None
+    metrics.inc("boq_result_cache_total", outcome="hit" if cache_hit else "miss")
+
+    if cache_hit:
+        progress("convert", SKIPPED)
+        progress("parse", SKIPPED)
+    else:
+        dxf_path = result_cache.get_dxf(digest)
+        if dxf_path is None:
+            progress("convert", RUNNING)
+            dxf_path = convert_dwg_to_dxf(params["dwg_path"], result_cache.dxf_path(digest))
+            os.remove(params["dwg_path"])
+            progress("convert", DONE)
+        else:
+            progress("convert", SKIPPED)
+
+        progress("parse", RUNNING)
+        with metrics.span("parse"):
+            raw_data = cpu_pool.run_sync(parse_dxf, dxf_path)
+        result_cache.put(result_id, raw_data)
+        progress("parse", DONE)
+
+    progress("boq", RUNNING)
+    with metrics.span("boq"):
+        boq = generate_boq(raw_data, rate_set=params.get("rate_set"))
+    progress("boq", DONE)
+
+    email_status = None
+    if secrets.get("access_token") and secrets.get("user_email"):
+        # Handed to the outbox; delivery is tracked under /emails/{email_id}
+        progress("email", RUNNING)
+        email_status = email_outbox.enqueue(
+            secrets["access_token"], secrets["user_email"], boq, secrets.get("idempotency_key")
+        )
+        progress("email", DONE)
+    else:
+        progress("email", SKIPPED)
+
+    return {
+        "boq": boq,
+        "email_status": email_status,
+        "result_id": result_id,
+        "cache_hit": cache_hit,
+    }
+
+
+email_outbox = EmailOutbox(OUTBOX_DB, send_boq_email, permanent_errors=(PermanentEmailError,))
+job_queue = JobQueue(JOBS_DB, _run_job, JOB_WORKERS, JOB_MAX_PENDING)
+
+
+@app.on_event("startup")
+def _start_workers():
+    rate_store.start_watching()
+    cpu_pool.start()
+    upload_sweeper.start()
+    cache_sweeper.start()
+    email_outbox.start()
+    job_queue.start()
+
+
+@app.on_event("shutdown")
+def _stop_workers():
+    cpu_pool.shutdown()
+
 
 @app.post("/process")
 async def process(
     file: UploadFile,
     access_token: Optional[str] = Form(None),
     user_email: Optional[str] = Form(None),
+    include_geometry: bool = Form(False),
+    rate_set: Optional[str] = Form(None),
+    group_by_room: bool = Form(False),
+    profile: bool = Form(False),
+    idempotency_key: Optional[str] = Header(None),
 ):
+    _rate_table(rate_set)
+    if profile and not PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled on this server.")
 
-    dwg_path = os.path.join(UPLOAD_DIR, file.filename)
+    upload = await _ingest(file)
+    digest = upload.digest
+    result_id = cache_key(digest)
 
-    with open(dwg_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Repeated uploads of the same drawing skip conversion and parsing.
+    # Raw geometry is never cached, so asking for it always re-parses;
+    # room quantities are only cached once some request has asked for them.
+    # A profiled request always parses, since the parse is what it measures.
+    raw_data = None if include_geometry or profile else result_cache.get(result_id)
+    if raw_data is not None and group_by_room and "rooms" not in raw_data:
+        raw_data = None
+    cache_hit = raw_data is not None
+    metrics.inc("boq_result_cache_total", outcome="hit" if cache_hit else "miss")
+    line_geometry = None
+    profile_name = None
 
-    # Convert DWG -> DXF automatically
-    dxf_path = convert_dwg_to_dxf(dwg_path)
+    if cache_hit:
+        upload.discard()
+    else:
+        dxf_path = await _dxf_for_upload(upload)
 
-    # Parse DXF — now returns a rich dictionary of extracted data
-    raw_data = parse_dxf(dxf_path)
+        # Parse DXF in a worker process — now returns a rich dictionary of extracted data
+        try:
+            with metrics.span("parse"):
+                if profile:
+                    # cProfile runs in the worker process, around the parse alone
+                    profile_name = f"{result_id}-{int(time.time())}"
+                    raw_data = await cpu_pool.run(
+                        profiled, profile_name, parse_dxf, dxf_path,
+                        include_lines=include_geometry, rooms=group_by_room,
+                    )
+                else:
+                    raw_data = await cpu_pool.run(
+                        parse_dxf, dxf_path, include_lines=include_geometry, rooms=group_by_room
+                    )
+        except PoolBusyError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except TaskTimeoutError as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        except WorkerCrashedError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        line_geometry = raw_data.pop("lines", None)
+        result_cache.put(result_id, raw_data)
 
-    # Generate BOQ with auto-estimated rates
-    boq = generate_boq(raw_data)
+    # Generate BOQ with auto-estimated rates (a few dict lookups — cheaper inline
+    # than a round trip to the pool)
+    with metrics.span("boq"):
+        boq = generate_boq(raw_data, rate_set=rate_set)
 
-    # Send email if user is authenticated
+    # Queue the email if user is authenticated — sent in the background,
+    # so the response doesn't wait on Gmail
     email_status = None
     if access_token and user_email:
-        email_status = send_boq_email(access_token, user_email, boq)
+        email_status = await run_in_threadpool(
+            email_outbox.enqueue, access_token, user_email, boq, idempotency_key
+        )
 
-    return {
+    response = {
         "boq": boq,
         "email_status": email_status,
+        "result_id": result_id,
+        "cache_hit": cache_hit,
     }
+    if group_by_room:
+        response["rooms"] = generate_room_boq(raw_data, rate_set=rate_set)
+    if line_geometry is not None:
+        response["geometry"] = {"lines": line_geometry.to_json()}
+    if profile_name is not None:
+        response["profile"] = {"name": profile_name, "url": f"/profiles/{profile_name}"}
+    return response
+
+
+@app.post("/jobs")
+async def create_job(
+    file: UploadFile,
+    access_token: Optional[str] = Form(None),
+    user_email: Optional[str] = Form(None),
+    rate_set: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """Queue a drawing for background processing and return its job id at once."""
+    _rate_table(rate_set)
+    upload = await _ingest(file)
+    digest = upload.digest
+
+    # A DWG stays in the upload directory until the job has converted it
+    if result_cache.get_dxf(digest) is None:
+        _stage_upload(upload)
+    else:
+        upload.discard()
+
+    try:
+        job_id = job_queue.submit(
+            {"digest": digest, "dwg_path": upload.path, "filename": file.filename, "rate_set": rate_set},
+            {"access_token": access_token, "user_email": user_email, "idempotency_key": idempotency_key},
+        )
+    except QueueFullError as e:
+        upload.discard()
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report a job's per-stage progress and, once finished, its result."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+async def _batch_drawing(index: int, name: str, upload: IngestedUpload, rate_set: Optional[str],
+                         parse_slots: asyncio.Semaphore, dxf_path=None, conversion=None) -> tuple:
+    """One drawing of a batch: (its NDJSON record, its raw_data or None if it failed)."""
+    result_id = cache_key(upload.digest)
+    try:
+        raw_data = result_cache.get(result_id)
+        cache_hit = raw_data is not None
+        metrics.inc("boq_result_cache_total", outcome="hit" if cache_hit else "miss")
+        if not cache_hit:
+            if conversion is not None:
+                dxf_path = await asyncio.wrap_future(conversion)
+            # Waits for a free worker instead of failing with PoolBusyError
+            async with parse_slots:
+                with metrics.span("parse"):
+                    raw_data = await run_in_threadpool(cpu_pool.run_sync, parse_dxf, dxf_path)
+            result_cache.put(result_id, raw_data)
+    except Exception as e:
+        return {"type": "drawing", "index": index, "filename": name, "error": str(e)}, None
+    finally:
+        upload.discard()
+
+    record = {
+        "type": "drawing",
+        "index": index,
+        "filename": name,
+        "result_id": result_id,
+        "cache_hit": cache_hit,
+        "boq": generate_boq(raw_data, rate_set=rate_set),
+    }
+    return record, raw_data
+
+
+async def _batch_results(drawings: list, rate_set: Optional[str]):
+    """NDJSON lines: each drawing as it finishes, then the project total."""
+    parse_slots = asyncio.Semaphore(max(cpu_pool.workers, 1))
+    tasks = []
+    failed = []
+
+    # Stage everything first, so all DWGs reach the ODA batcher together
+    for index, (name, upload) in enumerate(drawings):
+        dxf_path = conversion = None
+        if result_cache.get(cache_key(upload.digest)) is None:
+            dxf_path = result_cache.get_dxf(upload.digest)
+            if dxf_path is None:
+                try:
+                    dxf_path = _stage_upload(upload)
+                except HTTPException as e:
+                    failed.append({"type": "drawing", "index": index, "filename": name, "error": e.detail})
+                    continue
+                if dxf_path is None:
+                    conversion = submit_conversion(upload.path, result_cache.dxf_path(upload.digest))
+        tasks.append(asyncio.ensure_future(
+            _batch_drawing(index, name, upload, rate_set, parse_slots, dxf_path, conversion)
+        ))
+
+    try:
+        for record in failed:
+            yield json.dumps(record) + "\n"
+
+        raws = []
+        for finished in asyncio.as_completed(tasks):
+            record, raw_data = await finished
+            if raw_data is None:
+                failed.append(record)
+            else:
+                raws.append(raw_data)
+            yield json.dumps(record) + "\n"
+
+        yield json.dumps({
+            "type": "project",
+            "drawings": len(drawings),
+            "processed": len(raws),
+            "failed": len(failed),
+            "boq": generate_boq(aggregate_quantities(raws), rate_set=rate_set),
+        }) + "\n"
+    finally:
+        # The client went away: stop waiting on the rest
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/batch")
+async def process_batch(files: List[UploadFile], rate_set: Optional[str] = Form(None)):
+    """
+    Price a whole project: several drawings, ZIP archives of drawings, or both.
+
+    Streams NDJSON — one {"type": "drawing"} line per drawing as soon as it
+    is done (with its index in upload order), then one {"type": "project"}
+    line with the BOQ of all drawings together.
+    """
+    _rate_table(rate_set)
+
+    drawings = []
+    try:
+        for file in files:
+            budget = BATCH_MAX_BYTES - sum(upload.size for _, upload in drawings)
+            upload = await _ingest(file, budget)
+            if is_zip(upload.head):
+                try:
+                    drawings += await run_in_threadpool(expand_zip, upload.path, budget)
+                finally:
+                    upload.discard()
+            else:
+                drawings.append((file.filename, upload))
+                if upload.size > UPLOAD_MAX_BYTES:
+                    raise UploadTooLargeError(UPLOAD_MAX_BYTES)
+            if len(drawings) > BATCH_MAX_FILES:
+                raise BatchTooLargeError(f"A batch may contain at most {BATCH_MAX_FILES} drawings.")
+    except BaseException as e:
+        for _, upload in drawings:
+            upload.discard()
+        if isinstance(e, (BatchTooLargeError, UploadTooLargeError)):
+            raise HTTPException(status_code=413, detail=str(e))
+        if isinstance(e, zipfile.BadZipFile):
+            raise HTTPException(status_code=400, detail="Could not read the ZIP archive.")
+        raise
+
+    if not drawings:
+        raise HTTPException(status_code=400, detail="No .dwg or .dxf drawings found in the upload.")
+
+    return StreamingResponse(_batch_results(drawings, rate_set), media_type="application/x-ndjson")
+
+
+@app.get("/emails/{email_id}")
+async def get_email(email_id: str):
+    """Report whether a queued BOQ email has been sent, is being retried or failed."""
+    email = email_outbox.get(email_id)
+    if email is None:
+        raise HTTPException(status_code=404, detail="Email not found.")
+    return email
+
+
+class RepriceRequest(BaseModel):
+    result_id: str
+    rates: Dict[str, float] = {}
+    rate_set: Optional[str] = None
+    # Layer pattern -> {quantity key: component key or null}, or null to drop the layer
+    layer_map: Optional[Dict[str, Optional[Dict[str, Optional[str]]]]] = None
+    group_by_room: bool = False
+
+
+@app.post("/reprice")
+async def reprice(request: RepriceRequest):
+    """Recompute a BOQ from a previous result's cached quantities with new rates or layer routing."""
+    rate_table = _rate_table(request.rate_set)
+    unknown = sorted(set(request.rates) - set(rate_table))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown rate keys: {', '.join(unknown)}")
+    if any(rate < 0 for rate in request.rates.values()):
+        raise HTTPException(status_code=400, detail="Rates must not be negative.")
+
+    layer_map = None
+    if request.layer_map is not None:
+        layer_map = LayerMap(request.layer_map)
+        unknown = sorted(layer_map.components() - set(rate_table))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown components in layer map: {', '.join(unknown)}")
+
+    raw_data = result_cache.get(request.result_id)
+    if raw_data is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Result not found or expired. Please upload the drawing again.",
+        )
+
+    if request.group_by_room and "rooms" not in raw_data:
+        raise HTTPException(
+            status_code=409,
+            detail="Room quantities were not extracted for this result. "
+                   "Process the drawing again with group_by_room enabled.",
+        )
+
+    response = {
+        "boq": generate_boq(raw_data, request.rates, request.rate_set, layer_map),
+        "result_id": request.result_id,
+    }
+    if request.group_by_room:
+        response["rooms"] = generate_room_boq(raw_data, request.rates, request.rate_set)
+    return response
+
+
+@app.get("/results/{result_id}/report")
+async def download_report(result_id: str, format: str = "xlsx", rate_set: Optional[str] = None):
+    """Stream a cached result's BOQ as an html, text, csv or xlsx report."""
+    if format not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown report format. Choose one of: {', '.join(MEDIA_TYPES)}.",
+        )
+    _rate_table(rate_set)
+
+    raw_data = result_cache.get(result_id)
+    if raw_data is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Result not found or expired. Please upload the drawing again.",
+        )
+
+    boq = generate_boq(raw_data, rate_set=rate_set)
+    return StreamingResponse(
+        stream_report(boq, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="CAD_BOQ_Report.{EXTENSIONS[format]}"'},
+    )
+
+
+@app.post("/revisions")
+async def process_revision(
+    file: UploadFile,
+    previous_result_id: str = Form(...),
+    rate_set: Optional[str] = Form(None),
+):
+    """
+    Price a new revision of a previously processed drawing.
+
+    Only entities added, removed or modified since the previous revision
+    are measured; the response carries the new BOQ plus what changed.
+    """
+    _rate_table(rate_set)
+
+    previous_digest = previous_result_id.rsplit("-p", 1)[0]
+    previous_dxf_path = result_cache.get_dxf(previous_digest)
+    if previous_dxf_path is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Previous revision not found or expired. Please process it again.",
+        )
+
+    upload = await _ingest(file)
+    result_id = cache_key(upload.digest)
+    dxf_path = await _dxf_for_upload(upload)
+
+    try:
+        raw_data, previous_raw_data, stats = await cpu_pool.run(
+            diff_revision, dxf_path, previous_dxf_path, previous_result_id, result_id
+        )
+    except PoolBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except TaskTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except WorkerCrashedError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    result_cache.put(result_id, raw_data)
+
+    boq = generate_boq(raw_data, rate_set=rate_set)
+    previous_boq = generate_boq(previous_raw_data, rate_set=rate_set)
+    changes = boq_delta(previous_boq, boq)
+
+    return {
+        "boq": boq,
+        "result_id": result_id,
+        "previous_result_id": previous_result_id,
+        "delta": {
+            "entities": stats,
+            "quantities": quantity_delta(previous_raw_data, raw_data),
+            "boq": changes,
+            "total_change": round(sum(item["total_change"] for item in changes), 2),
+        },
+    }
+
+
+@app.get("/rate-sets")
+async def rate_sets():
+    """List the available "<region>/<version>" rate sets and the default one."""
+    return {"rate_sets": list_rate_sets(), "default": rate_store.default_rate_set}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Stage, handler and HTTP timings and counters, in Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/profiles/{name}")
+async def get_profile(name: str):
+    """Download a cProfile dump written for a `profile=true` request."""
+    path = os.path.join(PROFILE_DIR, f"{name}.pstats")
+    if not PROFILING_ENABLED or os.path.basename(name) != name or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{name}.pstats")
@@ -0,0 +1,286 @@
+"""
+Metrics — timing spans, counters and a Prometheus text endpoint.
+
+Where a request spends its time is recorded as latency histograms:
+- boq_stage_seconds{stage}: upload, convert (one ODA run), read (opening
+  the DXF), entities (the handler loop), dedup, finalize, parse (the whole
+  pool task as the request saw it), boq, email
+- boq_handler_seconds{type}: time spent in one entity type's handler
+  during one parse, with boq_entities_total{type} counting the entities
+- boq_http_request_seconds{method, route, status}, with request and
+  response body sizes in boq_http_bytes_in_total / boq_http_bytes_out_total
+- boq_block_classifications_total{category}, and how many block names had
+  to go through the classifier's regex (the rest were memo hits)
+
+Parsing runs in worker processes. Everything a task records there goes
+into a capture sink that travels back with the task's result and is
+merged into the server's registry (see run_captured), so /metrics covers
+the workers too. Handler timings are summed per type inside the parse
+and recorded once per parse, not once per entity.
+
+Setting PROFILING_ENABLED=1 lets a request ask for its parse to run under
+cProfile; the pstats dump is written to PROFILE_DIR (see profiled).
+"""
+
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles"))
+# Newest profile dumps kept on disk
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+# Histogram bucket upper bounds, in seconds: entity handlers to ODA runs
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# name -> (type, help)
+METRICS = {
+    "boq_stage_seconds": ("histogram", "Time spent in each pipeline stage."),
+    "boq_handler_seconds": ("histogram", "Time spent in one entity type's handler per parse."),
+    "boq_http_request_seconds": ("histogram", "HTTP request latency."),
+    "boq_entities_total": ("counter", "Entities processed, by DXF type."),
+    "boq_http_bytes_in_total": ("counter", "HTTP request body bytes received."),
+    "boq_http_bytes_out_total": ("counter", "HTTP response body bytes sent."),
+    "boq_dxf_bytes_parsed_total": ("counter", "Size of the DXF files parsed."),
+    "boq_result_cache_total": ("counter", "Result cache lookups by outcome."),
+    "boq_emails_total": ("counter", "Email send attempts by outcome."),
+    "boq_block_classifications_total": ("counter", "Block inserts classified, by category."),
+    "boq_block_regex_evaluations_total": ("counter", "Block names classified by regex (memo misses)."),
+}
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+class MetricsSink:
+    """Counters and histograms keyed by (name, labels). Plain dicts, so it pickles."""
+
+    def __init__(self):
+        self.counters = {}
+        # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        return {"counters": self.counters, "histograms": self.histograms}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()
+        self.counters, self.histograms = state["counters"], state["histograms"]
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(BUCKETS)] += 1
+            histogram[-1] += seconds
+
+    def merge(self, other: "MetricsSink") -> None:
+        with self._lock:
+            for key, value in other.counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, values in other.histograms.items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = list(values)
+                else:
+                    for i, value in enumerate(values):
+                        histogram[i] += value
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(values)) for key, values in self.histograms.items())
+
+        series = {}
+        for (name, labels), value in counters:
+            series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), values in histograms:
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(values[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+        out = []
+        for name, (kind, help_text) in METRICS.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(series.get(name, ()))
+        return "\n".join(out) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+registry = MetricsSink()
+_local = threading.local()
+
+
+def _sink() -> MetricsSink:
+    """The capture sink of the current thread, or the process-wide registry."""
+    return getattr(_local, "sink", None) or registry
+
+
+# ── Recording ────────────────────────────────
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    _sink().inc(name, value, **labels)
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    _sink().observe(name, seconds, **labels)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as one observation of boq_stage_seconds{stage}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _sink().observe("boq_stage_seconds", time.perf_counter() - start, stage=stage)
+
+
+def record_handlers(timings: dict) -> None:
+    """Record one parse's per-type handler totals: {dxftype: [entities, seconds]}."""
+    sink = _sink()
+    for kind, (count, seconds) in timings.items():
+        sink.inc("boq_entities_total", count, type=kind)
+        sink.observe("boq_handler_seconds", seconds, type=kind)
+
+
+def merge(captured: MetricsSink) -> None:
+    """Fold what a worker captured into the current sink."""
+    _sink().merge(captured)
+
+
+@contextmanager
+def capture():
+    """Route this thread's recording into a fresh sink (yielded) instead of the current one."""
+    previous = getattr(_local, "sink", None)
+    _local.sink = captured = MetricsSink()
+    try:
+        yield captured
+    finally:
+        _local.sink = previous
+
+
+def run_captured(func, *args, **kwargs) -> tuple:
+    """Worker-side wrapper: (func's result, the metrics it recorded)."""
+    with capture() as captured:
+        result = func(*args, **kwargs)
+    return result, captured
+
+
+# ── HTTP ─────────────────────────────────────
+
+def _route_label(scope: dict) -> str:
+    """The matched route's path template (bounded label values), not the raw path."""
+    endpoint, router = scope.get("endpoint"), scope.get("router")
+    if endpoint is not None and router is not None:
+        for route in router.routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request latency by route and status, body bytes in and out."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        seen = {"status": 500, "in": 0, "out": 0}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                seen["in"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                seen["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                seen["out"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            # Streaming responses are timed until their last chunk is sent
+            route = _route_label(scope)
+            registry.observe(
+                "boq_http_request_seconds", time.perf_counter() - start,
+                method=scope["method"], route=route, status=seen["status"],
+            )
+            registry.inc("boq_http_bytes_in_total", seen["in"], route=route)
+            registry.inc("boq_http_bytes_out_total", seen["out"], route=route)
+
+
+# ── Profiling ────────────────────────────────
+
+def _prune_profiles() -> None:
+    dumps = sorted(
+        (entry.stat().st_mtime, entry.path) for entry in os.scandir(PROFILE_DIR)
+        if entry.name.endswith(".pstats")
+    )
+    for _, path in dumps[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else dumps:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def profiled(name: str, func, *args, **kwargs):
+    """
+    Run func under cProfile and dump the stats to PROFILE_DIR/<name>.pstats
+    (read with pstats or snakeviz). Only the calling process is profiled.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}.pstats"))
+        _prune_profiles()
@@ -0,0 +1,249 @@
+"""
+Parallel Parse — one huge ASCII DXF parsed on several cores.
+
+The ENTITIES section of a large drawing is split into byte ranges that
+start on entity boundaries, and every range is parsed by a worker process:
+
+1. The file is memory-mapped and the section bounds are found with a byte
+   regex. Split points are placed evenly and moved forward to the next
+   group code 0 (never inside a POLYLINE's VERTEX run or an INSERT's
+   ATTRIBs).
+2. Each worker maps the same file and reads only its range, tag by tag,
+   straight from the mapping — nothing is copied to the worker but two
+   offsets. Entities go through the regular handlers into a ParseState,
+   which is sent back unreduced together with the block totals it used.
+3. The states are merged in file order and finalized once. Dedup, walls
+   and rooms need the whole drawing, and merging raw buffers (rather than
+   summing partial results) keeps the output identical to a single pass.
+
+The range workers are started for one parse and stopped after it (a
+parse this size dwarfs their start-up). Inside a CPU pool worker the
+budget is the pool's share of the cores — cpu_count // PARSE_WORKERS,
+see limit_workers — so the two levels together never start more
+processes than there are cores; with one pool worker per core a pool
+worker parses on its own.
+"""
+
+import mmap
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from ezdxf.entities import factory
+from ezdxf.entities.subentity import entity_linker
+from ezdxf.filemanagement import dxf_file_info
+from ezdxf.lldxf.extendedtags import ExtendedTags
+from ezdxf.lldxf.tagger import ascii_tags_loader, tag_compiler
+
+import metrics
+from block_quantities import BlockQuantityEngine, load_block_definitions
+from cad_parser import ENTITY_HANDLERS, ParseState, _dispatch, new_block_engine
+from segment_dedup import DEDUP_TOLERANCE
+
+PARALLEL_PARSE_WORKERS = int(os.getenv("PARALLEL_PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+# DXF files at least this large are parsed in parallel (when workers > 1)
+PARALLEL_THRESHOLD_BYTES = int(os.getenv("PARALLEL_PARSE_THRESHOLD_MB", "256")) * 1024 * 1024
+
+# A few ranges per worker even out differences in entity density
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_BYTES = 1024 * 1024
+
+_ENTITIES_START = re.compile(rb"^ *0\r?\nSECTION\r?\n *2\r?\nENTITIES\r?\n", re.MULTILINE)
+_SECTION_END = re.compile(rb"^ *0\r?\nENDSEC\r?$", re.MULTILINE)
+_GROUP_CODE_0 = re.compile(rb"^ *0\r?\n([^\r\n]*)", re.MULTILINE)
+
+# Entities that belong to the preceding POLYLINE or INSERT
+_LINKED_TYPES = {b"VERTEX", b"SEQEND", b"ATTRIB"}
+
+
+# Range workers this process may start; lowered in CPU pool workers
+_worker_budget = PARALLEL_PARSE_WORKERS
+
+
+def limit_workers(workers: int) -> None:
+    """Cap the range workers this process starts per parse (1 turns parallel parsing off)."""
+    global _worker_budget
+    _worker_budget = max(1, min(PARALLEL_PARSE_WORKERS, workers))
+
+
+def should_parallelize(path: str) -> bool:
+    return _worker_budget > 1 and os.path.getsize(path) >= PARALLEL_THRESHOLD_BYTES
+
+
+# ── Splitting ────────────────────────────────
+
+def _next_entity_start(mm, pos: int, end: int) -> int:
+    """Offset of the first top-level entity starting at or after pos (end if none)."""
+    while True:
+        match = _GROUP_CODE_0.search(mm, pos, end)
+        if match is None:
+            return end
+        value = match.group(1).strip()
+        # "0" followed by an integer is a value line followed by a group code
+        if value and not value.lstrip(b"-").isdigit() and value not in _LINKED_TYPES:
+            return match.start()
+        pos = match.end()
+
+
+def entity_ranges(path: str, parts: int) -> list:
+    """
+    Split the ENTITIES section into at most `parts` (start, stop) byte ranges
+    that each begin on a top-level entity; [] if there is no ENTITIES section.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        section = _ENTITIES_START.search(mm)
+        if section is None:
+            return []
+        start = section.end()
+        section_end = _SECTION_END.search(mm, start)
+        end = section_end.start() if section_end else len(mm)
+
+        parts = max(min(parts, (end - start) // MIN_CHUNK_BYTES), 1)
+        bounds = [start]
+        for i in range(1, parts):
+            target = max(start + (end - start) * i // parts, bounds[-1])
+            boundary = _next_entity_start(mm, target, end)
+            if boundary > bounds[-1]:
+                bounds.append(boundary)
+        bounds.append(end)
+        return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+# ── Workers ──────────────────────────────────
+
+class _RangeReader:
+    """
+    Text lines of one byte range of a memory map — all ascii_tags_loader needs.
+
+    The range is followed by a 0/EOF tag: the tag compiler only emits a
+    trailing point once it sees the next tag, and the last entity is only
+    complete once the next one starts.
+    """
+
+    def __init__(self, mm, start: int, stop: int, encoding: str):
+        self.mm = mm
+        self.stop = stop
+        self.encoding = encoding
+        self.trailer = ["EOF\n", "  0\n"]
+        mm.seek(start)
+
+    def readline(self) -> str:
+        if self.mm.tell() >= self.stop:
+            return self.trailer.pop() if self.trailer else ""
+        line = self.mm.readline()
+        return line.decode(self.encoding, errors="surrogateescape").replace("\r\n", "\n")
+
+
+def _requested_types() -> set:
+    types = set(ENTITY_HANDLERS)
+    if "POLYLINE" in types:
+        types |= {"VERTEX", "SEQEND"}
+    if "INSERT" in types:
+        types |= {"ATTRIB", "SEQEND"}
+    return types
+
+
+def _range_entities(mm, start: int, stop: int, encoding: str):
+    """Modelspace entities in one range, loaded and linked like iterdxf does."""
+    requested = _requested_types()
+    linked_entity = entity_linker()
+    queued = None
+    tags = []
+
+    for tag in tag_compiler(ascii_tags_loader(_RangeReader(mm, start, stop, encoding))):
+        if tag.code != 0:
+            tags.append(tag)
+            continue
+        if tags and tags[0].value in requested:
+            entity = factory.load(ExtendedTags(tags))
+            if not linked_entity(entity) and entity.dxf.paperspace == 0:
+                # Held back until its VERTEX / ATTRIB entities are linked
+                if queued is not None:
+                    yield queued
+                queued = entity
+        tags = [tag]
+
+    if queued is not None:
+        yield queued
+
+
+# Block definitions of the file this worker last parsed: (file key, blocks)
+_blocks_memo = (None, None)
+
+
+def _block_definitions(path: str) -> dict:
+    global _blocks_memo
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if _blocks_memo[0] != key:
+        _blocks_memo = (key, load_block_definitions(path, _requested_types()))
+    return _blocks_memo[1]
+
+
+def _parse_range(path: str, start: int, stop: int) -> tuple:
+    """
+    Worker task: collect one range into a ParseState.
+
+    Returns:
+        (state, block totals, handler timings, metrics) — the state without
+        its block engine, the totals of every block definition its INSERTs
+        needed, the range's handler timings (recorded once for the whole
+        parse by the caller) and the metrics recorded in this worker
+    """
+    with metrics.capture() as captured:
+        blocks = new_block_engine(_block_definitions(path))
+        state = ParseState(blocks)
+        encoding = dxf_file_info(path).encoding
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            timings = _dispatch(_range_entities(mm, start, stop, encoding), state)
+
+        for name, _linear_scale, _area_scale in state.block_refs:
+            blocks.totals(name)
+    state.blocks = None
+    return state, blocks.resolved(), timings, captured
+
+
+def _warm_worker() -> None:
+    import cad_parser  # noqa: F401
+
+
+def parse_dxf_parallel(path: str, include_lines: bool = False, rooms: bool = False):
+    """
+    parse_dxf() for an ASCII DXF, with the ENTITIES section parsed in parallel.
+
+    Returns None when the file has no ENTITIES section to split.
+    """
+    workers = max(_worker_budget, 1)
+    ranges = entity_ranges(path, workers * CHUNKS_PER_WORKER)
+    if not ranges:
+        return None
+
+    blocks = BlockQuantityEngine({}, None)
+    state = ParseState(blocks)
+    # spawn: parse_dxf may be called from a threaded server process
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(ranges)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_warm_worker,
+    ) as executor:
+        futures = [executor.submit(_parse_range, path, start, stop) for start, stop in ranges]
+        # Merged in file order, whatever order the workers finish in
+        timings = {}
+        with metrics.span("entities"):
+            for future in futures:
+                part, block_totals, part_timings, captured = future.result()
+                blocks.preload(block_totals)
+                state.merge(part)
+                metrics.merge(captured)
+                for kind, (count, seconds) in part_timings.items():
+                    total = timings.get(kind, (0, 0.0))
+                    timings[kind] = (total[0] + count, total[1] + seconds)
+        metrics.record_handlers(timings)
+
+    if DEDUP_TOLERANCE > 0:
+        with metrics.span("dedup"):
+            state.dedup_lines()
+    with metrics.span("finalize"):
+        return state.finalize(include_lines, rooms)
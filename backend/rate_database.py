@@ -2,8 +2,32 @@
 Standard construction rate database.
 Rates are approximate defaults based on DSR 2024 / Indian market averages.
 Users can override these in the frontend — they serve as sensible starting points.
+
+Additional rate sets (per region and per schedule version) are loaded from
+RATES_DIR/<region>/<version>.json. Each file maps component keys to entries
+shaped like RATE_TABLE's; keys a file leaves out fall back to RATE_TABLE, so
+a file may contain just the rates that differ. Rate sets are addressed as
+"<region>/<version>", e.g. "tamil-nadu/dsr-2025".
+
+Files are read once into an in-memory index and re-read in the background
+when they change (see RateStore.start_watching), never per request. A
+file that can't be read or doesn't have that shape is rejected whole, and
+the previous version of its rate set stays in service.
 """
 
+import json
+import math
+import os
+import threading
+import time
+
+RATES_DIR = os.getenv("RATES_DIR", os.path.join(os.path.dirname(__file__), "rates"))
+RATES_RELOAD_SECONDS = float(os.getenv("RATES_RELOAD_SECONDS", "5"))
+
+# The built-in table below
+BUILTIN_RATE_SET = "default/dsr-2024"
+DEFAULT_RATE_SET = os.getenv("DEFAULT_RATE_SET", BUILTIN_RATE_SET)
+
 # Each entry: component_key -> { unit, rate (INR), description }
 RATE_TABLE = {
     "wall_conduits": {
@@ -36,6 +60,12 @@ RATE_TABLE = {
         "unit": "m²",
         "rate": 3200,
     },
+    "floor_finishes": {
+        "component": "Floor Finishes",
+        "description": "Vitrified tile / screed finish over hatched regions in the CAD drawing",
+        "unit": "m²",
+        "rate": 950,
+    },
     "ceiling_runs": {
         "component": "Ceiling Framework",
         "description": "False ceiling framing runs from CAD linear entities",
@@ -50,7 +80,7 @@ RATE_TABLE = {
     },
     "arc_elements": {
         "component": "Curved Sections",
-        "description": "Curved/arc sections measured from CAD arc entities",
+        "description": "Curved/arc sections measured from CAD arc, spline and ellipse entities",
         "unit": "m",
         "rate": 350,
     },
@@ -72,14 +102,140 @@ RATE_TABLE = {
         "unit": "nos",
         "rate": 5000,
     },
+    "wall_masonry": {
+        "component": "Masonry Walls",
+        "description": "Brick masonry walls from paired CAD wall faces (centerline length x thickness x height)",
+        "unit": "m³",
+        "rate": 6500,
+    },
 }
 
+# Text fields every entry must have once RATE_TABLE's defaults are applied
+_TEXT_FIELDS = ("component", "description", "unit")
+
+
+def build_rate_table(overrides) -> dict:
+    """
+    RATE_TABLE with a rate file's entries applied.
+
+    Raises:
+        ValueError: the file isn't an object of entries, or an entry is not
+            an object or ends up without a numeric rate or a text field
+    """
+    if not isinstance(overrides, dict):
+        raise ValueError(f"expected an object of rate entries, got {type(overrides).__name__}")
+
+    table = {key: dict(info) for key, info in RATE_TABLE.items()}
+    for key, info in overrides.items():
+        if not isinstance(info, dict):
+            raise ValueError(f"{key}: expected an object, got {type(info).__name__}")
+        entry = table.setdefault(key, {})
+        entry.update(info)
+
+        rate = entry.get("rate")
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not math.isfinite(rate):
+            raise ValueError(f"{key}: rate must be a number, got {rate!r}")
+        for field in _TEXT_FIELDS:
+            if not isinstance(entry.get(field), str):
+                raise ValueError(f"{key}: {field} must be a string, got {entry.get(field)!r}")
+    return table
+
+
+class RateStore:
+    """
+    In-memory index of rate sets: rate_set -> component_key -> rate info.
+
+    Lookups are plain dict reads. A reload builds a complete new index and
+    swaps it in with one assignment, so readers never see a half-loaded set.
+    """
 
-def get_rate(component_key: str) -> dict:
+    def __init__(self, rates_dir: str, default_rate_set: str):
+        self.rates_dir = rates_dir
+        self.default_rate_set = default_rate_set
+        self._index = {}
+        self._fingerprint = None
+        self._watcher = None
+        self.reload()
+
+    def _scan(self) -> dict:
+        """Return {"region/version": (path, (mtime_ns, size))} for every rate file."""
+        files = {}
+        if not os.path.isdir(self.rates_dir):
+            return files
+        for region in sorted(os.listdir(self.rates_dir)):
+            region_dir = os.path.join(self.rates_dir, region)
+            if not os.path.isdir(region_dir):
+                continue
+            for name in sorted(os.listdir(region_dir)):
+                if name.endswith(".json"):
+                    path = os.path.join(region_dir, name)
+                    stat = os.stat(path)
+                    files[f"{region}/{name[:-5]}"] = (path, (stat.st_mtime_ns, stat.st_size))
+        return files
+
+    def reload(self) -> bool:
+        """Rebuild the index if any rate file changed. Returns True if it reloaded."""
+        files = self._scan()
+        fingerprint = tuple(sorted((key, version) for key, (_, version) in files.items()))
+        if fingerprint == self._fingerprint:
+            return False
+
+        index = {BUILTIN_RATE_SET: RATE_TABLE}
+        for rate_set, (path, _) in files.items():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    index[rate_set] = build_rate_table(json.load(f))
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                # Keep serving the previous version of a broken file
+                print(f"[Rates] Skipping {path}: {e}")
+                if rate_set in self._index:
+                    index[rate_set] = self._index[rate_set]
+
+        self._index = index
+        self._fingerprint = fingerprint
+        return True
+
+    def start_watching(self, interval: float = RATES_RELOAD_SECONDS) -> None:
+        """Poll RATES_DIR in a daemon thread and hot-reload changed rate files."""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"[Rates] Reload failed: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="rate-watcher", daemon=True)
+        self._watcher.start()
+
+    def rate_sets(self) -> list:
+        return sorted(self._index)
+
+    def table(self, rate_set: str = None) -> dict:
+        """Return the full table of a rate set. Raises KeyError if it doesn't exist."""
+        rate_set = rate_set or self.default_rate_set
+        try:
+            return self._index[rate_set]
+        except KeyError:
+            raise KeyError(f"Unknown rate set: {rate_set}") from None
+
+
+rate_store = RateStore(RATES_DIR, DEFAULT_RATE_SET)
+
+
+def get_rate(component_key: str, rate_set: str = None) -> dict:
     """Get rate info for a component key. Returns empty dict if not found."""
-    return RATE_TABLE.get(component_key, {})
+    return rate_store.table(rate_set).get(component_key, {})
+
+
+def get_all_rates(rate_set: str = None) -> dict:
+    """Return the full rate table of a rate set (the default set if omitted)."""
+    return rate_store.table(rate_set)
 
 
-def get_all_rates() -> dict:
-    """Return the full rate table."""
-    return RATE_TABLE
+def list_rate_sets() -> list:
+    """Return the available "<region>/<version>" rate set names."""
+    return rate_store.rate_sets()
@@ -0,0 +1,520 @@
+"""
+Report Renderer — BOQ reports as HTML, plain text, CSV and XLSX.
+
+Every format is produced by one pass over the same BOQ items, and every
+renderer is a generator of chunks: callers either stream them (report
+downloads) or join them once (email bodies). Nothing is built by
+repeated string concatenation.
+
+Templates use str.format syntax and are compiled when this module is
+imported: each is split once into literal text and (field, format spec)
+pairs, so rendering a row is a handful of format() calls and list
+appends, with no template parsing per item.
+
+XLSX is written directly as SpreadsheetML into a ZIP stream, one row at
+a time with inline strings: memory stays constant however many rows
+the BOQ has, and no spreadsheet library is needed.
+"""
+
+import csv
+import html
+import zipfile
+from string import Formatter
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape
+
+# Rows rendered between two yielded chunks
+CHUNK_ROWS = 256
+
+# Column headings of the tabular formats (the same as the frontend's Excel export)
+COLUMNS = ("Item No", "Component", "Description", "Quantity", "Unit", "Rate", "Total")
+
+MEDIA_TYPES = {
+    "html": "text/html",
+    "text": "text/plain",
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+EXTENSIONS = {"html": "html", "text": "txt", "csv": "csv", "xlsx": "xlsx"}
+
+
+class Template:
+    """A str.format template, parsed once into literals and fields."""
+
+    def __init__(self, text: str):
+        self.parts = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if conversion:
+                raise ValueError(f"Conversions are not supported: {{{field}!{conversion}}}")
+            if literal:
+                self.parts.append((literal, None, None))
+            if field is not None:
+                self.parts.append((None, field, spec))
+
+    def render_into(self, out: list, values: dict) -> None:
+        """Append the rendered pieces to out."""
+        append = out.append
+        for literal, field, spec in self.parts:
+            append(literal if field is None else format(values[field], spec))
+
+    def split(self, field: str) -> tuple:
+        """(before, after): two templates around a standalone field (e.g. a row block)."""
+        for i, (_literal, name, _spec) in enumerate(self.parts):
+            if name == field:
+                before, after = Template(""), Template("")
+                before.parts, after.parts = self.parts[:i], self.parts[i + 1:]
+                return before, after
+        raise KeyError(field)
+
+
+def grand_total(items: Iterable[dict]) -> float:
+    return sum(item.get("total", 0) for item in items)
+
+
+# ── HTML ─────────────────────────────────────
+
+_HTML_ROW = Template(r'''
+        <tr>
+            <td style="padding:12px 8px; border-bottom:1px solid #ede8f5; text-align:center;
+                       font-family:Arial,sans-serif; color:#8b7ec8; font-size:14px; font-weight:600;
+                       width:40px; vertical-align:top;">
+                {item_no}
+            </td>
+            <td style="padding:12px 8px; border-bottom:1px solid #ede8f5; font-weight:600;
+                       color:#3d3250; font-size:14px; width:140px; vertical-align:top;
+                       word-wrap:break-word;">
+                {component}
+            </td>
+            <td style="padding:12px 8px; border-bottom:1px solid #ede8f5; text-align:right;
+                       font-family:Arial,sans-serif; color:#3d3250; font-weight:600;
+                       font-size:14px; width:100px; vertical-align:top; white-space:nowrap;">
+                {quantity:,.2f}
+            </td>
+            <td style="padding:12px 8px; border-bottom:1px solid #ede8f5; text-align:center;
+                       font-family:Arial,sans-serif; color:#7a7088; font-size:12px;
+                       text-transform:uppercase; width:50px; vertical-align:top;">
+                {unit}
+            </td>
+            <td style="padding:12px 8px; border-bottom:1px solid #ede8f5; text-align:right;
+                       font-family:Arial,sans-serif; color:#3d3250; font-size:14px;
+                       width:110px; vertical-align:top; white-space:nowrap;">
+                ₹{rate:,.2f}
+            </td>
+            <td style="padding:12px 8px; border-bottom:1px solid #ede8f5; text-align:right;
+                       font-family:Arial,sans-serif; font-weight:700;
+                       color:{total_color}; font-size:13px;
+                       width:210px; vertical-align:top; white-space:nowrap;">
+                {total_display}
+            </td>
+        </tr>
+        ''')
+
+# The document around the rows, split at {rows} into a head and a tail
+_HTML_HEAD, _HTML_TAIL = Template(r'''
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    </head>
+    <body style="margin:0; padding:0; background-color:#faf7f2; font-family:Arial,'Helvetica Neue',Helvetica,sans-serif;">
+        <table role="presentation" width="100%" cellpadding="0" cellspacing="0" style="background-color:#faf7f2;">
+            <tr>
+                <td align="center" style="padding:40px 16px;">
+                    <table role="presentation" width="650" cellpadding="0" cellspacing="0" style="max-width:650px; width:100%;">
+
+                        <!-- Header -->
+                        <tr>
+                            <td align="center" style="padding-bottom:32px;">
+                                <h1 style="font-size:26px; color:#3d3250; font-weight:400; margin:0;
+                                           font-family:Georgia,'Times New Roman',serif;">
+                                    CAD <span style="color:#8b7ec8;">to BOQ</span>
+                                </h1>
+                                <p style="color:#a69db4; font-size:12px; letter-spacing:1px; margin-top:6px;
+                                          text-transform:uppercase;">
+                                    Bill of Quantities Report
+                                </p>
+                            </td>
+                        </tr>
+
+                        <!-- Summary Card -->
+                        <tr>
+                            <td style="padding-bottom:24px;">
+                                <table role="presentation" width="100%" cellpadding="0" cellspacing="0"
+                                       style="background:#ffffff; border-radius:12px;
+                                              border:1px solid rgba(139,126,200,0.12);
+                                              box-shadow:0 2px 12px rgba(61,50,80,0.04);">
+                                    <tr>
+                                        <td style="padding:28px 32px;">
+                                            <p style="font-size:11px; color:#a69db4; margin:0 0 6px 0;
+                                                      letter-spacing:1px; text-transform:uppercase;">
+                                                Estimated Project Cost
+                                            </p>
+                                            <p style="font-size:36px; color:#8b7ec8; font-weight:600; margin:0;
+                                                      font-family:Georgia,'Times New Roman',serif; line-height:1.2;">
+                                                ₹{grand_total:,.2f}
+                                            </p>
+                                            <p style="font-size:13px; color:#a69db4; margin-top:10px;">
+                                                {item_count} line item{plural} extracted
+                                            </p>
+                                        </td>
+                                    </tr>
+                                </table>
+                            </td>
+                        </tr>
+
+                        <!-- BOQ Table -->
+                        <tr>
+                            <td>
+                                <table role="presentation" width="100%" cellpadding="0" cellspacing="0"
+                                       style="background:#ffffff; border-radius:12px; overflow:hidden;
+                                              border:1px solid rgba(139,126,200,0.12);
+                                              box-shadow:0 2px 12px rgba(61,50,80,0.04);">
+                                    <tr>
+                                        <td>
+                                            <table width="100%" cellpadding="0" cellspacing="0"
+                                                   style="border-collapse:collapse; font-size:14px;
+                                                          table-layout:fixed; width:100%;">
+                                                <colgroup>
+                                                    <col style="width:40px;">
+                                                    <col style="width:140px;">
+                                                    <col style="width:100px;">
+                                                    <col style="width:50px;">
+                                                    <col style="width:110px;">
+                                                    <col style="width:210px;">
+                                                </colgroup>
+                                                <thead>
+                                                    <tr style="background:#f8f5f0;">
+                                                        <th style="padding:14px 16px; font-size:11px; color:#8b7ec8;
+                                                                   text-transform:uppercase; letter-spacing:1px;
+                                                                   font-family:Arial,sans-serif; font-weight:600;
+                                                                   border-bottom:2px solid rgba(139,126,200,0.1);
+                                                                   text-align:center;">
+                                                            #
+                                                        </th>
+                                                        <th style="padding:14px 16px; font-size:11px; color:#8b7ec8;
+                                                                   text-transform:uppercase; letter-spacing:1px;
+                                                                   font-family:Arial,sans-serif; font-weight:600;
+                                                                   border-bottom:2px solid rgba(139,126,200,0.1);
+                                                                   text-align:left;">
+                                                            Component
+                                                        </th>
+                                                        <th style="padding:14px 16px; font-size:11px; color:#8b7ec8;
+                                                                   text-transform:uppercase; letter-spacing:1px;
+                                                                   font-family:Arial,sans-serif; font-weight:600;
+                                                                   border-bottom:2px solid rgba(139,126,200,0.1);
+                                                                   text-align:right;">
+                                                            Qty
+                                                        </th>
+                                                        <th style="padding:14px 16px; font-size:11px; color:#8b7ec8;
+                                                                   text-transform:uppercase; letter-spacing:1px;
+                                                                   font-family:Arial,sans-serif; font-weight:600;
+                                                                   border-bottom:2px solid rgba(139,126,200,0.1);
+                                                                   text-align:center;">
+                                                            Unit
+                                                        </th>
+                                                        <th style="padding:14px 16px; font-size:11px; color:#8b7ec8;
+                                                                   text-transform:uppercase; letter-spacing:1px;
+                                                                   font-family:Arial,sans-serif; font-weight:600;
+                                                                   border-bottom:2px solid rgba(139,126,200,0.1);
+                                                                   text-align:right;">
+                                                            Rate
+                                                        </th>
+                                                        <th style="padding:14px 16px; font-size:11px; color:#8b7ec8;
+                                                                   text-transform:uppercase; letter-spacing:1px;
+                                                                   font-family:Arial,sans-serif; font-weight:600;
+                                                                   border-bottom:2px solid rgba(139,126,200,0.1);
+                                                                   text-align:right;">
+                                                            Total
+                                                        </th>
+                                                    </tr>
+                                                </thead>
+                                                <tbody>
+                                                    {rows}
+                                                </tbody>
+                                                <tfoot>
+                                                    <tr>
+                                                        <td colspan="4" style="padding:18px 16px; text-align:right;
+                                                                                 background:#f8f5f0;
+                                                                                 border-top:2px solid rgba(139,126,200,0.12);">
+                                                            <span style="font-weight:700; font-size:12px; color:#7a7088;
+                                                                         text-transform:uppercase; letter-spacing:1px;
+                                                                         font-family:Arial,sans-serif;">
+                                                                Grand Total
+                                                            </span>
+                                                        </td>
+                                                        <td colspan="2" style="padding:18px 16px; text-align:right;
+                                                                                 font-weight:700; font-size:20px;
+                                                                                 color:#82b868; background:#f8f5f0;
+                                                                                 border-top:2px solid rgba(139,126,200,0.12);
+                                                                                 font-family:Georgia,'Times New Roman',serif;
+                                                                                 white-space:nowrap;">
+                                                            ₹{grand_total:,.2f}
+                                                        </td>
+                                                    </tr>
+                                                </tfoot>
+                                            </table>
+                                        </td>
+                                    </tr>
+                                </table>
+                            </td>
+                        </tr>
+
+                        <!-- Footer -->
+                        <tr>
+                            <td align="center" style="padding-top:32px; border-top:1px solid rgba(139,126,200,0.08);">
+                                <p style="font-size:12px; color:#a69db4; margin:24px 0 0 0;">
+                                    Generated by CAD to BOQ Engine
+                                </p>
+                                <p style="font-size:11px; color:#ccc; margin-top:4px;">
+                                    Rates are estimated (DSR 2024 approx). Please verify before use.
+                                </p>
+                            </td>
+                        </tr>
+
+                    </table>
+                </td>
+            </tr>
+        </table>
+    </body>
+    </html>
+    ''').split("rows")
+
+
+def _html_row_values(item: dict) -> dict:
+    has_total = item["total"] > 0
+    return {
+        "item_no": str(item["item_no"]).zfill(2),
+        "component": html.escape(str(item["component"])),
+        "quantity": item["quantity"],
+        "unit": html.escape(str(item["unit"])),
+        "rate": item["rate"],
+        "total_display": f"₹{item['total']:,.2f}" if has_total else "—",
+        "total_color": "#82b868" if has_total else "#a69db4",
+    }
+
+
+def iter_html(items: list) -> Iterator[str]:
+    """Styled HTML report. The summary comes first, so items must be a list."""
+    total = grand_total(items)
+    summary = {"grand_total": total, "item_count": len(items), "plural": "s" if len(items) != 1 else ""}
+
+    out = []
+    _HTML_HEAD.render_into(out, summary)
+    for i, item in enumerate(items, 1):
+        _HTML_ROW.render_into(out, _html_row_values(item))
+        if i % CHUNK_ROWS == 0:
+            yield "".join(out)
+            out = []
+    _HTML_TAIL.render_into(out, summary)
+    yield "".join(out)
+
+
+# ── Plain text ───────────────────────────────
+
+_TEXT_RULE = "-" * 75 + "\n"
+_TEXT_HEAD = Template(
+    "CAD to BOQ Report\n\n"
+    "Estimated Project Cost: ₹{grand_total:,.2f}\n"
+    "Items: {item_count}\n\n"
+    + f"{'#':<4} {'Component':<25} {'Qty':>12} {'Unit':>6} {'Rate':>12} {'Total':>14}\n"
+    + _TEXT_RULE
+)
+_TEXT_ROW = Template(
+    "{item_no:<4} {component:<25} {quantity:>12,.2f} {unit:>6} ₹{rate:>10,.2f} ₹{total:>12,.2f}\n"
+)
+_TEXT_TAIL = Template(_TEXT_RULE + f"{'Grand Total':>49} " + "₹{grand_total:>12,.2f}\n")
+
+
+def iter_text(items: list) -> Iterator[str]:
+    """Fixed-width plain-text report. The summary comes first, so items must be a list."""
+    summary = {"grand_total": grand_total(items), "item_count": len(items)}
+
+    out = []
+    _TEXT_HEAD.render_into(out, summary)
+    for i, item in enumerate(items, 1):
+        _TEXT_ROW.render_into(out, item)
+        if i % CHUNK_ROWS == 0:
+            yield "".join(out)
+            out = []
+    _TEXT_TAIL.render_into(out, summary)
+    yield "".join(out)
+
+
+# ── CSV ──────────────────────────────────────
+
+def _table_rows(items: Iterable[dict]) -> Iterator[tuple]:
+    """Header, one row per item, then the grand total row — for any iterable, in one pass."""
+    yield COLUMNS
+    total = 0
+    for item in items:
+        total += item.get("total", 0)
+        yield (
+            item["item_no"], item["component"], item.get("description", ""),
+            item["quantity"], item["unit"], item["rate"], item["total"],
+        )
+    yield ("", "", "", "", "", "Grand Total", round(total, 2))
+
+
+class _Lines(list):
+    """File-like sink that keeps what is written as a list of strings."""
+
+    write = list.append
+
+
+def iter_csv(items: Iterable[dict]) -> Iterator[str]:
+    """CSV report with a grand total row; items may be any iterable."""
+    out = _Lines()
+    writer = csv.writer(out)
+    for i, row in enumerate(_table_rows(items), 1):
+        writer.writerow(row)
+        if i % CHUNK_ROWS == 0:
+            yield "".join(out)
+            out.clear()
+    yield "".join(out)
+
+
+# ── XLSX ─────────────────────────────────────
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="BOQ" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Cell styles: 0 default, 1 "#,##0.00" (built-in format 4), 2 bold
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '</cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = "</sheetData></worksheet>"
+
+# Columns shown with two decimals: Quantity, Rate, Total
+_DECIMAL_COLUMNS = {3, 5, 6}
+
+
+def _xlsx_cell(column: int, value, bold: bool) -> str:
+    if value == "":
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        style = ' s="1"' if column in _DECIMAL_COLUMNS else ""
+        return f"<c{style}><v>{value!r}</v></c>"
+    style = ' s="2"' if bold else ""
+    return f'<c{style} t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+class _ByteChunks:
+    """Unseekable binary sink the ZIP writer streams into; drained between rows."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_xlsx(items: Iterable[dict]) -> Iterator[bytes]:
+    """
+    XLSX workbook with one "BOQ" sheet, as bytes chunks; items may be any iterable.
+
+    The sheet is deflated as it is written and the ZIP uses data descriptors,
+    so nothing but the current chunk is ever held in memory.
+    """
+    sink = _ByteChunks()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        yield sink.drain()
+
+        with workbook.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_SHEET_HEAD.encode())
+            rows = []
+            for r, row in enumerate(_table_rows(items), 1):
+                # The header and the grand total row are bold
+                bold = r == 1 or row[0] == ""
+                cells = "".join(_xlsx_cell(c, value, bold) for c, value in enumerate(row))
+                rows.append(f'<row r="{r}">{cells}</row>')
+                if r % CHUNK_ROWS == 0:
+                    sheet.write("".join(rows).encode())
+                    rows = []
+                    yield sink.drain()
+            sheet.write(("".join(rows) + _SHEET_TAIL).encode())
+    yield sink.drain()
+
+
+# ── Entry points ─────────────────────────────
+
+RENDERERS = {"html": iter_html, "text": iter_text, "csv": iter_csv, "xlsx": iter_xlsx}
+
+
+def render(items: list, fmt: str):
+    """A whole report as one str (bytes for xlsx), joined once."""
+    chunks = RENDERERS[fmt](items)
+    return b"".join(chunks) if fmt == "xlsx" else "".join(chunks)
+
+
+def stream(items: list, fmt: str) -> Iterator:
+    """A report's chunks, for a streaming response. Raises KeyError for unknown formats."""
+    return RENDERERS[fmt](items)
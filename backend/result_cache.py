@@ -0,0 +1,161 @@
+"""
+Result Cache — content-addressed cache for the /process pipeline.
+
+Uploads are keyed by the SHA-256 of their bytes, hashed by upload_ingest
+as they are streamed to disk. Two tiers are kept:
+- disk: the converted DXF (keyed by content hash only, so a parser upgrade
+  does not force a re-conversion) and the parsed raw_data (keyed by content
+  hash + parser version)
+- memory: an LRU of parsed raw_data bounded by entry count, total size and age
+
+The disk tier (with revision snapshots under it) is bounded the same way
+by cache_sweeper: files unused for CACHE_DISK_TTL_SECONDS go first, then
+the least recently used while it is over CACHE_DISK_MAX_MB. Disk hits
+refresh a file's timestamps so it counts as recently used.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from cad_parser import PARSER_VERSION
+from upload_ingest import UPLOAD_GRACE_SECONDS, DirectorySweeper
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+CACHE_DISK_MAX_BYTES = int(os.getenv("CACHE_DISK_MAX_MB", "20480")) * 1024 * 1024
+CACHE_DISK_TTL_SECONDS = float(os.getenv("CACHE_DISK_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+
+
+def cache_key(digest: str) -> str:
+    """Combine a content hash with the parser version into a result key."""
+    return f"{digest}-p{PARSER_VERSION}"
+
+
+def _touch(path: str) -> None:
+    """Mark a disk tier file as just used (atime alone isn't updated on every mount)."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+class ResultCache:
+    """Two-tier (memory LRU + disk) cache of converted DXFs and parsed raw_data."""
+
+    def __init__(self, root: str, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._dxf_dir = os.path.join(root, "dxf")
+        self._raw_dir = os.path.join(root, "raw")
+        os.makedirs(self._dxf_dir, exist_ok=True)
+        os.makedirs(self._raw_dir, exist_ok=True)
+
+        # key -> (raw_data, stored_at, size_in_bytes)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    # ── Memory tier ──────────────────────────────
+
+    def _memory_get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            raw_data, stored_at, size = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._memory[key]
+                self._memory_bytes -= size
+                return None
+            self._memory.move_to_end(key)
+            return raw_data
+
+    def _memory_put(self, key: str, raw_data: dict, size: int) -> None:
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old[2]
+            # Entries larger than the whole budget are served from disk only
+            if size > self.max_bytes:
+                return
+            self._memory[key] = (raw_data, time.monotonic(), size)
+            self._memory_bytes += size
+            while self._memory and (
+                len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    # ── Disk tier ────────────────────────────────
+
+    def _raw_path(self, key: str) -> str:
+        return os.path.join(self._raw_dir, f"{key}.json")
+
+    def dxf_path(self, digest: str) -> str:
+        """Location of the cached converted DXF for a content hash."""
+        return os.path.join(self._dxf_dir, f"{digest}.dxf")
+
+    def get_dxf(self, digest: str) -> Optional[str]:
+        """Return the cached converted DXF path, or None if not converted yet."""
+        path = self.dxf_path(digest)
+        if not os.path.exists(path):
+            return None
+        _touch(path)
+        return path
+
+    def adopt_dxf(self, digest: str, path: str) -> str:
+        """Move an uploaded DXF file into the disk tier (no copy on the same filesystem) and return its path."""
+        target = self.dxf_path(digest)
+        tmp = f"{target}.{threading.get_ident()}.tmp"
+        shutil.move(path, tmp)
+        os.replace(tmp, target)
+        return target
+
+    # ── Public API ───────────────────────────────
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return cached raw_data for a result key, promoting disk hits into memory."""
+        raw_data = self._memory_get(key)
+        if raw_data is not None:
+            return raw_data
+
+        path = self._raw_path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+        except FileNotFoundError:
+            return None
+        _touch(path)
+
+        try:
+            raw_data = json.loads(payload)
+        except ValueError:
+            # Corrupt/partial entry — treat as a miss
+            return None
+
+        self._memory_put(key, raw_data, len(payload))
+        return raw_data
+
+    def put(self, key: str, raw_data: dict) -> None:
+        """Store raw_data in both tiers."""
+        payload = json.dumps(raw_data).encode("utf-8")
+        path = self._raw_path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        self._memory_put(key, raw_data, len(payload))
+
+
+result_cache = ResultCache(CACHE_DIR, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_SECONDS)
+cache_sweeper = DirectorySweeper(CACHE_DIR, CACHE_DISK_TTL_SECONDS, CACHE_DISK_MAX_BYTES, UPLOAD_GRACE_SECONDS)
@@ -0,0 +1,371 @@
+"""
+Revision Diff — incremental BOQ for successive revisions of one drawing.
+
+A snapshot records, per DXF handle, a fingerprint of the entity, its
+(layer, linetype, color), its straight segments and what it contributed
+to the quantity totals, plus the drawing's line dedup and wall results
+and the finished parse_dxf-shaped result. When a new revision is linked
+to a previous result, only added, removed and modified entities go
+through the handlers; the new totals are the previous totals (and
+per-layer/linetype/color breakdown) adjusted by those differences.
+
+What that saves is the measuring: handlers, curve flattening and block
+evaluation for unchanged entities, and the previous revision's result,
+which is read from its snapshot. Line dedup and walls work across the
+whole drawing, so they are redone from the snapshot's segments — but
+only when a LINE or a segment on a wall layer changed. What it does not
+save is reading the drawing and fingerprinting every entity: that still
+grows with the drawing, and entity types without a dedicated fingerprint
+(anything but LINE, CIRCLE, ARC, LWPOLYLINE and INSERT) are fingerprinted
+from all their exported DXF tags, which can cost as much as measuring
+them.
+
+Snapshots are pickled under CACHE_DIR/revisions, keyed by result id.
+Room quantities depend on every room polygon at once and are not carried
+through revisions; process a revision in full to get its per-room BOQ.
+"""
+
+import copy
+import hashlib
+import itertools
+import os
+import pickle
+
+import numpy as np
+
+from ezdxf.lldxf.tagwriter import TagCollector
+
+from cad_parser import (
+    ENTITY_HANDLERS, GROUP_BY, PARSER_VERSION, ParseState, _handle_id, _style_key, new_block_engine,
+    open_drawing, round_breakdown, round_totals,
+)
+from result_cache import CACHE_DIR
+from segment_dedup import DEDUP_TOLERANCE, dedup_segments, round_dedup
+from wall_detection import detect_walls, round_walls, wall_layer_mask
+
+REVISIONS_DIR = os.path.join(CACHE_DIR, "revisions")
+# Bump whenever the snapshot layout changes so stored snapshots are rebuilt
+SNAPSHOT_VERSION = "2"
+os.makedirs(REVISIONS_DIR, exist_ok=True)
+
+
+def snapshot_path(result_id: str) -> str:
+    return os.path.join(REVISIONS_DIR, f"{result_id}.pkl")
+
+
+def load_snapshot(path: str):
+    """Load a snapshot, or None if it is missing or was written by another parser or snapshot version."""
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if snapshot.get("parser_version") != PARSER_VERSION or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def save_snapshot(path: str, snapshot: dict) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+# ── Fingerprints ─────────────────────────────
+
+def _digest(values) -> int:
+    # repr() of floats is exact, and unlike hash() the digest is stable
+    # across processes, so fingerprints can be persisted
+    return int.from_bytes(hashlib.blake2b(repr(values).encode(), digest_size=8).digest(), "little")
+
+
+def _tags_fingerprint(e) -> tuple:
+    """Generic fingerprint: every DXF tag the entity would write."""
+    collector = TagCollector()
+    e.export_dxf(collector)
+    return tuple(collector.tags)
+
+
+def fingerprint(e, blocks) -> int:
+    """
+    A 64-bit digest of everything in an entity that can change its contribution.
+
+    INSERTs also include the totals of the referenced block, so editing a
+    block definition marks every reference to it as modified.
+    """
+    dxf = e.dxf
+    kind = e.dxftype()
+    if kind == "LINE":
+        values = (kind, _style_key(dxf), tuple(dxf.start), tuple(dxf.end))
+    elif kind == "CIRCLE":
+        values = (kind, _style_key(dxf), tuple(dxf.center), dxf.radius)
+    elif kind == "ARC":
+        values = (kind, _style_key(dxf), tuple(dxf.center), dxf.radius, dxf.start_angle, dxf.end_angle)
+    elif kind == "LWPOLYLINE":
+        values = (kind, _style_key(dxf), e.closed, tuple(e.get_points(format="xyb")))
+    elif kind == "INSERT":
+        block_totals = blocks.totals(dxf.name) if blocks is not None else None
+        values = (
+            kind, _style_key(dxf), dxf.name, tuple(dxf.insert), dxf.xscale, dxf.yscale,
+            dxf.rotation, dxf.row_count, dxf.column_count,
+            tuple(sorted(block_totals.items())) if block_totals else None,
+        )
+    else:
+        values = _tags_fingerprint(e)
+    return _digest(values)
+
+
+# ── Snapshots ────────────────────────────────
+
+def _apply(contribution: tuple, totals: dict, sign: int) -> None:
+    for i in range(0, len(contribution), 2):
+        key = contribution[i]
+        totals[key] = totals.get(key, 0) + sign * contribution[i + 1]
+
+
+def _apply_grouped(contribution: tuple, style: tuple, breakdown: dict, sign: int) -> None:
+    for field, name in enumerate(GROUP_BY):
+        _apply(contribution, breakdown[name].setdefault(str(style[field]), {}), sign)
+
+
+def _coords(segments: dict, handles: list) -> np.ndarray:
+    flat = itertools.chain.from_iterable(segments[handle] for handle in handles)
+    return np.fromiter(flat, dtype=np.float64).reshape(-1, 4)
+
+
+def _lengths(coords: np.ndarray) -> np.ndarray:
+    return np.hypot(coords[:, 2] - coords[:, 0], coords[:, 3] - coords[:, 1])
+
+
+def _feeds_sweeps(contribution: tuple, style: tuple, on_wall_layer: dict) -> bool:
+    """Whether an entity's segments go into line dedup or wall detection."""
+    if contribution[0] == "total_line_length":
+        return True
+    layer = style[0]
+    if layer not in on_wall_layer:
+        on_wall_layer[layer] = bool(wall_layer_mask([layer])[0])
+    return on_wall_layer[layer]
+
+
+def _sweeps(segments: dict, styles: dict, contributions: dict) -> dict:
+    """
+    Line dedup and wall detection over a snapshot's segments, as parse_dxf does them.
+
+    Snapshot totals hold every LINE at full length; line_correction is
+    what dedup changes that by, per style.
+    """
+    line_handles = [h for h in segments if contributions[h][0] == "total_line_length"]
+    other_handles = [h for h in segments if contributions[h][0] != "total_line_length"]
+    lines = _coords(segments, line_handles)
+    line_styles = [styles[h] for h in line_handles]
+    dedup = None
+    line_correction = {}
+
+    if DEDUP_TOLERANCE > 0:
+        deduped, source, dedup = dedup_segments(lines)
+        # Per style: deduplicated minus original line length
+        style_ids = {}
+        codes = np.array([style_ids.setdefault(style, len(style_ids)) for style in line_styles], dtype=np.intp)
+        delta = (
+            np.bincount(codes[source], _lengths(deduped), minlength=len(style_ids))
+            - np.bincount(codes, _lengths(lines), minlength=len(style_ids))
+        ) if len(codes) else np.empty(0)
+        line_correction = {style: change for style, change in zip(style_ids, delta.tolist()) if change}
+        lines, line_styles = deduped, [line_styles[i] for i in source.tolist()]
+
+    # Walls from the (deduplicated) lines and the polyline edges on wall layers
+    other_styles = [styles[h] for h in other_handles for _ in range(len(segments[h]) // 4)]
+    layers = sorted({style[0] for style in line_styles} | {style[0] for style in other_styles})
+    on_wall_layer = dict(zip(layers, wall_layer_mask(layers).tolist()))
+    mask = np.array([on_wall_layer[style[0]] for style in line_styles + other_styles], dtype=bool)
+    if mask.any():
+        walls = detect_walls(np.vstack((lines, _coords(segments, other_handles)))[mask])
+    else:
+        walls = detect_walls(np.empty((0, 4)))
+    return {"line_correction": line_correction, "dedup": dedup, "walls": walls}
+
+
+def _result(totals: dict, breakdown: dict, sweeps: dict) -> dict:
+    """The rounded parse_dxf-shaped result: totals with the sweeps applied."""
+    totals = dict(totals)
+    breakdown = copy.deepcopy(breakdown)
+    for style, change in sweeps["line_correction"].items():
+        totals["total_line_length"] += change
+        for field, name in enumerate(GROUP_BY):
+            group = breakdown[name].setdefault(str(style[field]), {})
+            group["total_line_length"] = group.get("total_line_length", 0) + change
+
+    result = round_totals(totals)
+    result.update(round_walls(sweeps["walls"]))
+    if sweeps["dedup"] is not None:
+        result["dedup"] = round_dedup(sweeps["dedup"])
+    result["breakdown"] = round_breakdown(breakdown)
+    return result
+
+
+def raw_data(snapshot: dict) -> dict:
+    """The parse_dxf-shaped result a snapshot stands for (computed when it was built)."""
+    return copy.deepcopy(snapshot["result"])
+
+
+def diff_drawing(path: str, previous: dict = None) -> tuple:
+    """
+    Fingerprint a drawing and process only what changed since `previous`.
+
+    With previous=None every entity counts as added, which builds the
+    first snapshot of a revision chain.
+
+    Returns:
+        (snapshot, stats) — stats counts added/removed/modified/unchanged
+    """
+    previous = previous or {
+        "fingerprints": {}, "contributions": {}, "styles": {}, "segments": {}, "totals": {},
+        "breakdown": {name: {} for name in GROUP_BY},
+    }
+    old_fingerprints = previous["fingerprints"]
+
+    entities, block_source = open_drawing(path)
+    blocks = new_block_engine(block_source)
+    changed = ParseState(blocks)
+
+    fingerprints = {}
+    changed_handles = []
+    handlers = ENTITY_HANDLERS
+    for e in entities:
+        handler = handlers.get(e.dxftype())
+        if handler is None:
+            continue
+        handle = _handle_id(e.dxf)
+        fp = fingerprint(e, blocks)
+        fingerprints[handle] = fp
+        if old_fingerprints.get(handle) != fp:
+            handler(e, changed)
+            changed_handles.append(handle)
+
+    new_contributions = changed.entity_contributions()
+    new_styles = changed.entity_styles()
+    new_segments = changed.entity_segments()
+    # An edited entity that no longer contributes (a polyline cut down to
+    # one point, a spline that no longer flattens) is as good as removed
+    removed = (old_fingerprints.keys() - fingerprints.keys()) | {
+        h for h in changed_handles if h in old_fingerprints and h not in new_contributions
+    }
+    modified = [h for h in new_contributions if h in old_fingerprints]
+
+    # Start from the previous contributions and totals, then patch them
+    contributions = dict(previous["contributions"])
+    styles = dict(previous["styles"])
+    segments = dict(previous["segments"])
+    totals = dict(previous["totals"]) or ParseState().totals()
+    breakdown = copy.deepcopy(previous["breakdown"])
+
+    # Line dedup and walls are only redone if a segment they use changed
+    on_wall_layer = {}
+    sweeps_stale = "sweeps" not in previous
+
+    for handle in list(removed) + modified:
+        contribution = contributions.pop(handle, ())
+        _apply(contribution, totals, -1)
+        # Entities that never contributed (e.g. a one-vertex polyline) have no style
+        style = styles.pop(handle, None)
+        if style is not None:
+            _apply_grouped(contribution, style, breakdown, -1)
+        if segments.pop(handle, None) is not None:
+            sweeps_stale = sweeps_stale or _feeds_sweeps(contribution, style, on_wall_layer)
+    for handle, contribution in new_contributions.items():
+        _apply(contribution, totals, +1)
+        _apply_grouped(contribution, new_styles[handle], breakdown, +1)
+        contributions[handle] = contribution
+        styles[handle] = new_styles[handle]
+        if handle in new_segments:
+            segments[handle] = new_segments[handle]
+            sweeps_stale = sweeps_stale or _feeds_sweeps(contribution, new_styles[handle], on_wall_layer)
+
+    sweeps = _sweeps(segments, styles, contributions) if sweeps_stale else previous["sweeps"]
+    snapshot = {
+        "parser_version": PARSER_VERSION,
+        "version": SNAPSHOT_VERSION,
+        "fingerprints": fingerprints,
+        "contributions": contributions,
+        "styles": styles,
+        "segments": segments,
+        "totals": totals,
+        "breakdown": breakdown,
+        "sweeps": sweeps,
+        "result": _result(totals, breakdown, sweeps),
+    }
+    stats = {
+        "added": len(new_contributions) - len(modified),
+        "removed": len(removed),
+        "modified": len(modified),
+        "unchanged": len(fingerprints) - len(changed_handles),
+    }
+    return snapshot, stats
+
+
+def diff_revision(dxf_path: str, previous_dxf_path: str, previous_id: str, result_id: str) -> tuple:
+    """
+    Compute a revision's quantities incrementally from its predecessor.
+
+    Builds (and stores) the predecessor's snapshot first if it has none yet.
+    Meant to run in a worker process: snapshots are passed through disk.
+
+    Returns:
+        (raw_data, previous_raw_data, stats)
+    """
+    previous = load_snapshot(snapshot_path(previous_id))
+    if previous is None:
+        previous, _ = diff_drawing(previous_dxf_path)
+        save_snapshot(snapshot_path(previous_id), previous)
+
+    snapshot, stats = diff_drawing(dxf_path, previous)
+    save_snapshot(snapshot_path(result_id), snapshot)
+    return raw_data(snapshot), raw_data(previous), stats
+
+
+def quantity_delta(previous_raw: dict, raw: dict) -> dict:
+    """
+    Per-key change in the rounded quantities (keys that didn't change are omitted).
+
+    Nested groups (breakdown, dedup, walls_by_thickness) are compared
+    key by key and keep their shape; anything that isn't a number or a
+    group is skipped.
+    """
+    delta = {}
+    for key in raw.keys() | previous_raw.keys():
+        before, after = previous_raw.get(key, 0), raw.get(key, 0)
+        if isinstance(before, dict) or isinstance(after, dict):
+            change = quantity_delta(
+                before if isinstance(before, dict) else {}, after if isinstance(after, dict) else {}
+            )
+        elif isinstance(before, (int, float)) and isinstance(after, (int, float)):
+            change = round(after - before, 2)
+        else:
+            continue
+        if change:
+            delta[key] = change
+    return delta
+
+
+def boq_delta(previous_boq: list, boq: list) -> list:
+    """Line-by-line BOQ comparison, matched by component name."""
+    before = {item["component"]: item for item in previous_boq}
+    after = {item["component"]: item for item in boq}
+
+    delta = []
+    for component in list(after) + [c for c in before if c not in after]:
+        old, new = before.get(component, {}), after.get(component, {})
+        quantity_change = round(new.get("quantity", 0) - old.get("quantity", 0), 2)
+        total_change = round(new.get("total", 0) - old.get("total", 0), 2)
+        if quantity_change or total_change:
+            delta.append({
+                "component": component,
+                "previous_quantity": old.get("quantity", 0),
+                "quantity": new.get("quantity", 0),
+                "quantity_change": quantity_change,
+                "previous_total": old.get("total", 0),
+                "total": new.get("total", 0),
+                "total_change": total_change,
+            })
+    return delta
@@ -0,0 +1,147 @@
+"""
+Segment Dedup — removes duplicated and overlapping LINE geometry.
+
+Copy/paste slips and bound xrefs leave the same line drawn twice, or
+collinear lines overlapping one another, and every copy used to count
+towards the measured length. Before takeoff:
+
+1. Endpoints are snapped to a DEDUP_TOLERANCE grid and each segment is
+   oriented canonically, so A→B and B→A are the same integer 4-tuple.
+2. Exact duplicates among those tuples are dropped: rows are hashed and
+   sorted by hash, then compared with their neighbour.
+3. The rest are keyed by their carrying line — reduced integer direction
+   plus offset, exact on the grid — and sorted along it. A running
+   maximum over the sorted intervals finds where collinear runs start,
+   and each run is replaced by a single segment spanning it.
+
+Everything is sorts and vectorized scans: O(n log n) for n segments.
+"""
+
+import os
+
+import numpy as np
+
+# Snap grid in drawing units (1 mm for drawings in metres); 0 disables dedup
+DEDUP_TOLERANCE = float(os.getenv("DEDUP_TOLERANCE", "0.001"))
+
+
+def _canonical(grid: np.ndarray) -> np.ndarray:
+    """Orient snapped segments so the first endpoint is the lexicographically smaller one."""
+    swap = (grid[:, 0] > grid[:, 2]) | ((grid[:, 0] == grid[:, 2]) & (grid[:, 1] > grid[:, 3]))
+    grid[swap] = grid[swap][:, [2, 3, 0, 1]]
+    return grid
+
+
+def _row_hash(*columns: np.ndarray) -> np.ndarray:
+    """Mix int64 columns into one uint64 per row."""
+    h = np.zeros(len(columns[0]), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for column in columns:
+            h ^= column.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15) + (h << np.uint64(6)) + (h >> np.uint64(2))
+            h *= np.uint64(0xBF58476D1CE4E5B9)
+    return h
+
+
+def dedup_segments(segments: np.ndarray, tolerance: float = DEDUP_TOLERANCE) -> tuple:
+    """
+    Deduplicate (n, 4) x1, y1, x2, y2 segments.
+
+    Segments that survive unmerged keep their exact coordinates; merged
+    runs are rebuilt from snapped ones.
+
+    Returns:
+        (segments, source, stats) — the output segments, the index of the
+        input segment each one stands for (the first of its run), and
+        counts of what was removed
+    """
+    n = len(segments)
+    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    stats = {
+        "input_segments": n,
+        "duplicate_segments": 0,
+        "merged_segments": 0,
+        "output_segments": n,
+        "removed_length": 0.0,
+    }
+    if n < 2 or tolerance <= 0:
+        return segments, np.arange(n), stats
+
+    grid = _canonical(np.rint(segments / tolerance).astype(np.int64))
+
+    # 1. Exact duplicates on the snap grid — the first occurrence survives.
+    # Rows are sorted by a 64-bit hash (radix sort) and compared with their
+    # neighbour; a hash collision can only hide a duplicate, never invent one.
+    order = np.argsort(_row_hash(*grid.T), kind="stable")
+    sorted_grid = grid[order]
+    duplicate = np.zeros(n, dtype=bool)
+    duplicate[order[1:]] = np.all(sorted_grid[1:] == sorted_grid[:-1], axis=1)
+    unique = np.flatnonzero(~duplicate)
+    stats["duplicate_segments"] = n - len(unique)
+
+    g = grid[unique]
+    dx, dy = g[:, 2] - g[:, 0], g[:, 3] - g[:, 1]
+    degenerate = (dx == 0) & (dy == 0)
+    passthrough = unique[degenerate]
+    ids, g, dx, dy = unique[~degenerate], g[~degenerate], dx[~degenerate], dy[~degenerate]
+
+    # 2. Carrying line: reduced direction (canonical orientation makes it
+    # unique) and the exact integer offset of the line along its normal
+    k = np.gcd(dx, dy)
+    dx, dy = dx // k, dy // k
+    offset = dy * g[:, 0] - dx * g[:, 1]
+    norm = np.hypot(dx, dy)
+    t1 = (g[:, 0] * dx + g[:, 1] * dy) / norm * tolerance
+    t2 = (g[:, 2] * dx + g[:, 3] * dy) / norm * tolerance
+
+    # Sort by carrying line, then along it: two stable radix-friendly sorts
+    # on a line hash instead of a four-key lexsort. Group boundaries compare
+    # the actual keys, so a collision only costs a missed merge.
+    order = np.argsort(t1)
+    order = order[np.argsort(_row_hash(dx, dy, offset)[order], kind="stable")]
+    ids, g, dx, dy, offset, norm, t1, t2 = (
+        a[order] for a in (ids, g, dx, dy, offset, norm, t1, t2)
+    )
+    group_start = np.r_[True, (dx[1:] != dx[:-1]) | (dy[1:] != dy[:-1]) | (offset[1:] != offset[:-1])]
+
+    # 3. Collinear runs. Groups are shifted apart along one axis so a single
+    # running maximum never carries over from one carrying line to the next.
+    group_id = np.cumsum(group_start) - 1
+    group_firsts = np.flatnonzero(group_start)
+    group_base = t1[group_firsts]
+    group_span = np.maximum.reduceat(t2, group_firsts) - group_base
+    group_shift = np.cumsum(group_span + 1.0) - (group_span + 1.0) - group_base
+    reach = np.maximum.accumulate(t2 + group_shift[group_id])
+    # Pieces closer than the snap tolerance join into one run
+    run_start = group_start.copy()
+    run_start[1:] |= (t1[1:] + group_shift[group_id[1:]]) > reach[:-1] + tolerance / 2
+
+    firsts = np.flatnonzero(run_start)
+    run_sizes = np.diff(np.r_[firsts, len(ids)])
+    run_end = np.maximum.reduceat(t2, firsts)
+    stats["merged_segments"] = int((run_sizes - 1).sum())
+
+    out = segments[ids[firsts]].copy()
+    merged = run_sizes > 1
+    if merged.any():
+        # Rebuild merged runs from the run's first snapped start point
+        first = firsts[merged]
+        start = g[first, :2] * tolerance
+        direction = np.column_stack((dx[first], dy[first])) / norm[first, None]
+        end = start + direction * (run_end[merged] - t1[first])[:, None]
+        out[merged] = np.hstack((start, end))
+
+    source = np.r_[ids[firsts], passthrough]
+    out = np.vstack((out, segments[passthrough]))
+    # Keep the input order of the survivors
+    order = np.argsort(source, kind="stable")
+    out, source = out[order], source[order]
+
+    stats["output_segments"] = len(out)
+    stats["removed_length"] = float(
+        lengths.sum() - np.hypot(out[:, 2] - out[:, 0], out[:, 3] - out[:, 1]).sum()
+    )
+    return out, source, stats
+
+
+def round_dedup(stats: dict) -> dict:
+    return {**stats, "removed_length": round(stats["removed_length"], 2)}
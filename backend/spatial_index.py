@@ -0,0 +1,168 @@
+"""
+Spatial Index — uniform grid over polygons for batched point-in-polygon lookups.
+
+Each polygon is registered in every grid cell its bounding box touches.
+A batch of points is then located by hashing each point to its cell, so it
+is only tested against the few polygons registered there; the tests
+themselves are vectorized crossing-number evaluations over the candidate
+(point, polygon edge) pairs. Sorting the hits dominates: O(n log n) for n
+points instead of O(n * polygons).
+
+Polygons use the ragged layout of geometry_kernels: vertices concatenated
+into one (n, 2) array plus an offsets array, at least three vertices each.
+"""
+
+import numpy as np
+
+import geometry_kernels as kernels
+
+# Upper bound on grid cells per axis, whatever the spread of polygon sizes
+MAX_CELLS_PER_AXIS = 1024
+
+# Edge tests evaluated per vectorized batch (bounds temporary memory)
+EDGE_BATCH = 1 << 20
+
+
+def ragged_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, start + count) for every pair, vectorized."""
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return np.arange(total, dtype=np.int64) + shifts
+
+
+class PolygonGrid:
+    """
+    Uniform grid over a set of polygons.
+
+    Args:
+        xy: (n, 2) float array of all polygon vertices
+        offsets: int array; polygon j owns vertices offsets[j]:offsets[j + 1]
+        cell_size: grid pitch; defaults to the median polygon extent
+    """
+
+    def __init__(self, xy: np.ndarray, offsets: np.ndarray, cell_size: float = None):
+        self.xy = xy
+        self.offsets = offsets
+        self.areas = kernels.shoelace_areas(xy, offsets)
+        count = len(offsets) - 1
+
+        if count == 0:
+            self.cell_keys = np.empty(0, dtype=np.int64)
+            return
+
+        starts = offsets[:-1]
+        self.mins = np.minimum.reduceat(xy, starts, axis=0)
+        self.maxs = np.maximum.reduceat(xy, starts, axis=0)
+
+        self.origin = self.mins.min(axis=0)
+        extent = self.maxs.max(axis=0) - self.origin
+        if cell_size is None:
+            cell_size = float(np.median((self.maxs - self.mins).max(axis=1)))
+        self.cell_size = max(cell_size, float(extent.max()) / MAX_CELLS_PER_AXIS, 1e-9)
+        self.shape = (np.floor(extent / self.cell_size).astype(np.int64) + 1)
+
+        # Register every polygon in each cell its bounding box overlaps
+        lo = self._cells(self.mins)
+        hi = self._cells(self.maxs)
+        span = hi - lo + 1
+        per_polygon = span[:, 0] * span[:, 1]
+        polygon_ids = np.repeat(np.arange(count), per_polygon)
+        local = ragged_ranges(np.zeros(count, dtype=np.int64), per_polygon)
+        rows = np.repeat(span[:, 1], per_polygon)
+        ix = np.repeat(lo[:, 0], per_polygon) + local // rows
+        iy = np.repeat(lo[:, 1], per_polygon) + local % rows
+        keys = ix * self.shape[1] + iy
+
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        self.cell_polygons = polygon_ids[order]
+        self.cell_keys, self.cell_starts, cell_counts = np.unique(keys, return_index=True, return_counts=True)
+        self.cell_stops = self.cell_starts + cell_counts
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _cells(self, points: np.ndarray) -> np.ndarray:
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def _candidates(self, points: np.ndarray) -> tuple:
+        """(point index, polygon index) pairs whose cell and bounding box match."""
+        cells = self._cells(points)
+        in_grid = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        point_ids = np.flatnonzero(in_grid)
+        keys = cells[point_ids, 0] * self.shape[1] + cells[point_ids, 1]
+
+        pos = np.searchsorted(self.cell_keys, keys)
+        pos = np.minimum(pos, len(self.cell_keys) - 1)
+        hit = self.cell_keys[pos] == keys
+        point_ids, pos = point_ids[hit], pos[hit]
+
+        counts = self.cell_stops[pos] - self.cell_starts[pos]
+        pair_points = np.repeat(point_ids, counts)
+        pair_polygons = self.cell_polygons[ragged_ranges(self.cell_starts[pos], counts)]
+
+        p = points[pair_points]
+        inside_box = np.all((p >= self.mins[pair_polygons]) & (p <= self.maxs[pair_polygons]), axis=1)
+        return pair_points[inside_box], pair_polygons[inside_box]
+
+    def _contains(self, points: np.ndarray, pair_points: np.ndarray, pair_polygons: np.ndarray) -> np.ndarray:
+        """Crossing-number test for each (point, polygon) pair."""
+        offsets = self.offsets
+        xy = self.xy
+        vertex_counts = offsets[pair_polygons + 1] - offsets[pair_polygons]
+        inside = np.zeros(len(pair_points), dtype=bool)
+
+        # Batch pairs so that pairs x edges stays bounded
+        cumulative = np.cumsum(vertex_counts)
+        begin = 0
+        while begin < len(pair_points):
+            done = cumulative[begin - 1] if begin else 0
+            end = max(int(np.searchsorted(cumulative, done + EDGE_BATCH, side="right")), begin + 1)
+
+            counts = vertex_counts[begin:end]
+            first = offsets[pair_polygons[begin:end]]
+            edge_start = ragged_ranges(first, counts)
+            # The closing edge wraps from the last vertex back to the first
+            edge_end = edge_start + 1
+            edge_end[np.cumsum(counts) - 1] = first
+
+            p = points[pair_points[begin:end]]
+            px, py = p[:, 0].repeat(counts), p[:, 1].repeat(counts)
+            x1, y1 = xy[edge_start, 0], xy[edge_start, 1]
+            x2, y2 = xy[edge_end, 0], xy[edge_end, 1]
+            straddles = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            crosses = straddles & (px < crossing_x)
+
+            pair_starts = np.cumsum(counts) - counts
+            inside[begin:end] = np.add.reduceat(crosses.astype(np.int64), pair_starts) % 2 == 1
+            begin = end
+        return inside
+
+    def locate(self, points: np.ndarray) -> np.ndarray:
+        """
+        Index of the smallest polygon containing each point, or -1.
+
+        Nested polygons resolve to the innermost one — a room inside a
+        building outline, say, rather than the outline.
+        """
+        result = np.full(len(points), -1, dtype=np.int64)
+        if len(self) == 0 or len(points) == 0:
+            return result
+
+        pair_points, pair_polygons = self._candidates(points)
+        if len(pair_points) == 0:
+            return result
+        inside = self._contains(points, pair_points, pair_polygons)
+        pair_points, pair_polygons = pair_points[inside], pair_polygons[inside]
+
+        # Smallest containing polygon first for every point
+        order = np.lexsort((self.areas[pair_polygons], pair_points))
+        pair_points, pair_polygons = pair_points[order], pair_polygons[order]
+        first = np.ones(len(pair_points), dtype=bool)
+        first[1:] = pair_points[1:] != pair_points[:-1]
+        result[pair_points[first]] = pair_polygons[first]
+        return result
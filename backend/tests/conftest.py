@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# Keep caches, uploads and databases out of the source tree. Modules read
+# these at import, so they are set before any test imports the backend.
+_scratch = tempfile.mkdtemp(prefix="boq-tests-")
+os.environ.setdefault("CACHE_DIR", os.path.join(_scratch, "cache"))
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_scratch, "uploads"))
+os.environ.setdefault("JOBS_DB", os.path.join(_scratch, "jobs.sqlite3"))
+os.environ.setdefault("OUTBOX_DB", os.path.join(_scratch, "outbox.sqlite3"))
+os.environ.setdefault("PROFILE_DIR", os.path.join(_scratch, "profiles"))
+
+# The backend is a flat set of modules, imported the way main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
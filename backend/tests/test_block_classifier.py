@@ -0,0 +1,29 @@
+import metrics
+from block_classifier import DEFAULT_PATTERNS, OTHER, BlockClassifier, count_key
+
+
+def test_priority_and_fallback():
+    classifier = BlockClassifier(DEFAULT_PATTERNS)
+    assert classifier.classify("DOOR-900") == "door"
+    assert classifier.classify("Window_1200") == "window"
+    assert classifier.classify("OFFICE-CHAIR") == "furniture"
+    # Both door ("dr") and furniture ("desk") match: door is listed first
+    assert classifier.classify("DESK-DRAWER") == "door"
+    assert classifier.classify("NORTH-ARROW") == OTHER
+    assert count_key(OTHER) == "other_block_count"
+
+
+def test_counts_reach_metrics():
+    classifier = BlockClassifier({"door": ["door"], "window": ["win"]})
+    with metrics.capture() as captured:
+        classifier.classify("DOOR-1", copies=3)
+        classifier.classify("DOOR-1")
+        classifier.classify("WIN-2")
+        classifier.classify("LOGO")
+
+    counters = {(name, labels): value for (name, labels), value in captured.counters.items()}
+    assert counters[("boq_block_classifications_total", (("category", "door"),))] == 4
+    assert counters[("boq_block_classifications_total", (("category", "window"),))] == 1
+    assert counters[("boq_block_classifications_total", (("category", OTHER),))] == 1
+    # DOOR-1 was classified by regex once, then served from the memo
+    assert counters[("boq_block_regex_evaluations_total", ())] == 3
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from cpu_pool import CPUPool, PoolBusyError, TaskTimeoutError, WorkerCrashedError
+
+
+# Task functions live at module level so spawned workers can import them
+
+def _square(x):
+    return x * x
+
+
+def _pid():
+    return os.getpid()
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _crash():
+    os._exit(1)
+
+
+def _crash_then_raise(marker):
+    # Dies the first time; its retry, in a fresh process, raises instead
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    raise ValueError("bad drawing")
+
+
+def _range_workers():
+    import parallel_parse
+    return parallel_parse._worker_budget
+
+
+@pytest.fixture
+def pool():
+    pool = CPUPool(workers=1, max_queue=0, timeout=5)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def test_inline_mode_runs_in_caller():
+    pool = CPUPool(workers=0, max_queue=0, timeout=5)
+    pool.start()
+    assert pool.run_sync(_pid) == os.getpid()
+    assert asyncio.run(pool.run(_square, 7)) == 49
+
+
+def test_runs_in_worker_process(pool):
+    assert pool.run_sync(_square, 6) == 36
+    assert asyncio.run(pool.run(_square, 8)) == 64
+    assert pool.run_sync(_pid) != os.getpid()
+
+
+def test_busy_when_all_slots_taken(pool):
+    async def scenario():
+        slow = asyncio.ensure_future(pool.run(_sleep, 0.5))
+        await asyncio.sleep(0.1)
+        with pytest.raises(PoolBusyError):
+            await pool.run(_square, 2)
+        return await slow
+
+    assert asyncio.run(scenario()) == 0.5
+
+
+def test_timeout_stops_the_task_and_frees_its_slot(pool):
+    pool.timeout = 1
+    worker = pool.run_sync(_pid)
+    started = time.monotonic()
+    with pytest.raises(TaskTimeoutError):
+        pool.run_sync(_sleep, 60)
+    assert time.monotonic() - started < 5
+
+    # The slot comes back once the old executor notices its worker is gone
+    deadline = time.monotonic() + 5
+    while pool._in_flight and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert pool._in_flight == 0
+    assert asyncio.run(pool.run(_pid)) != worker
+
+
+def test_crashed_worker_is_replaced(pool):
+    with pytest.raises(WorkerCrashedError):
+        pool.run_sync(_crash)
+    with pytest.raises(WorkerCrashedError):
+        asyncio.run(pool.run(_crash))
+    assert pool.run_sync(_square, 3) == 9
+    assert asyncio.run(pool.run(_square, 4)) == 16
+    assert pool._in_flight == 0
+
+
+def test_innocent_task_survives_a_crash():
+    pool = CPUPool(workers=2, max_queue=2, timeout=10)
+    pool.start()
+    try:
+        async def scenario():
+            innocent = asyncio.ensure_future(pool.run(_sleep, 1))
+            await asyncio.sleep(0.2)
+            with pytest.raises(WorkerCrashedError):
+                await pool.run(_crash)
+            return await innocent
+
+        assert asyncio.run(scenario()) == 1
+    finally:
+        pool.shutdown()
+
+
+def test_workers_share_the_cores_with_parallel_parsing(pool):
+    import parallel_parse
+    expected = max(1, min(parallel_parse.PARALLEL_PARSE_WORKERS, (os.cpu_count() or 1) // pool.workers))
+    assert pool.run_sync(_range_workers) == expected
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_retry_executor_is_stopped_when_the_retry_raises(pool, tmp_path, monkeypatch, mode):
+    retry_executors = []
+    new_executor = pool._new_executor
+
+    def tracked(workers=None):
+        executor = new_executor(workers)
+        if workers == 1:
+            retry_executors.append(executor)
+        return executor
+
+    monkeypatch.setattr(pool, "_new_executor", tracked)
+    marker = str(tmp_path / "crashed")
+    with pytest.raises(ValueError):
+        if mode == "sync":
+            pool.run_sync(_crash_then_raise, marker)
+        else:
+            asyncio.run(pool.run(_crash_then_raise, marker))
+
+    assert len(retry_executors) == 1
+    assert retry_executors[0]._shutdown_thread
+    assert pool.run_sync(_square, 5) == 25
+    assert pool._in_flight == 0
@@ -0,0 +1,63 @@
+import os
+import stat
+import sys
+
+import pytest
+
+import dwg_to_dxf
+
+# Stands in for ODAFileConverter: "converts" every input unless one of them
+# is corrupt, in which case the whole run fails like ODA does
+FAKE_ODA = f"""#!{sys.executable}
+import os, sys
+in_dir, out_dir = sys.argv[1], sys.argv[2]
+names = sorted(os.listdir(in_dir))
+for name in names:
+    with open(os.path.join(in_dir, name), "rb") as f:
+        if f.read().startswith(b"CORRUPT"):
+            sys.stderr.write("bad drawing")
+            sys.exit(1)
+for name in names:
+    with open(os.path.join(out_dir, name[:-4] + ".dxf"), "w") as f:
+        f.write("0\\nEOF\\n")
+"""
+
+
+@pytest.fixture
+def fake_oda(tmp_path, monkeypatch):
+    path = tmp_path / "ODAFileConverter"
+    path.write_text(FAKE_ODA)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(dwg_to_dxf, "get_oda_converter_path", lambda: str(path))
+    return path
+
+
+def _dwg(directory, name, content=b"AC1032"):
+    path = directory / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_batch_converts_every_drawing(fake_oda, tmp_path):
+    jobs = [(_dwg(tmp_path, f"{i}.dwg"), str(tmp_path / "out" / f"{i}.dxf")) for i in range(3)]
+    results = dwg_to_dxf.convert_batch(jobs)
+    assert results == [out for _, out in jobs]
+    assert all(os.path.exists(out) for out in results)
+
+
+def test_corrupt_drawing_fails_alone(fake_oda, tmp_path):
+    jobs = [
+        (_dwg(tmp_path, "a.dwg"), str(tmp_path / "a.dxf")),
+        (_dwg(tmp_path, "bad.dwg", b"CORRUPT"), str(tmp_path / "bad.dxf")),
+        (_dwg(tmp_path, "b.dwg"), str(tmp_path / "b.dxf")),
+    ]
+    results = dwg_to_dxf.convert_batch(jobs)
+
+    assert results[0] == jobs[0][1] and results[2] == jobs[2][1]
+    assert isinstance(results[1], RuntimeError) and "bad drawing" in str(results[1])
+
+
+def test_missing_converter(monkeypatch, tmp_path):
+    monkeypatch.setattr(dwg_to_dxf, "get_oda_converter_path", lambda: None)
+    results = dwg_to_dxf.convert_batch([(_dwg(tmp_path, "a.dwg"), None)] * 2)
+    assert all(isinstance(result, FileNotFoundError) for result in results)
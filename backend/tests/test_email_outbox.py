@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+import email_outbox
+from email_outbox import EmailOutbox, FAILED, SENT, backoff_seconds
+
+
+class Rejected(Exception):
+    pass
+
+
+class StubSender:
+    """Fails with the queued exceptions first, then returns message ids."""
+
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, access_token, recipient, boq_data):
+        with self._lock:
+            self.calls.append((access_token, recipient, boq_data))
+            if self.failures:
+                raise self.failures.pop(0)
+            return f"msg-{len(self.calls)}"
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(email_outbox, "OUTBOX_BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(email_outbox, "OUTBOX_MAX_BACKOFF_SECONDS", 0.05)
+
+
+def _outbox(tmp_path, sender, max_attempts=4):
+    outbox = EmailOutbox(
+        str(tmp_path / "outbox.sqlite3"), sender, workers=1, max_attempts=max_attempts,
+        permanent_errors=(Rejected,),
+    )
+    outbox.start()
+    return outbox
+
+
+def _settled(outbox, email_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        email = outbox.get(email_id)
+        if email["status"] in (SENT, FAILED):
+            return email
+        time.sleep(0.01)
+    raise AssertionError(f"email still {email['status']}")
+
+
+BOQ = [{"component": "Brick", "quantity": 1.0}]
+
+
+def test_backoff_doubles_up_to_the_cap():
+    assert [backoff_seconds(n) for n in (1, 2, 3, 4)] == [0.01, 0.02, 0.04, 0.05]
+
+
+def test_transient_failures_are_retried(tmp_path):
+    sender = StubSender(TimeoutError("timed out"), OSError("503"))
+    outbox = _outbox(tmp_path, sender)
+    queued = outbox.enqueue("token", "a@example.com", BOQ)
+    assert queued["success"] and queued["status"] == "queued"
+
+    email = _settled(outbox, queued["email_id"])
+    assert (email["status"], email["attempts"], email["message_id"]) == (SENT, 3, "msg-3")
+    assert sender.calls == [("token", "a@example.com", BOQ)] * 3
+
+
+def test_permanent_failure_is_not_retried(tmp_path):
+    sender = StubSender(Rejected("invalid recipient"))
+    outbox = _outbox(tmp_path, sender)
+    email = _settled(outbox, outbox.enqueue("token", "bad", BOQ)["email_id"])
+    assert (email["status"], email["attempts"], email["success"]) == (FAILED, 1, False)
+    assert "invalid recipient" in email["error"]
+    assert len(sender.calls) == 1
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    sender = StubSender(*[OSError("503")] * 10)
+    outbox = _outbox(tmp_path, sender, max_attempts=3)
+    email = _settled(outbox, outbox.enqueue("token", "a@example.com", BOQ)["email_id"])
+    assert (email["status"], email["attempts"]) == (FAILED, 3)
+    assert len(sender.calls) == 3
+
+
+def test_same_key_is_sent_once(tmp_path):
+    sender = StubSender()
+    outbox = _outbox(tmp_path, sender)
+    first = outbox.enqueue("token", "a@example.com", BOQ, idempotency_key="req-1")
+    _settled(outbox, first["email_id"])
+
+    again = outbox.enqueue("token", "a@example.com", BOQ, idempotency_key="req-1")
+    assert again["email_id"] == first["email_id"] and again["status"] == SENT
+    time.sleep(0.1)
+    assert len(sender.calls) == 1
+
+
+def test_without_a_key_every_request_sends(tmp_path):
+    # Re-sending the same report to the same person is legitimate
+    sender = StubSender()
+    outbox = _outbox(tmp_path, sender)
+    first = outbox.enqueue("token", "a@example.com", BOQ)
+    second = outbox.enqueue("token", "a@example.com", BOQ)
+    assert first["email_id"] != second["email_id"]
+    assert _settled(outbox, first["email_id"])["status"] == SENT
+    assert _settled(outbox, second["email_id"])["status"] == SENT
+    assert len(sender.calls) == 2
+
+
+def test_failed_key_is_requeued(tmp_path):
+    sender = StubSender(Rejected("token expired"))
+    outbox = _outbox(tmp_path, sender)
+    first = outbox.enqueue("old", "a@example.com", BOQ, idempotency_key="req-2")
+    assert _settled(outbox, first["email_id"])["status"] == FAILED
+
+    retry = outbox.enqueue("new", "a@example.com", BOQ, idempotency_key="req-2")
+    email = _settled(outbox, retry["email_id"])
+    assert retry["email_id"] == first["email_id"]
+    assert (email["status"], email["attempts"]) == (SENT, 1)
+    assert sender.calls[-1][0] == "new"
+
+
+def test_restart_fails_emails_whose_token_is_gone(tmp_path):
+    sender = StubSender()
+    path = str(tmp_path / "outbox.sqlite3")
+    # Never started: the email stays queued, as if the process died
+    email_id = EmailOutbox(path, sender).enqueue("token", "a@example.com", BOQ)["email_id"]
+
+    restarted = EmailOutbox(path, sender, workers=1)
+    restarted.start()
+    email = restarted.get(email_id)
+    assert email["status"] == FAILED and "restart" in email["error"]
+    assert sender.calls == []
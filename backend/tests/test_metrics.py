@@ -0,0 +1,75 @@
+import pickle
+
+import pytest
+from fastapi.testclient import TestClient
+
+import metrics
+from metrics import MetricsSink
+
+
+def test_histogram_buckets_and_render():
+    sink = MetricsSink()
+    sink.observe("boq_stage_seconds", 0.003, stage="parse")
+    sink.observe("boq_stage_seconds", 2.0, stage="parse")
+    sink.inc("boq_entities_total", 5, type="LINE")
+
+    text = sink.render()
+    assert '# TYPE boq_stage_seconds histogram' in text
+    assert 'boq_stage_seconds_bucket{stage="parse",le="0.001"} 0' in text
+    assert 'boq_stage_seconds_bucket{stage="parse",le="0.005"} 1' in text
+    assert 'boq_stage_seconds_bucket{stage="parse",le="+Inf"} 2' in text
+    assert 'boq_stage_seconds_count{stage="parse"} 2' in text
+    assert 'boq_entities_total{type="LINE"} 5' in text
+
+
+def test_captured_metrics_survive_pickling_and_merge():
+    with metrics.capture() as captured:
+        metrics.inc("boq_entities_total", 2, type="ARC")
+        metrics.record_handlers({"ARC": [2, 0.01]})
+    total = MetricsSink()
+    total.inc("boq_entities_total", 1, type="ARC")
+    total.merge(pickle.loads(pickle.dumps(captured)))
+
+    assert total.counters[("boq_entities_total", (("type", "ARC"),))] == 5
+    assert total.histograms[("boq_handler_seconds", (("type", "ARC"),))][-1] == pytest.approx(0.01)
+
+
+def test_http_metrics_cover_rejected_uploads():
+    import main
+
+    client = TestClient(main.app)
+    too_large = str(main.UPLOAD_MAX_BYTES * 2)
+    response = client.post("/process", content=b"", headers={"content-length": too_large})
+    assert response.status_code == 413
+
+    text = client.get("/metrics").text
+    assert 'boq_http_request_seconds_count{method="POST",route="unmatched",status="413"}' in text
+    client.get("/rate-sets")
+    assert 'route="/rate-sets",status="200"' in client.get("/metrics").text
+
+
+def _handler_metrics(captured, kind):
+    labels = (("type", kind),)
+    histogram = captured.histograms.get(("boq_handler_seconds", labels))
+    return captured.counters.get(("boq_entities_total", labels), 0), sum(histogram[:-1]) if histogram else 0
+
+
+def test_block_definitions_are_not_recorded_as_parses():
+    import ezdxf
+    from cad_parser import parse_modelspace
+
+    doc = ezdxf.new()
+    block = doc.blocks.new("DESK")
+    for i in range(4):
+        block.add_line((0, i), (1, i))
+    msp = doc.modelspace()
+    msp.add_line((0, 0), (5, 0))
+    for i in range(3):
+        msp.add_blockref("DESK", (10 * i, 0))
+
+    with metrics.capture() as captured:
+        result = parse_modelspace(msp, block_source=doc.blocks)
+    assert result["total_line_length"] == pytest.approx(5 + 3 * 4)
+    # One modelspace LINE and three INSERTs, each observed once for the parse
+    assert _handler_metrics(captured, "LINE") == (1, 1)
+    assert _handler_metrics(captured, "INSERT") == (3, 1)
@@ -0,0 +1,103 @@
+import random
+
+import ezdxf
+import pytest
+
+import metrics
+import parallel_parse
+from cad_parser import parse_dxf
+
+
+def _drawing():
+    random.seed(7)
+    doc = ezdxf.new("R2018")
+    msp = doc.modelspace()
+    door = doc.blocks.new("DOOR-900")
+    door.add_line((0, 0), (0.9, 0))
+    door.add_arc((0, 0), 0.9, 0, 90)
+    door.add_attdef("TAG", (0, 0))
+    fixture = doc.blocks.new("FIXTURE")
+    fixture.add_circle((0, 0), 0.1)
+    fixture.add_blockref("DOOR-900", (0, 0))
+
+    # Rooms, with walls drawn as pairs of faces
+    for x0 in (0, 12):
+        msp.add_lwpolyline([(x0, 0), (x0 + 10, 0), (x0 + 10, 8), (x0, 8)], close=True, dxfattribs={"layer": "ROOM"})
+        msp.add_line((x0, -0.2), (x0 + 10, -0.2), dxfattribs={"layer": "WALL"})
+        msp.add_line((x0, 0), (x0 + 10, 0), dxfattribs={"layer": "WALL"})
+    for i in range(1500):
+        x, y = random.uniform(0, 22), random.uniform(0, 8)
+        layer = random.choice(["WALL", "ELEC", "DIM"])
+        k = i % 10
+        if k < 5:
+            msp.add_line((x, y), (x + random.uniform(-2, 2), y + random.uniform(-2, 2)),
+                         dxfattribs={"layer": layer, "color": random.randint(1, 7)})
+        elif k == 5:
+            msp.add_circle((x, y), random.uniform(0.1, 1))
+        elif k == 6:
+            msp.add_arc((x, y), random.uniform(0.1, 1), random.uniform(0, 360), random.uniform(0, 360))
+        elif k == 7:
+            ref = msp.add_blockref(random.choice(["DOOR-900", "FIXTURE", "CHAIR-1"]), (x, y))
+            if ref.dxf.name == "DOOR-900":
+                ref.add_auto_attribs({"TAG": f"D{i}"})
+        elif k == 8:
+            msp.add_polyline2d([(x, y), (x + 1, y), (x + 1, y + 1)], close=True, dxfattribs={"layer": layer})
+        else:
+            hatch = msp.add_hatch()
+            hatch.paths.add_polyline_path([(x, y), (x + 1, y), (x + 1, y + 1)], is_closed=True)
+    msp.add_line((1, 1), (5, 1))
+    msp.add_line((1, 1), (5, 1))
+    msp.add_spline([(0, 0), (1, 2), (3, 1), (4, 4)])
+    msp.add_ellipse((5, 5), (2, 0), 0.5)
+    return doc
+
+
+@pytest.fixture(scope="module")
+def drawings(tmp_path_factory):
+    root = tmp_path_factory.mktemp("parity")
+    doc = _drawing()
+    ascii_path, binary_path = str(root / "plan.dxf"), str(root / "plan-bin.dxf")
+    doc.saveas(ascii_path)
+    doc.saveas(binary_path, fmt="bin")
+    return ascii_path, binary_path
+
+
+def _parse(path, **kwargs):
+    result = parse_dxf(path, include_lines=True, rooms=True, **kwargs)
+    result["lines"] = result["lines"].to_json()
+    return result
+
+
+@pytest.fixture(scope="module")
+def full(drawings):
+    return _parse(drawings[0], streaming=False, parallel=False)
+
+
+def test_drawing_is_measured(full):
+    assert full["door_count"] > 0 and full["wall_count"] > 0
+    assert full["hatch_area"] > 0 and full["rooms"]
+
+
+def test_streaming_matches_full_load(drawings, full):
+    assert _parse(drawings[0], streaming=True, parallel=False) == full
+
+
+def test_binary_matches_ascii(drawings, full):
+    assert _parse(drawings[1], parallel=False) == full
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_matches_serial(drawings, full, monkeypatch, workers):
+    # Small ranges, so the test drawing is cut across many of them
+    monkeypatch.setattr(parallel_parse, "MIN_CHUNK_BYTES", 1024)
+    monkeypatch.setattr(parallel_parse, "_worker_budget", workers)
+    assert len(parallel_parse.entity_ranges(drawings[0], workers * parallel_parse.CHUNKS_PER_WORKER)) > 1
+    with metrics.capture() as captured:
+        assert _parse(drawings[0], parallel=True) == full
+
+    # Handler timings of all ranges are recorded as one parse
+    with metrics.capture() as serial:
+        parse_dxf(drawings[0], parallel=False)
+    labels = (("type", "LINE"),)
+    assert sum(captured.histograms[("boq_handler_seconds", labels)][:-1]) == 1
+    assert captured.counters[("boq_entities_total", labels)] == serial.counters[("boq_entities_total", labels)]
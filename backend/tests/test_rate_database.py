@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+from rate_database import BUILTIN_RATE_SET, RATE_TABLE, RateStore, build_rate_table
+
+
+def _write(rates_dir, rate_set, content):
+    path = os.path.join(rates_dir, *rate_set.split("/")) + ".json"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content if isinstance(content, str) else json.dumps(content))
+    # Distinct mtimes even on coarse-grained filesystems
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def store(tmp_path):
+    _write(tmp_path, "tn/2025", {"doors": {"rate": 9000}})
+    return RateStore(str(tmp_path), BUILTIN_RATE_SET)
+
+
+def test_overrides_fall_back_to_builtin_table(store):
+    table = store.table("tn/2025")
+    assert table["doors"]["rate"] == 9000
+    assert table["doors"]["unit"] == RATE_TABLE["doors"]["unit"]
+    assert table["windows"] == RATE_TABLE["windows"]
+    assert store.table() is RATE_TABLE
+    assert store.rate_sets() == [BUILTIN_RATE_SET, "tn/2025"]
+
+
+def test_unknown_rate_set(store):
+    with pytest.raises(KeyError):
+        store.table("nowhere/1")
+
+
+def test_reload_picks_up_changes_and_deletions(store, tmp_path):
+    assert store.reload() is False
+
+    _write(tmp_path, "tn/2025", {"doors": {"rate": 9500}})
+    _write(tmp_path, "kl/2025", {})
+    assert store.reload() is True
+    assert store.table("tn/2025")["doors"]["rate"] == 9500
+    assert "kl/2025" in store.rate_sets()
+
+    os.remove(os.path.join(tmp_path, "kl", "2025.json"))
+    assert store.reload() is True
+    assert "kl/2025" not in store.rate_sets()
+
+
+@pytest.mark.parametrize("content", [
+    "{not json",
+    [{"doors": {"rate": 1}}],
+    {"doors": 9000},
+    {"doors": {"rate": "9000"}},
+    {"doors": {"rate": True}},
+    {"doors": {"rate": 1, "unit": None}},
+    {"skylights": {"rate": 4000}},
+])
+def test_malformed_file_keeps_previous_table(store, tmp_path, content):
+    _write(tmp_path, "tn/2025", content)
+    store.reload()
+    assert store.table("tn/2025")["doors"]["rate"] == 9000
+
+
+def test_malformed_file_at_startup_is_skipped(tmp_path):
+    _write(tmp_path, "tn/2025", [1, 2, 3])
+    store = RateStore(str(tmp_path), BUILTIN_RATE_SET)
+    assert store.rate_sets() == [BUILTIN_RATE_SET]
+
+
+def test_new_component_needs_a_complete_entry():
+    entry = {"component": "Skylights", "description": "Roof glazing", "unit": "nos", "rate": 4000}
+    assert build_rate_table({"skylights": entry})["skylights"] == entry
+    with pytest.raises(ValueError):
+        build_rate_table({"skylights": {**entry, "rate": float("nan")}})
@@ -0,0 +1,119 @@
+import csv
+import io
+import zipfile
+
+import pytest
+
+import report_renderer
+from report_renderer import COLUMNS, Template, grand_total, render, stream
+
+ITEMS = [
+    {"item_no": 1, "component": "Brick <Wall>", "description": "230 mm", "quantity": 12.5,
+     "unit": "m³", "rate": 6200.0, "total": 77500.0},
+    {"item_no": 2, "component": "Door", "description": "", "quantity": 3,
+     "unit": "nos", "rate": 0.0, "total": 0.0},
+]
+
+
+def _many(n):
+    return [dict(ITEMS[0], item_no=i, total=1.0) for i in range(1, n + 1)]
+
+
+def _unzip(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as workbook:
+        return {name: workbook.read(name) for name in workbook.namelist()}
+
+
+def test_template_renders_literals_and_specs():
+    out = []
+    Template("a{x:>4}b{y:,.2f}").render_into(out, {"x": 7, "y": 1234.5})
+    assert "".join(out) == "a   7b1,234.50"
+
+
+def test_template_rejects_conversions():
+    with pytest.raises(ValueError):
+        Template("{x!r}")
+
+
+def test_template_split():
+    before, after = Template("<{a}>{rows}</{a}>").split("rows")
+    head, tail = [], []
+    before.render_into(head, {"a": "t"})
+    after.render_into(tail, {"a": "t"})
+    assert ("".join(head), "".join(tail)) == ("<t>", "</t>")
+    with pytest.raises(KeyError):
+        Template("{a}").split("rows")
+
+
+def test_every_format_has_a_media_type_and_extension():
+    assert set(report_renderer.RENDERERS) == set(report_renderer.MEDIA_TYPES) == set(report_renderer.EXTENSIONS)
+
+
+def test_csv_rows_and_grand_total():
+    rows = list(csv.reader(io.StringIO(render(ITEMS, "csv"))))
+    assert tuple(rows[0]) == COLUMNS
+    assert rows[1] == ["1", "Brick <Wall>", "230 mm", "12.5", "m³", "6200.0", "77500.0"]
+    assert rows[-1][-2:] == ["Grand Total", "77500.0"]
+    assert len(rows) == len(ITEMS) + 2
+
+
+def test_csv_accepts_a_generator():
+    assert render((item for item in ITEMS), "csv") == render(ITEMS, "csv")
+
+
+def test_text_report():
+    text = render(ITEMS, "text")
+    assert "Estimated Project Cost: ₹77,500.00" in text
+    assert "Items: 2" in text
+    assert text.rstrip().endswith("₹   77,500.00")
+
+
+def test_html_escapes_and_summarises():
+    page = render(ITEMS, "html")
+    assert "Brick &lt;Wall&gt;" in page and "<Wall>" not in page
+    assert "2 line items extracted" in page
+    assert page.count("₹77,500.00") == 3  # summary card, row and footer
+    assert "—" in page  # the zero-total row
+
+
+def test_html_singular_item():
+    assert "1 line item extracted" in render(ITEMS[:1], "html")
+
+
+def test_xlsx_is_a_valid_workbook():
+    data = render(ITEMS, "xlsx")
+    with zipfile.ZipFile(io.BytesIO(data)) as workbook:
+        assert workbook.testzip() is None
+        assert "xl/workbook.xml" in workbook.namelist()
+        sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+    assert sheet.count("<row ") == len(ITEMS) + 2
+    assert "Brick &lt;Wall&gt;" in sheet
+    assert '<c s="1"><v>77500.0</v></c>' in sheet
+    assert '<c s="2" t="inlineStr"><is><t xml:space="preserve">Grand Total</t></is></c>' in sheet
+
+
+@pytest.mark.parametrize("fmt", ["html", "text", "csv", "xlsx"])
+def test_stream_matches_render_and_chunks(monkeypatch, fmt):
+    monkeypatch.setattr(report_renderer, "CHUNK_ROWS", 4)
+    items = _many(10)
+    chunks = list(stream(items, fmt))
+    assert len(chunks) > 2
+    if fmt == "xlsx":
+        # Compare contents: the member timestamps may differ between two writes
+        assert _unzip(b"".join(chunks)) == _unzip(render(items, fmt))
+    else:
+        assert "".join(chunks) == render(items, fmt)
+
+
+@pytest.mark.parametrize("fmt", ["html", "text", "csv", "xlsx"])
+def test_empty_report(fmt):
+    assert render([], fmt)
+
+
+def test_unknown_format():
+    with pytest.raises(KeyError):
+        stream(ITEMS, "pdf")
+
+
+def test_grand_total_skips_missing_totals():
+    assert grand_total([{"total": 2.5}, {}, {"total": 1}]) == 3.5
@@ -0,0 +1,148 @@
+import ezdxf
+import pytest
+
+from cad_parser import parse_dxf
+from revision_diff import diff_drawing, quantity_delta, raw_data
+
+
+def _save(doc, path):
+    doc.saveas(path)
+    return str(path)
+
+
+def _upload(doc, path):
+    doc.saveas(path)
+    return path.read_bytes()
+
+
+def _base():
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    line = msp.add_line((0, 0), (5, 0), dxfattribs={"layer": "WALL"})
+    poly = msp.add_lwpolyline([(0, 0), (2, 0), (2, 2), (0, 2)], close=True, dxfattribs={"layer": "ROOM"})
+    stub = msp.add_lwpolyline([(9, 9)], dxfattribs={"layer": "ROOM"})
+    return doc, msp, line, poly, stub
+
+
+def test_removing_a_never_contributing_entity(tmp_path):
+    doc, msp, _line, _poly, stub = _base()
+    previous, _ = diff_drawing(_save(doc, tmp_path / "a.dxf"))
+
+    msp.delete_entity(stub)
+    snapshot, stats = diff_drawing(_save(doc, tmp_path / "b.dxf"), previous)
+
+    assert stats["removed"] == 1
+    assert raw_data(snapshot)["total_line_length"] == pytest.approx(5.0)
+
+
+def _assert_matches_full_parse(snapshot, path):
+    # The whole rounded result, so a misspelt key can't pass as None == None
+    assert raw_data(snapshot) == parse_dxf(path)
+
+
+def test_add_remove_modify(tmp_path):
+    doc, msp, line, poly, _stub = _base()
+    previous, stats = diff_drawing(_save(doc, tmp_path / "a.dxf"))
+    assert stats["added"] == 2  # the one-vertex stub contributes nothing
+
+    msp.add_line((0, 1), (3, 1), dxfattribs={"layer": "WALL"})
+    line.dxf.end = (8, 0)
+    msp.delete_entity(poly)
+    path = _save(doc, tmp_path / "b.dxf")
+    snapshot, stats = diff_drawing(path, previous)
+
+    assert (stats["added"], stats["removed"], stats["modified"]) == (1, 1, 1)
+    assert stats["unchanged"] == 1
+    _assert_matches_full_parse(snapshot, path)
+    assert raw_data(snapshot)["breakdown"]["layer"]["WALL"]["total_line_length"] == pytest.approx(11.0)
+
+
+def test_unchanged_revision(tmp_path):
+    doc, *_ = _base()
+    previous, _ = diff_drawing(_save(doc, tmp_path / "a.dxf"))
+    snapshot, stats = diff_drawing(_save(doc, tmp_path / "b.dxf"), previous)
+
+    assert (stats["added"], stats["removed"], stats["modified"]) == (0, 0, 0)
+    assert raw_data(snapshot) == raw_data(previous)
+
+
+def test_entity_edited_into_a_degenerate_one_is_removed(tmp_path):
+    doc, _msp, _line, poly, _stub = _base()
+    previous, _ = diff_drawing(_save(doc, tmp_path / "a.dxf"))
+    assert raw_data(previous)["polyline_count"] == 1
+
+    poly.set_points([(0, 0)])
+    path = _save(doc, tmp_path / "b.dxf")
+    snapshot, stats = diff_drawing(path, previous)
+
+    assert stats["removed"] == 1 and stats["modified"] == 0
+    assert raw_data(snapshot)["polyline_count"] == 0
+    _assert_matches_full_parse(snapshot, path)
+    assert raw_data(snapshot)["breakdown"]["layer"].get("ROOM", {}).get("polyline_count", 0) == 0
+
+    # And back again: the restored polyline is added like a new one
+    poly.set_points([(0, 0), (2, 0), (2, 2), (0, 2)])
+    path = _save(doc, tmp_path / "c.dxf")
+    snapshot, stats = diff_drawing(path, snapshot)
+    assert raw_data(snapshot)["polyline_count"] == 1
+    _assert_matches_full_parse(snapshot, path)
+
+
+def test_quantity_delta_recurses_into_groups(tmp_path):
+    doc, msp, line, *_ = _base()
+    before = parse_dxf(_save(doc, tmp_path / "a.dxf"))
+    msp.add_line((0, 0.2), (5, 0.2), dxfattribs={"layer": "WALL"})
+    line.dxf.end = (6, 0)
+    after = parse_dxf(_save(doc, tmp_path / "b.dxf"))
+
+    delta = quantity_delta(before, after)
+    assert delta["total_line_length"] == pytest.approx(6.0)
+    assert delta["breakdown"]["layer"]["WALL"]["total_line_length"] == pytest.approx(6.0)
+    assert "ROOM" not in delta["breakdown"]["layer"]
+    assert quantity_delta(after, after) == {}
+
+
+def test_revisions_endpoint(tmp_path):
+    from fastapi.testclient import TestClient
+    import main
+
+    # Not started: the CPU pool runs tasks in the request's thread
+    client = TestClient(main.app)
+    doc, msp, line, *_ = _base()
+    first = client.post("/process", files={"file": ("a.dxf", _upload(doc, tmp_path / "a.dxf"))})
+    assert first.status_code == 200, first.text
+
+    msp.add_line((0, 0.2), (5, 0.2), dxfattribs={"layer": "WALL"})
+    line.dxf.end = (6, 0)
+    response = client.post(
+        "/revisions",
+        files={"file": ("b.dxf", _upload(doc, tmp_path / "b.dxf"))},
+        data={"previous_result_id": first.json()["result_id"]},
+    )
+    assert response.status_code == 200, response.text
+    delta = response.json()["delta"]
+    assert (delta["entities"]["added"], delta["entities"]["modified"]) == (1, 1)
+    assert delta["quantities"]["total_line_length"] == pytest.approx(6.0)
+    assert delta["quantities"]["breakdown"]["layer"]["WALL"]["total_line_length"] == pytest.approx(6.0)
+
+
+def test_sweeps_rerun_only_for_line_or_wall_segments(tmp_path):
+    doc, msp, line, poly, _stub = _base()
+    circle = msp.add_circle((20, 20), 1, dxfattribs={"layer": "ELEC"})
+    previous, _ = diff_drawing(_save(doc, tmp_path / "a.dxf"))
+
+    # A circle and a polyline off the wall layers: dedup and walls carry over
+    circle.dxf.radius = 2
+    poly.set_points([(0, 0), (3, 0), (3, 3), (0, 3)])
+    path = _save(doc, tmp_path / "b.dxf")
+    snapshot, _ = diff_drawing(path, previous)
+    assert snapshot["sweeps"] is previous["sweeps"]
+    _assert_matches_full_parse(snapshot, path)
+
+    # A wall face appears: both are redone
+    msp.add_line((0, 0.2), (5, 0.2), dxfattribs={"layer": "WALL"})
+    path = _save(doc, tmp_path / "c.dxf")
+    snapshot, _ = diff_drawing(path, snapshot)
+    assert snapshot["sweeps"] is not previous["sweeps"]
+    assert raw_data(snapshot)["wall_count"] == 1
+    _assert_matches_full_parse(snapshot, path)
@@ -0,0 +1,64 @@
+import io
+import os
+import time
+
+import pytest
+
+from result_cache import ResultCache
+from upload_ingest import DirectorySweeper, UploadTooLargeError, ingest_file
+
+
+def _file(directory, name, size, age):
+    path = os.path.join(directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    used_at = time.time() - age
+    os.utime(path, (used_at, used_at))
+    return path
+
+
+def test_ingest_file_hashes_and_limits(tmp_path):
+    upload = ingest_file(io.BytesIO(b"0\nSECTION\n" * 10), str(tmp_path), max_bytes=1000)
+    assert upload.size == 100 and upload.head.startswith(b"0\nSECTION")
+    assert os.path.getsize(upload.path) == 100
+
+    with pytest.raises(UploadTooLargeError):
+        ingest_file(io.BytesIO(b"x" * 2000), str(tmp_path), max_bytes=1000)
+    assert os.listdir(tmp_path) == [os.path.basename(upload.path)]
+
+
+def test_sweeper_expires_then_evicts_least_recently_used(tmp_path):
+    root = str(tmp_path)
+    expired = _file(root, "raw/expired.json", 10, age=1000)
+    old = _file(root, "dxf/old.dxf", 100, age=500)
+    recent = _file(root, "dxf/recent.dxf", 100, age=200)
+    in_use = _file(root, "dxf/in-use.dxf", 100, age=1)
+
+    sweeper = DirectorySweeper(root, retention_seconds=900, max_bytes=250, grace_seconds=60)
+    assert sweeper.sweep() == {"files": 2, "bytes": 110}
+    assert not os.path.exists(expired) and not os.path.exists(old)
+    assert os.path.exists(recent) and os.path.exists(in_use)
+
+
+def test_sweeper_never_touches_files_in_grace_period(tmp_path):
+    root = str(tmp_path)
+    _file(root, "a.dxf", 1000, age=1)
+    sweeper = DirectorySweeper(root, retention_seconds=0, max_bytes=0, grace_seconds=60)
+    assert sweeper.sweep() == {"files": 0, "bytes": 0}
+
+
+def test_cache_hits_count_as_recent_use(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=0, max_bytes=0, ttl_seconds=60)
+    cache.put("key", {"total_line_length": 1.0})
+    upload = tmp_path / "upload.dxf"
+    upload.write_bytes(b"0\nEOF\n")
+    dxf = cache.adopt_dxf("digest", str(upload))
+    assert not upload.exists()
+    for path in (dxf, os.path.join(tmp_path, "raw", "key.json")):
+        os.utime(path, (time.time() - 10_000, time.time() - 10_000))
+
+    assert cache.get_dxf("digest") == dxf
+    assert cache.get("key") == {"total_line_length": 1.0}
+    sweeper = DirectorySweeper(str(tmp_path), retention_seconds=1000, max_bytes=1 << 20, grace_seconds=0)
+    assert sweeper.sweep()["files"] == 0
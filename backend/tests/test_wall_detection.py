@@ -0,0 +1,96 @@
+import tracemalloc
+
+import ezdxf
+import numpy as np
+import pytest
+
+from cad_parser import parse_modelspace
+from wall_detection import detect_walls
+
+
+def _faces(pieces, thickness=0.2, length=1.0, step=1.0):
+    """Two horizontal faces `thickness` apart, each drawn as `pieces` collinear segments."""
+    x = np.arange(pieces) * step
+    lower = np.c_[x, np.zeros(pieces), x + length, np.zeros(pieces)]
+    upper = np.c_[x, np.full(pieces, thickness), x + length, np.full(pieces, thickness)]
+    return np.r_[lower, upper]
+
+
+def test_single_wall():
+    walls = detect_walls(np.array([[0, 0, 5, 0], [0, 0.2, 5, 0.2]], dtype=float))
+    assert walls["wall_count"] == 1
+    assert walls["wall_centerline_length"] == pytest.approx(5.0)
+    assert walls["wall_thickness"] == pytest.approx(0.2)
+    assert walls["walls_by_thickness"] == {"0.20": pytest.approx(5.0)}
+
+
+def test_faces_outside_thickness_range_are_not_walls():
+    too_thin = np.array([[0, 0, 5, 0], [0, 0.01, 5, 0.01]], dtype=float)
+    too_thick = np.array([[0, 0, 5, 0], [0, 2.0, 5, 2.0]], dtype=float)
+    assert detect_walls(too_thin)["wall_count"] == 0
+    assert detect_walls(too_thick)["wall_count"] == 0
+
+
+def test_opening_pairs_both_sides():
+    # Lower face continuous, upper face broken by a 1 m door opening
+    segments = np.array([[0, 0, 5, 0], [0, 0.2, 2, 0.2], [3, 0.2, 5, 0.2]], dtype=float)
+    walls = detect_walls(segments)
+    assert walls["wall_count"] == 2
+    assert walls["wall_centerline_length"] == pytest.approx(4.0)
+
+
+def test_duplicate_and_overlapping_faces_count_once():
+    segments = np.array(
+        [[0, 0, 5, 0], [0, 0, 5, 0], [3, 0, 8, 0], [0, 0.2, 8, 0.2], [8, 0.2, 0, 0.2]], dtype=float
+    )
+    walls = detect_walls(segments)
+    assert walls["wall_count"] == 1
+    assert walls["wall_centerline_length"] == pytest.approx(8.0)
+
+
+def test_nearest_face_wins():
+    # A wall with a third, further line (e.g. a skirting) above it
+    segments = np.array([[0, 0, 5, 0], [0, 0.2, 5, 0.2], [0, 0.5, 5, 0.5]], dtype=float)
+    walls = detect_walls(segments)
+    assert walls["wall_count"] == 1
+    assert walls["wall_thickness"] == pytest.approx(0.2)
+
+
+def test_rotated_wall():
+    angle = np.radians(30)
+    direction, normal = np.array([np.cos(angle), np.sin(angle)]), np.array([-np.sin(angle), np.cos(angle)])
+    a, b = np.zeros(2), 4 * direction
+    segments = np.array([np.r_[a, b], np.r_[a + 0.25 * normal, b + 0.25 * normal]])
+    walls = detect_walls(segments)
+    assert walls["wall_count"] == 1
+    assert walls["wall_thickness"] == pytest.approx(0.25)
+    assert walls["wall_centerline_length"] == pytest.approx(4.0)
+
+
+@pytest.mark.parametrize("length", [1.0, 0.5])
+def test_large_collinear_input_stays_linear(length):
+    # 20,000 collinear pieces per face used to build every pair in the
+    # thickness window — gigabytes, then an OOM-killed worker
+    pieces = 20_000
+    tracemalloc.start()
+    try:
+        walls = detect_walls(_faces(pieces, length=length))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert walls["wall_centerline_length"] == pytest.approx(pieces * length)
+    assert walls["wall_thickness"] == pytest.approx(0.2)
+    assert peak < 64 * 1024 * 1024
+
+
+@pytest.mark.parametrize("layer, walls", [("A-WALL", 1), ("E-CONDUIT", 0), ("DIMS", 0)])
+def test_only_wall_layers_are_swept(layer, walls):
+    # Parallel conduit runs or dimension lines are not walls
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    msp.add_line((0, 0), (5, 0), dxfattribs={"layer": layer})
+    msp.add_line((0, 0.2), (5, 0.2), dxfattribs={"layer": layer})
+    result = parse_modelspace(msp)
+    assert result["wall_count"] == walls
+    assert result["wall_volume"] == pytest.approx(walls * 5 * 0.2 * 3.0)
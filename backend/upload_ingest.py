@@ -0,0 +1,214 @@
+"""
+Upload Ingest — streams uploaded drawings to disk, hashing as they go.
+
+Uploads are never read into memory whole. Each one is copied in
+UPLOAD_CHUNK_BYTES chunks into a uniquely named file under UPLOAD_DIR,
+and the SHA-256 content hash (the result cache key) is computed from the
+same chunks. Writing and hashing run in the thread pool, so a large
+upload never blocks the event loop. The size limit is checked against
+the declared request length before the body is parsed, and again per
+chunk as the bytes arrive.
+
+Uploads that are never cleaned up by the pipeline (failed conversions,
+crashes, jobs that never ran) are reclaimed by a DirectorySweeper. It
+deletes files older than UPLOAD_RETENTION_SECONDS, then the least
+recently used ones while the directory is over UPLOAD_DIR_MAX_MB. Files
+younger than UPLOAD_GRACE_SECONDS are never touched, since they may still
+be in use. The result cache's disk tier is swept the same way.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+from cad_format import SNIFF_BYTES
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(__file__), "uploads"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "512")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+
+UPLOAD_RETENTION_SECONDS = float(os.getenv("UPLOAD_RETENTION_SECONDS", str(24 * 60 * 60)))
+UPLOAD_DIR_MAX_BYTES = int(os.getenv("UPLOAD_DIR_MAX_MB", "10240")) * 1024 * 1024
+UPLOAD_GRACE_SECONDS = float(os.getenv("UPLOAD_GRACE_SECONDS", str(15 * 60)))
+UPLOAD_SWEEP_SECONDS = float(os.getenv("UPLOAD_SWEEP_SECONDS", "300"))
+
+# Multipart boundaries and form fields on top of the file itself
+_FORM_OVERHEAD_BYTES = 64 * 1024
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds UPLOAD_MAX_BYTES."""
+
+    def __init__(self, max_bytes: int = UPLOAD_MAX_BYTES):
+        super().__init__(f"File too large. The maximum upload size is {max_bytes // (1024 * 1024)} MB.")
+
+
+def declared_too_large(content_length, max_bytes: int = UPLOAD_MAX_BYTES) -> bool:
+    """True if a request's Content-Length already rules it out, before any body is read."""
+    try:
+        return int(content_length) > max_bytes + _FORM_OVERHEAD_BYTES
+    except (TypeError, ValueError):
+        return False
+
+
+class IngestedUpload:
+    """An upload on disk: its path, SHA-256 hex digest, size and first SNIFF_BYTES."""
+
+    __slots__ = ("path", "digest", "size", "head")
+
+    def __init__(self, path: str, digest: str, size: int, head: bytes):
+        self.path = path
+        self.digest = digest
+        self.size = size
+        self.head = head
+
+    def discard(self) -> None:
+        """Delete the file, if the pipeline hasn't moved it elsewhere."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _write_chunk(f, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+async def ingest_upload(upload, directory: str = UPLOAD_DIR, max_bytes: int = UPLOAD_MAX_BYTES) -> IngestedUpload:
+    """
+    Stream an UploadFile into a unique file under directory, hashing it on the way.
+
+    Raises:
+        UploadTooLargeError: the upload is over max_bytes (nothing is left on disk)
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
+    head = b""
+
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(max_bytes)
+            if len(head) < SNIFF_BYTES:
+                head += chunk[:SNIFF_BYTES - len(head)]
+            await run_in_threadpool(_write_chunk, f, hasher, chunk)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        os.remove(path)
+        raise
+    await run_in_threadpool(f.close)
+
+    return IngestedUpload(path, hasher.hexdigest(), size, head)
+
+
+def ingest_file(src, directory: str = UPLOAD_DIR, max_bytes: int = UPLOAD_MAX_BYTES) -> IngestedUpload:
+    """
+    Blocking ingest_upload() for a file object already on the server (e.g. a
+    ZIP member). The limit applies to the bytes actually read, not to any
+    size the source declares.
+    """
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
+    head = b""
+
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                _write_chunk(f, hasher, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return IngestedUpload(path, hasher.hexdigest(), size, head)
+
+
+# ── Sweeper ──────────────────────────────────
+
+class DirectorySweeper:
+    """Deletes expired files under a directory, then least recently used ones over the size budget."""
+
+    def __init__(self, directory: str, retention_seconds: float, max_bytes: int, grace_seconds: float):
+        self.directory = directory
+        self.retention_seconds = retention_seconds
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self._thread = None
+
+    def _files(self) -> list:
+        """(last used, size, path) of every file under the directory."""
+        files = []
+        for root, _dirs, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+        return files
+
+    def sweep(self) -> dict:
+        """Run one pass. Returns how many files and bytes were removed."""
+        now = time.time()
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        removed = {"files": 0, "bytes": 0}
+
+        for used_at, size, path in files:
+            age = now - used_at
+            if age < self.grace_seconds:
+                break  # sorted oldest first: everything after is newer still
+            if age <= self.retention_seconds and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed["files"] += 1
+            removed["bytes"] += size
+        return removed
+
+    def start(self, interval: float = UPLOAD_SWEEP_SECONDS) -> None:
+        """Sweep every `interval` seconds in a daemon thread."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"[Sweeper] Sweeping {self.directory} failed: {e}")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=run, name=f"sweeper-{os.path.basename(self.directory)}", daemon=True)
+        self._thread.start()
+
+
+upload_sweeper = DirectorySweeper(UPLOAD_DIR, UPLOAD_RETENTION_SECONDS, UPLOAD_DIR_MAX_BYTES, UPLOAD_GRACE_SECONDS)
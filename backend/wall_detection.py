@@ -0,0 +1,229 @@
+"""
+Wall Detection — pairs parallel wall faces into walls.
+
+Architectural drawings show a wall as two parallel lines, so the plain
+line length counts every wall twice and says nothing about thickness.
+This stage finds the pairs:
+
+1. Segments (LINEs and polyline edges) on WALL_LAYERS are bucketed by
+   direction, modulo 180°, in WALL_ANGLE_TOLERANCE_DEG steps.
+2. Within a bucket every segment is projected onto the bucket direction:
+   an interval along it and an offset across it.
+3. Collinear segments (same bucket and offset) form a face; its
+   overlapping or touching pieces are merged, so a face is a sorted set
+   of disjoint intervals and duplicates are not counted twice.
+4. Each piece pairs with its nearest face above that is between
+   WALL_MIN_THICKNESS and WALL_MAX_THICKNESS away and overlaps it — with
+   every piece it overlaps on that face and on faces up to FACE_TOLERANCE
+   beyond it (e.g. either side of an opening, drawn slightly off).
+   Faces are found by binary search over face offsets and the overlapping
+   pieces by binary search over a face's intervals, so the work grows
+   with the number of pieces, not pairs of them; at most FACE_CANDIDATES
+   faces are tried per piece. A piece already used as an upper face does
+   not start another wall.
+
+Every kept pair is a wall run: its overlap is centerline length, its gap
+the thickness, and length x thickness x WALL_HEIGHT its volume.
+
+Defaults assume drawings in metres, like the rest of the BOQ.
+"""
+
+import fnmatch
+import math
+import os
+
+import numpy as np
+
+from spatial_index import ragged_ranges
+
+# Layer name patterns (fnmatch, comma separated) that hold wall faces.
+# Only these layers are swept, so conduit, duct and dimension pairs on
+# other layers are not priced as walls; "*" sweeps every layer and an
+# empty value turns wall detection off.
+WALL_LAYERS = [p.strip().upper() for p in os.getenv("WALL_LAYERS", "*WALL*").split(",") if p.strip()]
+WALL_MIN_THICKNESS = float(os.getenv("WALL_MIN_THICKNESS", "0.075"))
+WALL_MAX_THICKNESS = float(os.getenv("WALL_MAX_THICKNESS", "0.6"))
+WALL_HEIGHT = float(os.getenv("WALL_HEIGHT", "3.0"))
+WALL_ANGLE_TOLERANCE_DEG = float(os.getenv("WALL_ANGLE_TOLERANCE_DEG", "1.0"))
+
+# Offsets closer than this are the same line (float noise only)
+COLLINEAR_TOLERANCE = 1e-6
+# Upper faces whose offsets differ by less than this are one wall face
+FACE_TOLERANCE = 0.005
+# Faces above a piece tried, nearest first, before it is left unpaired
+FACE_CANDIDATES = 64
+
+
+def wall_layer_mask(layers: list) -> np.ndarray:
+    """Which of the given layer names may hold wall faces (see WALL_LAYERS)."""
+    return np.array(
+        [any(fnmatch.fnmatchcase(layer.upper(), p) for p in WALL_LAYERS) for layer in layers],
+        dtype=bool,
+    )
+
+
+def _project(segments: np.ndarray) -> tuple:
+    """(bucket, lo, hi, offset) per segment, in its direction bucket's frame."""
+    dx = segments[:, 2] - segments[:, 0]
+    dy = segments[:, 3] - segments[:, 1]
+    step = math.radians(WALL_ANGLE_TOLERANCE_DEG)
+    bucket_count = max(int(round(math.pi / step)), 1)
+    step = math.pi / bucket_count
+
+    angle = np.mod(np.arctan2(dy, dx), np.pi)
+    bucket = np.rint(angle / step).astype(np.int64) % bucket_count
+    phi = bucket * step
+    cos, sin = np.cos(phi), np.sin(phi)
+
+    u1 = segments[:, 0] * cos + segments[:, 1] * sin
+    u2 = segments[:, 2] * cos + segments[:, 3] * sin
+    v = ((segments[:, 1] + segments[:, 3]) * cos - (segments[:, 0] + segments[:, 2]) * sin) / 2
+    return bucket, np.minimum(u1, u2), np.maximum(u1, u2), v
+
+
+def _merge_faces(bucket, lo, hi, v) -> tuple:
+    """
+    Merge collinear pieces. Returns (bucket, lo, hi, offset, face) per
+    merged piece, sorted by bucket, offset and lo; pieces of one face
+    share its offset and never overlap.
+    """
+    order = np.lexsort((v, bucket))
+    bucket, lo, hi, v = bucket[order], lo[order], hi[order], v[order]
+    new_face = np.r_[True, (np.diff(bucket) != 0) | (np.diff(v) > COLLINEAR_TOLERANCE)]
+    face = np.cumsum(new_face) - 1
+    face_starts = np.flatnonzero(new_face)
+    face_v = np.add.reduceat(v, face_starts) / np.diff(np.r_[face_starts, len(v)])
+
+    order = np.lexsort((lo, face))
+    bucket, lo, hi, face = bucket[order], lo[order], hi[order], face[order]
+
+    # Running max of hi within each face. Ranks make it exact: face * n
+    # dominates the key, so the max never carries over from the face before.
+    n = len(hi)
+    sorted_hi = np.sort(hi)
+    key = np.maximum.accumulate(face * n + np.searchsorted(sorted_hi, hi))
+    reach = sorted_hi[key - face * n]
+
+    starts = np.flatnonzero(np.r_[True, (face[1:] != face[:-1]) | (lo[1:] > reach[:-1])])
+    face = face[starts]
+    return bucket[starts], lo[starts], np.maximum.reduceat(hi, starts), face_v[face], face
+
+
+def _face_pairs(bucket, lo, hi, v, face) -> tuple:
+    """
+    Pairs (lower, upper) of merged pieces: each piece with the pieces it
+    overlaps on its nearest overlapping face above (and faces within
+    FACE_TOLERANCE of that one), sorted by lower.
+    """
+    n = len(lo)
+    face_starts = np.flatnonzero(np.r_[True, face[1:] != face[:-1]])
+    face_v, face_bucket = v[face_starts], bucket[face_starts]
+
+    # Per face, the range of faces above it within [min, max] thickness
+    first_face = np.empty(len(face_starts), dtype=np.int64)
+    end_face = np.empty(len(face_starts), dtype=np.int64)
+    boundaries = np.flatnonzero(np.diff(face_bucket)) + 1
+    for start, stop in zip(np.r_[0, boundaries], np.r_[boundaries, len(face_v)]):
+        run = face_v[start:stop]
+        first_face[start:stop] = start + np.searchsorted(run, run + WALL_MIN_THICKNESS, side="left")
+        end_face[start:stop] = start + np.searchsorted(run, run + WALL_MAX_THICKNESS, side="right")
+
+    # Interval ends as ranks among all of them, keyed by face: a face's
+    # pieces are disjoint and sorted, so both keys increase monotonically.
+    ends = np.sort(np.r_[lo, hi])
+    lo_rank, hi_rank = np.searchsorted(ends, lo), np.searchsorted(ends, hi)
+    stride = len(ends) + 1
+    lo_key, hi_key = face * stride + lo_rank, face * stride + hi_rank
+
+    lowers, uppers = [], []
+    pending = np.arange(n)
+    target = first_face[face]
+    # Furthest offset still on the nearest face, once one is found
+    limit = np.full(n, np.inf)
+    for _ in range(FACE_CANDIDATES):
+        live = target < end_face[face[pending]]
+        live[live] = face_v[target[live]] <= limit[live]
+        pending, target, limit = pending[live], target[live], limit[live]
+        if len(pending) == 0:
+            break
+        # Pieces q of the target face with hi_q > lo_p and lo_q < hi_p
+        first = np.searchsorted(hi_key, target * stride + lo_rank[pending], side="right")
+        stop = np.searchsorted(lo_key, target * stride + hi_rank[pending], side="left")
+        found = stop > first
+        counts = stop[found] - first[found]
+        lowers.append(np.repeat(pending[found], counts))
+        uppers.append(ragged_ranges(first[found], counts))
+        limit = np.where(found & np.isinf(limit), face_v[target] + FACE_TOLERANCE, limit)
+        target = target + 1
+
+    if not lowers:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    lower, upper = np.concatenate(lowers), np.concatenate(uppers)
+    order = np.lexsort((upper, lower))
+    return lower[order], upper[order]
+
+
+def detect_walls(segments: np.ndarray) -> dict:
+    """
+    Find walls among (n, 4) x1, y1, x2, y2 segments.
+
+    Returns:
+        dict with wall_count (paired runs), wall_centerline_length,
+        wall_thickness (length-weighted mean), wall_volume and
+        walls_by_thickness ({thickness: centerline length})
+    """
+    result = {"wall_count": 0, "wall_centerline_length": 0.0, "wall_thickness": 0.0,
+              "wall_volume": 0.0, "walls_by_thickness": {}}
+    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    segments = segments[lengths > 0]
+    if len(segments) < 2:
+        return result
+
+    bucket, lo, hi, v, face = _merge_faces(*_project(segments))
+    lower, upper = _face_pairs(bucket, lo, hi, v, face)
+    if len(lower) == 0:
+        return result
+    gap = v[upper] - v[lower]
+    overlap = np.minimum(hi[lower], hi[upper]) - np.maximum(lo[lower], lo[upper])
+
+    # Greedy over lower pieces in sweep order: a piece that is already
+    # some wall's upper face doesn't start a wall of its own.
+    accepted = np.zeros(len(lower), dtype=bool)
+    used_as_upper = np.zeros(len(v), dtype=bool)
+    starts = np.flatnonzero(np.r_[True, lower[1:] != lower[:-1]])
+    stops = np.r_[starts[1:], len(lower)]
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        if used_as_upper[lower[start]]:
+            continue
+        accepted[start:stop] = True
+        used_as_upper[upper[start:stop]] = True
+
+    gap, overlap = gap[accepted], overlap[accepted]
+    length = float(overlap.sum())
+    # Grouped to the centimetre: drawn thicknesses are rarely exact
+    by_thickness = {}
+    for thickness, run in zip(np.round(gap, 2).tolist(), overlap.tolist()):
+        key = f"{thickness:.2f}"
+        by_thickness[key] = by_thickness.get(key, 0.0) + run
+
+    result.update({
+        "wall_count": int(len(gap)),
+        "wall_centerline_length": length,
+        "wall_thickness": float((gap * overlap).sum() / length),
+        "wall_volume": float((gap * overlap).sum() * WALL_HEIGHT),
+        "walls_by_thickness": dict(sorted(by_thickness.items())),
+    })
+    return result
+
+
+def round_walls(walls: dict) -> dict:
+    """Round a detect_walls() result for output."""
+    return {
+        "wall_count": walls["wall_count"],
+        "wall_centerline_length": round(walls["wall_centerline_length"], 2),
+        "wall_thickness": round(walls["wall_thickness"], 3),
+        "wall_volume": round(walls["wall_volume"], 2),
+        "walls_by_thickness": {
+            k: round(v, 2) for k, v in walls["walls_by_thickness"].items() if round(v, 2)
+        },
+    }